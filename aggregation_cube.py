@@ -0,0 +1,362 @@
+"""
+Dense sensor x day x hour aggregation cube in memory-mapped files
+For every metric the cube directory holds count / sum / min / max arrays
+with one cell per (UTC day, sensor, hour of day), as raw binary files
+mapped with numpy.memmap:
+
+    cube.json                    days, capacities, file generation, last id
+    sensors.json                 sensor id of each sensor index
+    {metric}_{stat}.{gen}.bin    (day capacity, sensor capacity, 24) array
+
+Days are the outer axis, so a new day only extends the files (capacity
+grows by DAY_BLOCK days at a time) and cells are updated in place. New
+sensors beyond the capacity, or readings older than the first day, write
+a new generation of the files; readers that still map the previous one
+are unaffected.
+
+Hour-of-day, day-of-week and calendar heatmaps are reductions of slices
+(weekdays are every 7th day), with no grouping of readings. refresh()
+folds readings added since the last processed sensor_data id, kept in
+cube.json with the arrays it describes; a refresh interrupted while
+writing leaves the cube marked dirty and the next one rebuilds it.
+"""
+
+import json
+import math
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+import db
+import rollups
+
+METRICS = rollups.METRICS
+
+CUBE_DIR = os.environ.get('CUBE_DIR', 'cube')
+CHUNK_ROWS = 200000
+VERSION = 1
+HOURS = 24
+
+STATS = {'count': np.uint32, 'sum': np.float64, 'min': np.float32, 'max': np.float32}
+
+# Days added to the files when they are full, and the initial sensor capacity
+DAY_BLOCK = 32
+MIN_SENSOR_CAPACITY = 64
+
+VIEWS = ('hour', 'weekday', 'calendar')
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+_DATA_SUFFIX = '.bin'
+
+
+def _data_path(path, generation, metric, stat):
+    return os.path.join(path, f'{metric}_{stat}.{generation}{_DATA_SUFFIX}')
+
+
+def _read_json(path, name):
+    try:
+        with open(os.path.join(path, name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, name, data):
+    tmp_path = os.path.join(path, f'{name}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, os.path.join(path, name))
+
+
+def _round_up(days):
+    return -(-days // DAY_BLOCK) * DAY_BLOCK
+
+
+class Cube:
+    """A cube directory mapped as (day, sensor, hour) arrays"""
+
+    def __init__(self, path, meta, sensors, writable=False):
+        self.path = path
+        self.meta = meta
+        self.sensors = sensors
+        self.slots = {sensor_id: slot for slot, sensor_id in enumerate(sensors)}
+        shape = (meta['day_capacity'], meta['sensor_capacity'], HOURS)
+        self.arrays = {(metric, stat): np.memmap(_data_path(path, meta['generation'], metric, stat),
+                                                 dtype=dtype, mode='r+' if writable else 'r',
+                                                 shape=shape)
+                       for metric in METRICS for stat, dtype in STATS.items()}
+
+    @property
+    def first_day(self):
+        """Epoch day (days since 1970-01-01 UTC) of day index 0"""
+        return self.meta['first_day']
+
+    @property
+    def days(self):
+        return self.meta['days']
+
+    def view(self, metric, stat):
+        """(days, sensors, 24) array of one statistic"""
+        return self.arrays[(metric, stat)][:self.days, :len(self.sensors)]
+
+    def add(self, slots, days, hours, values):
+        """Fold readings into their cells; days are day indexes"""
+        cells = (days * self.meta['sensor_capacity'] + slots) * HOURS + hours
+        for metric in METRICS:
+            x = values[metric]
+            present = ~np.isnan(x)
+            if not present.any():
+                continue
+            unique, inverse = np.unique(cells[present], return_inverse=True)
+            x = x[present]
+            low = np.full(len(unique), np.inf)
+            high = np.full(len(unique), -np.inf)
+            np.minimum.at(low, inverse, x)
+            np.maximum.at(high, inverse, x)
+
+            count, total, minimum, maximum = (self.arrays[(metric, stat)].reshape(-1) for stat in STATS)
+            previous = count[unique]
+            empty = previous == 0
+            count[unique] = previous + np.bincount(inverse, minlength=len(unique))
+            total[unique] += np.bincount(inverse, weights=x, minlength=len(unique))
+            minimum[unique] = np.where(empty, low, np.minimum(minimum[unique], low))
+            maximum[unique] = np.where(empty, high, np.maximum(maximum[unique], high))
+
+    def flush(self):
+        for array in self.arrays.values():
+            array.flush()
+
+    def select(self, metric, start=None, end=None, sensors=None):
+        """Cells of one metric over [start, end) epoch seconds, whole days.
+
+        Returns ({stat: (days, sensors, 24) array}, epoch day of the first row).
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+        first = 0 if start is None else int(start // 86400) - self.first_day
+        last = self.days if end is None else math.ceil(end / 86400) - self.first_day
+        first = min(max(first, 0), self.days)
+        last = min(max(last, first), self.days)
+        columns = slice(None)
+        if sensors:
+            columns = [self.slots[sensor_id] for sensor_id in sensors if sensor_id in self.slots]
+        cells = {stat: self.view(metric, stat)[first:last][:, columns] for stat in STATS}
+        return cells, self.first_day + first
+
+    def hour_of_day(self, metric, **selection):
+        """{stat: (24,) array}"""
+        cells, _ = self.select(metric, **selection)
+        return _combine(cells, (0, 1))
+
+    def day_of_week(self, metric, **selection):
+        """{stat: (7, 24) array}, Monday first"""
+        cells, first_day = self.select(metric, **selection)
+        # 1970-01-01 was a Thursday
+        first_weekday = (first_day + 3) % 7
+        rows = [_combine({stat: array[(weekday - first_weekday) % 7::7] for stat, array in cells.items()},
+                         (0, 1))
+                for weekday in range(7)]
+        return {stat: np.stack([row[stat] for row in rows]) for stat in rows[0]}
+
+    def calendar(self, metric, **selection):
+        """({stat: (days, 24) array}, list of dates)"""
+        cells, first_day = self.select(metric, **selection)
+        epoch = date(1970, 1, 1)
+        days = [epoch + timedelta(days=first_day + i) for i in range(len(cells['count']))]
+        return _combine(cells, 1), days
+
+
+def _combine(cells, axes):
+    """count, mean, min and max of cells reduced over axes (NaN when empty)"""
+    empty = cells['count'] == 0
+    count = cells['count'].sum(axis=axes, dtype=np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = cells['sum'].sum(axis=axes) / count
+    minimum = np.where(empty, np.inf, cells['min']).min(axis=axes, initial=np.inf)
+    maximum = np.where(empty, -np.inf, cells['max']).max(axis=axes, initial=-np.inf)
+    return {'count': count, 'mean': mean,
+            'min': np.where(count > 0, minimum, np.nan), 'max': np.where(count > 0, maximum, np.nan)}
+
+
+def open_cube(path=CUBE_DIR):
+    """The cube mapped read-only, or None when it has not been built"""
+    meta = _read_json(path, 'cube.json')
+    if meta is None or meta.get('version') != VERSION or not meta['day_capacity']:
+        return None
+    sensors = _read_json(path, 'sensors.json') or []
+    return Cube(path, meta, sensors[:meta['sensors']])
+
+
+def _remove_files(path, keep_generation=None):
+    """Delete cube files (data files of other generations with keep_generation)"""
+    for name in os.listdir(path):
+        if name.endswith(_DATA_SUFFIX):
+            if keep_generation is not None and name.endswith(f'.{keep_generation}{_DATA_SUFFIX}'):
+                continue
+        elif keep_generation is not None or name not in ('cube.json', 'sensors.json'):
+            continue
+        os.remove(os.path.join(path, name))
+
+
+def _make_room(path, meta, sensor_count, first_day, last_day):
+    """meta of files with room for sensor_count sensors and epoch days up to last_day"""
+    if meta['day_capacity'] and first_day >= meta['first_day'] and sensor_count <= meta['sensor_capacity']:
+        days = last_day - meta['first_day'] + 1
+        if days > meta['day_capacity']:
+            # Days are the outer axis: growing the files keeps every cell in place
+            capacity = _round_up(days + DAY_BLOCK - 1)
+            for metric in METRICS:
+                for stat, dtype in STATS.items():
+                    os.truncate(_data_path(path, meta['generation'], metric, stat),
+                                capacity * meta['sensor_capacity'] * HOURS * np.dtype(dtype).itemsize)
+            meta['day_capacity'] = capacity
+        meta['days'] = max(meta['days'], days)
+        return meta
+
+    # New generation: more sensor columns and/or earlier days
+    new = dict(meta)
+    new['generation'] = meta['generation'] + 1
+    new['first_day'] = min(first_day, meta['first_day']) if meta['day_capacity'] else first_day
+    offset = meta['first_day'] - new['first_day'] if meta['day_capacity'] else 0
+    new['days'] = max(last_day - new['first_day'] + 1, offset + meta['days'])
+    new['day_capacity'] = _round_up(new['days'] + DAY_BLOCK - 1)
+    capacity = max(meta['sensor_capacity'], MIN_SENSOR_CAPACITY)
+    while capacity < sensor_count:
+        capacity *= 2
+    new['sensor_capacity'] = capacity
+    shape = (new['day_capacity'], capacity, HOURS)
+    for metric in METRICS:
+        for stat, dtype in STATS.items():
+            array = np.memmap(_data_path(path, new['generation'], metric, stat), dtype=dtype,
+                              mode='w+', shape=shape)
+            if meta['days']:
+                old = np.memmap(_data_path(path, meta['generation'], metric, stat), dtype=dtype,
+                                mode='r', shape=(meta['day_capacity'], meta['sensor_capacity'], HOURS))
+                array[offset:offset + meta['days'], :meta['sensor_capacity']] = old[:meta['days']]
+                del old
+            array.flush()
+            del array
+    return new
+
+
+def refresh(conn=None, path=CUBE_DIR, chunk_rows=CHUNK_ROWS):
+    """Fold readings added since the last refresh into the cube.
+
+    Returns the number of new sensor_data ids processed.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = db.connect()
+    try:
+        # The write lock serializes refreshers, as for the rollups
+        conn.execute("BEGIN IMMEDIATE")
+        os.makedirs(path, exist_ok=True)
+        meta = _read_json(path, 'cube.json')
+        if meta is not None and (meta.get('dirty') or meta.get('version') != VERSION):
+            print(f"Aggregation cube in {path} is incomplete or outdated, rebuilding")
+            _remove_files(path)
+            meta = None
+        if meta is None:
+            meta = {'version': VERSION, 'generation': 0, 'first_day': 0, 'days': 0,
+                    'day_capacity': 0, 'sensor_capacity': 0, 'sensors': 0, 'last_id': 0}
+        last_id = meta['last_id']
+        max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+        if max_id <= last_id:
+            conn.rollback()
+            return 0
+
+        sensors = (_read_json(path, 'sensors.json') or [])[:meta['sensors']]
+        slots = {sensor_id: slot for slot, sensor_id in enumerate(sensors)}
+        meta['dirty'] = True
+        _write_json(path, 'cube.json', meta)
+        generation = meta['generation']
+        cube = mapped = None
+
+        cursor = conn.execute(f'''
+            SELECT COALESCE(sensor_id, ''), ({rollups.EPOCH_SQL}) / 3600, {', '.join(METRICS)}
+            FROM sensor_data
+            WHERE id > ? AND id <= ?
+        ''', (last_id, max_id))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            # Readings without a usable timestamp have no cell
+            rows = [row for row in rows if row[1] is not None]
+            if not rows:
+                continue
+            sensor_ids, hours, *metric_values = zip(*rows)
+            for sensor_id in sensor_ids:
+                if sensor_id not in slots:
+                    slots[sensor_id] = len(sensors)
+                    sensors.append(sensor_id)
+            hours = np.array(hours, dtype=np.int64)
+            days = hours // HOURS
+
+            meta = _make_room(path, meta, len(sensors), int(days.min()), int(days.max()))
+            meta['sensors'] = len(sensors)
+            # Remap when the files were extended or replaced
+            layout = (meta['generation'], meta['day_capacity'])
+            if cube is None or mapped != layout:
+                if cube is not None:
+                    cube.flush()
+                cube = Cube(path, meta, sensors, writable=True)
+                mapped = layout
+            cube.meta = meta
+            cube.add(np.array([slots[sensor_id] for sensor_id in sensor_ids], dtype=np.int64),
+                     days - meta['first_day'], hours % HOURS,
+                     {metric: np.array(column, dtype=np.float64)
+                      for metric, column in zip(METRICS, metric_values)})
+
+        if cube is not None:
+            cube.flush()
+        _write_json(path, 'sensors.json', sensors)
+        meta.update(sensors=len(sensors), last_id=max_id, dirty=False)
+        _write_json(path, 'cube.json', meta)
+        if meta['generation'] != generation:
+            _remove_files(path, keep_generation=meta['generation'])
+        conn.commit()
+        return max_id - last_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def ensure_fresh(path=CUBE_DIR):
+    """Refresh the cube if sensor_data has grown since the last refresh"""
+    meta = _read_json(path, 'cube.json') or {}
+    max_id = db.get_connection().execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+    if max_id > meta.get('last_id', 0) or meta.get('dirty'):
+        refresh(path=path)
+
+
+def _listed(array):
+    """JSON-friendly nested lists, NaN as None"""
+    return np.where(np.isnan(array), None, array.astype(object)).tolist()
+
+
+def query_heatmap(view='weekday', metric='temperature', start=None, end=None, sensors=None,
+                  path=CUBE_DIR):
+    """Heatmap of one metric: rows (None, weekdays or dates) x 24 hours"""
+    if view not in VIEWS:
+        raise ValueError(f"view must be one of {', '.join(VIEWS)}")
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    cube = open_cube(path)
+    if cube is None:
+        stats, rows = {'count': np.zeros(HOURS, dtype=np.int64)}, None
+        stats.update({stat: np.full(HOURS, np.nan) for stat in ('mean', 'min', 'max')})
+    elif view == 'hour':
+        stats, rows = cube.hour_of_day(metric, start=start, end=end, sensors=sensors), None
+    elif view == 'weekday':
+        stats, rows = cube.day_of_week(metric, start=start, end=end, sensors=sensors), WEEKDAYS
+    else:
+        stats, days = cube.calendar(metric, start=start, end=end, sensors=sensors)
+        rows = [day.isoformat() for day in days]
+    result = {'rows': rows, 'count': stats['count'].tolist()}
+    result.update({stat: _listed(stats[stat].astype(np.float64)) for stat in ('mean', 'min', 'max')})
+    return result
@@ -1,73 +1,537 @@
+import argparse
+import math
+import os
 import sqlite3
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import aggregation_cube
+import anomaly_detector
+import data_cache
+import db
+import data_loader
+import quantile_sketch
+import running_stats
+import sensor_alignment
 
-def analyze_data():
-    conn = sqlite3.connect('database.db')
-    
-    # Get data with sensor information
-    query = '''
-    SELECT sd.*, s.sensor_type, s.latitude, s.longitude, s.description
-    FROM sensor_data sd
-    LEFT JOIN sensors s ON sd.sensor_id = s.sensor_id
-    '''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-
-    if df.empty:
-        print("No data found.")
-        return
-
-    # Convert timestamp to datetime
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+METRICS = ['temperature', 'humidity']
+
+# Default memory budget of --chunked, and a measured upper bound of the
+# peak bytes per row of one chunk (row tuples, typed frame, group keys)
+CHUNK_MEMORY_MB = 256
+CHUNK_BYTES_PER_ROW = 600
+
+OVERALL_STATS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+QUARTILES = {'25%': 0.25, '50%': 0.5, '75%': 0.75}
+# Quantiles of the --incremental sketch section (irrigation thresholds)
+SKETCH_QUANTILES = [0.05, 0.5, 0.95]
+
+# Columns of the anomalies section, in anomaly_detector's order of checks
+ANOMALY_KINDS = ['out_of_range', 'spike', 'stuck', 'drift']
+
+# Sensors per indexed query of a --parallel task (SQLite parameter limit)
+SENSORS_PER_QUERY = 500
+# --parallel tasks per worker, so that unequal batches still balance
+BATCHES_PER_WORKER = 4
+
+def round_stats(stats):
+    """Round to 2 decimals; float32 readings give float32 means and
+    maxima, which print with spurious digits unless widened first"""
+    return stats.astype({column: 'float64' for column, dtype in stats.dtypes.items()
+                         if dtype == 'float32'}).round(2)
+
+def _scan_anomalies(frame, detector, counts):
+    """Score readings (in id order) with detector; counts anomalies by (sensor, kind).
+
+    Each sensor is scored against its own readings only, so sensors can be
+    scanned in any grouping as long as each one's readings come in order.
+    """
+    sensor_ids = frame['sensor_id'].astype(object).fillna('').to_numpy()
+    values = {metric: frame[metric].to_numpy(dtype=np.float64) for metric in METRICS}
+    for anomaly in detector.score(sensor_ids, values):
+        key = (anomaly['sensor_id'], anomaly['kind'])
+        counts[key] = counts.get(key, 0) + 1
+
+def _anomaly_frame(counts):
+    """Anomalies per sensor (rows) and kind (columns), sensors with any only"""
+    import pandas as pd
+
+    # Readings without a sensor id are left out, as in the other sections
+    sensors = sorted({sensor_id for sensor_id, _ in counts if sensor_id})
+    return pd.DataFrame({kind: [counts.get((sensor_id, kind), 0) for sensor_id in sensors]
+                         for kind in ANOMALY_KINDS},
+                        index=pd.Index(sensors, name='sensor_id'), dtype='int64')
+
+def compute_report(df, anomalies=False):
+    """All report sections, computed from the full readings frame;
+    anomalies adds the anomaly scan section"""
+    report = {}
+    if anomalies:
+        counts = {}
+        _scan_anomalies(df, anomaly_detector.AnomalyDetector(), counts)
+        report['anomalies'] = _anomaly_frame(counts)
+    # float32 readings are accumulated in float64, as the running aggregates do
+    df = df.astype({metric: 'float64' for metric in METRICS})
 
     # Overall statistics
-    print("=== OVERALL STATISTICS ===")
-    print(df[['temperature', 'humidity']].describe())
+    report['overall'] = df[METRICS].describe()
 
     # Statistics by sensor ID
-    print("\n=== STATISTICS BY SENSOR ===")
-    grouped = df.groupby('sensor_id')[['temperature', 'humidity']]
-    print(grouped.agg(['mean', 'min', 'max', 'std']).round(2))
+    grouped = df.groupby('sensor_id', observed=True)[METRICS]
+    report['by_sensor'] = grouped.agg(['mean', 'min', 'max', 'std']).pipe(round_stats)
 
     # Statistics by sensor type
-    print("\n=== STATISTICS BY SENSOR TYPE ===")
     if 'sensor_type' in df.columns:
-        type_grouped = df.groupby('sensor_type')[['temperature', 'humidity']]
-        stats_by_type = type_grouped.agg(['count', 'mean', 'min', 'max', 'std']).round(2)
-        print(stats_by_type)
-    
+        type_grouped = df.groupby('sensor_type', observed=True)[METRICS]
+        report['by_type'] = type_grouped.agg(['count', 'mean', 'min', 'max', 'std']).pipe(round_stats)
+
     # Statistics by location (if available)
-    print("\n=== STATISTICS BY LOCATION ===")
     if 'latitude' in df.columns and 'longitude' in df.columns:
         df['location'] = df['latitude'].astype(str) + ',' + df['longitude'].astype(str)
-        location_grouped = df.groupby('location')[['temperature', 'humidity']]
-        location_stats = location_grouped.agg(['count', 'mean', 'min', 'max']).round(2)
-        print(location_stats)
+        location_grouped = df.groupby('location')[METRICS]
+        report['by_location'] = location_grouped.agg(['count', 'mean', 'min', 'max']).pipe(round_stats)
+
+    # Statistics by zone (readings carry their zone since upgrade_db_level4)
+    if 'zone_id' in df.columns:
+        zone_grouped = df.groupby('zone_id', observed=True)[METRICS]
+        report['by_zone'] = zone_grouped.agg(['count', 'mean', 'min', 'max', 'std']).pipe(round_stats)
 
     # Statistics by hour
-    print("\n=== STATISTICS BY HOUR ===")
     df['hour'] = df['timestamp'].dt.hour
-    grouped_hour = df.groupby('hour')[['temperature', 'humidity']]
-    hourly_stats = grouped_hour.agg(['mean', 'min', 'max']).round(2)
-    print(hourly_stats)
+    grouped_hour = df.groupby('hour')[METRICS]
+    report['by_hour'] = grouped_hour.agg(['mean', 'min', 'max']).pipe(round_stats)
 
-    # Temperature vs Humidity sensors comparison
-    print("\n=== SENSOR TYPE COMPARISON ===")
+    # Temperature vs Humidity sensors comparison: (count, mean) or (readings, means)
     if 'sensor_type' in df.columns:
         temp_sensors = df[df['sensor_type'] == 'temperature']['temperature'].dropna()
         humid_sensors = df[df['sensor_type'] == 'humidity']['humidity'].dropna()
         combined_sensors = df[df['sensor_type'] == 'combined']
-        
-        if not temp_sensors.empty:
-            print(f"Temperature-only sensors: {len(temp_sensors)} readings, avg: {temp_sensors.mean():.2f}°C")
-        if not humid_sensors.empty:
-            print(f"Humidity-only sensors: {len(humid_sensors)} readings, avg: {humid_sensors.mean():.2f}%")
-        if not combined_sensors.empty:
-            print(f"Combined sensors: {len(combined_sensors)} readings")
-            if not combined_sensors['temperature'].dropna().empty:
-                print(f"  - Avg temperature: {combined_sensors['temperature'].mean():.2f}°C")
-            if not combined_sensors['humidity'].dropna().empty:
-                print(f"  - Avg humidity: {combined_sensors['humidity'].mean():.2f}%")
+        report['comparison'] = {
+            'temperature': (len(temp_sensors), temp_sensors.mean()),
+            'humidity': (len(humid_sensors), humid_sensors.mean()),
+            'combined': (len(combined_sensors),
+                         *(combined_sensors[metric].mean() if not combined_sensors[metric].dropna().empty
+                           else None for metric in METRICS)),
+        }
+    return report
+
+def _stats_frame(groups, stats, index_name):
+    """Grouped statistics frame shaped like groupby(...).agg(stats)"""
+    import pandas as pd
+
+    keys = sorted(groups)
+    columns = {}
+    for metric in METRICS:
+        for stat in stats:
+            values = [groups[key].metrics[metric].summary()[stat] for key in keys]
+            columns[(metric, stat)] = values if stat == 'count' else \
+                [math.nan if value is None else value for value in values]
+    return pd.DataFrame(columns, index=pd.Index(keys, name=index_name))
+
+def _partition_report(conn, partitions, quartiles=None, zones=None):
+    """Report sections merged from running_stats partitions.
+
+    quartiles gives the overall section's {metric: {'25%': ...}}; without it
+    the section has no quartiles. zones ({zone_id: Partition}) adds the
+    per-zone section.
+    """
+    import pandas as pd
+
+    total = running_stats.combine(partitions)
+    if not total.readings:
+        return None
+    sensors = data_loader.load_sensors(conn)
+    types = {sensor_id: sensor_type for sensor_id, sensor_type in sensors['sensor_type'].items()
+             if isinstance(sensor_type, str)}
+    # Same strings as latitude.astype(str) + ',' + longitude.astype(str);
+    # sensors without a position are left out there (NaN), so here too
+    positions = {sensor_id: f"{latitude},{longitude}" for sensor_id, latitude, longitude in
+                 zip(sensors.index, sensors['latitude'].astype('float64'),
+                     sensors['longitude'].astype('float64'))
+                 if not (math.isnan(latitude) or math.isnan(longitude))}
+
+    report = {}
+    overall = [stat for stat in OVERALL_STATS if quartiles is not None or stat not in QUARTILES]
+    summaries = {metric: {**total.metrics[metric].summary(), **(quartiles or {}).get(metric, {})}
+                 for metric in METRICS}
+    report['overall'] = pd.DataFrame(
+        {metric: [math.nan if summaries[metric].get(stat) is None else float(summaries[metric][stat])
+                  for stat in overall] for metric in METRICS},
+        index=overall)
+
+    by_sensor = running_stats.combine(partitions, lambda sensor_id, hour: sensor_id or None)
+    report['by_sensor'] = _stats_frame(by_sensor, ['mean', 'min', 'max', 'std'], 'sensor_id').round(2)
+
+    by_type = running_stats.combine(partitions, lambda sensor_id, hour: types.get(sensor_id))
+    report['by_type'] = _stats_frame(by_type, ['count', 'mean', 'min', 'max', 'std'], 'sensor_type').round(2)
+
+    by_location = running_stats.combine(partitions, lambda sensor_id, hour: positions.get(sensor_id))
+    report['by_location'] = _stats_frame(by_location, ['count', 'mean', 'min', 'max'], 'location').round(2)
+
+    if zones is not None:
+        report['by_zone'] = _stats_frame(zones, ['count', 'mean', 'min', 'max', 'std'], 'zone_id').round(2)
+
+    by_hour = running_stats.combine(partitions, lambda sensor_id, hour:
+                                    None if hour == running_stats.NO_HOUR else hour)
+    report['by_hour'] = _stats_frame(by_hour, ['mean', 'min', 'max'], 'hour').round(2)
+
+    temp_sensors = by_type.get('temperature', running_stats.Partition()).metrics['temperature']
+    humid_sensors = by_type.get('humidity', running_stats.Partition()).metrics['humidity']
+    combined_sensors = by_type.get('combined', running_stats.Partition())
+    report['comparison'] = {
+        'temperature': (temp_sensors.count, temp_sensors.mean),
+        'humidity': (humid_sensors.count, humid_sensors.mean),
+        'combined': (combined_sensors.readings,
+                     *(combined_sensors.metrics[metric].summary()['mean'] for metric in METRICS)),
+    }
+    return report
+
+def _sketch_quantiles(conn, group_by):
+    """p5 / p50 / p95 of each metric per group, from the quantile sketches"""
+    import pandas as pd
+
+    columns = {}
+    for metric in METRICS:
+        for key, sketch in quantile_sketch.query_sketches(group_by, metric, conn=conn).items():
+            if key is None:
+                # Readings without a zone (or sensor id), as groupby leaves them out
+                continue
+            for q in SKETCH_QUANTILES:
+                columns.setdefault((metric, f"p{q * 100:g}"), {})[key] = sketch.quantile(q)
+    frame = pd.DataFrame(columns).sort_index().round(2)
+    frame.index.name = f"{group_by}_id"
+    return frame
+
+def _cube_hours(cube):
+    """Statistics by hour of day, sliced from the aggregation cube"""
+    import pandas as pd
+
+    profiles = {metric: cube.hour_of_day(metric) for metric in METRICS}
+    hours = np.flatnonzero(sum(profiles[metric]['count'] for metric in METRICS))
+    return pd.DataFrame({(metric, stat): profiles[metric][stat][hours].astype(np.float64)
+                         for metric in METRICS for stat in ('mean', 'min', 'max')},
+                        index=pd.Index(hours, name='hour')).round(2)
+
+def _stored_anomalies(conn):
+    """Anomalies section from the table the anomaly detector service fills"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'anomalies'").fetchone():
+        return None
+    counts = {(sensor_id, kind): count for sensor_id, kind, count in conn.execute(
+        "SELECT sensor_id, kind, COUNT(*) FROM anomalies GROUP BY sensor_id, kind")}
+    return _anomaly_frame(counts)
+
+def compute_running_report(conn, anomalies=False):
+    """Report sections merged from the persisted running aggregates.
+
+    Folds the readings added since the last run first. The overall
+    quartiles and the per-zone quantiles come from the quantile sketches,
+    within quantile_sketch.RELATIVE_ACCURACY of the exact values; the
+    hourly profile comes from the aggregation cube.
+    """
+    running_stats.refresh(conn)
+    quantile_sketch.refresh(conn)
+    aggregation_cube.refresh(conn)
+    quartiles = {}
+    for metric in METRICS:
+        sketch = quantile_sketch.query_sketches('all', metric, conn=conn).get('')
+        if sketch is not None:
+            quartiles[metric] = {name: sketch.quantile(q) for name, q in QUARTILES.items()}
+    report = _partition_report(conn, running_stats.load(conn), quartiles)
+    if report is not None:
+        zones = conn.execute("SELECT 1 FROM quantile_sketches WHERE zone_id != '' LIMIT 1").fetchone()
+        report['quantiles'] = _sketch_quantiles(conn, 'zone' if zones else 'sensor')
+        cube = aggregation_cube.open_cube()
+        if cube is not None:
+            report['by_hour'] = _cube_hours(cube)
+        report['approximate'] = quantile_sketch.RELATIVE_ACCURACY
+        if anomalies:
+            report['anomalies'] = _stored_anomalies(conn)
+    return report
+
+def _lerp(below, above, fraction):
+    # numpy's linear interpolation, as used by describe() percentiles
+    if fraction >= 0.5:
+        return above - (above - below) * (1 - fraction)
+    return below + (above - below) * fraction
+
+def _exact_quartiles(conn, metric, count, max_id, chunk_rows):
+    """Quartiles of one metric from a single sorted pass, chunk by chunk.
+
+    SQLite sorts out of core (temporary files); only the values at the
+    interpolation positions are kept.
+    """
+    if not count:
+        return {}
+    positions = {}
+    for name, q in QUARTILES.items():
+        index = (count - 1) * q
+        below = math.floor(index)
+        positions[name] = (below, min(below + 1, count - 1), index - below)
+    wanted = {position for below, above, _ in positions.values() for position in (below, above)}
+
+    values = {}
+    cursor = conn.execute(f'''
+        SELECT {metric} FROM sensor_data
+        WHERE {metric} IS NOT NULL AND id <= ?
+        ORDER BY {metric}
+    ''', (max_id,))
+    offset = 0
+    while len(values) < len(wanted):
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        for position in wanted:
+            if offset <= position < offset + len(rows):
+                # Same float32 rounding as the values the in-memory report sees
+                values[position] = float(np.float32(rows[position - offset][0]))
+        offset += len(rows)
+    cursor.close()
+    return {name: _lerp(values[below], values[above], fraction)
+            for name, (below, above, fraction) in positions.items()}
+
+def _chunk_rows(memory_mb):
+    return max(1000, int(memory_mb * 1024 * 1024 / CHUNK_BYTES_PER_ROW))
+
+def _has_zones(conn):
+    return any(row[1] == 'zone_id' for row in conn.execute("PRAGMA table_info(sensor_data)"))
+
+def _reduce(frame, partitions, zones, detector=None, anomalies=None):
+    """Fold a readings frame into the partitions and per-zone aggregates,
+    and into the anomaly counts when given a detector"""
+    running_stats.merge_into(partitions, running_stats.aggregate(frame))
+    if 'zone_id' in frame.columns:
+        running_stats.merge_into(zones, running_stats.aggregate_by(frame, 'zone_id'))
+    if detector is not None:
+        _scan_anomalies(frame, detector, anomalies)
+
+def compute_chunked_report(conn, memory_mb=CHUNK_MEMORY_MB, anomalies=False):
+    """Report sections computed out of core within a memory budget.
+
+    sensor_data is streamed in chunks sized to memory_mb; each chunk is
+    reduced to mergeable running_stats partitions and discarded.
+    """
+    chunk_rows = _chunk_rows(memory_mb)
+    # Rows inserted while the report runs are left for the next one
+    max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+
+    partitions = {}
+    zones = {}
+    detector = anomaly_detector.AnomalyDetector() if anomalies else None
+    counts = {}
+    last_id = 0
+    while last_id < max_id:
+        frame = data_loader.load_readings(conn, last_id, chunk_rows, where='id <= ?',
+                                          params=(max_id,), limit=chunk_rows)
+        if frame.empty:
+            break
+        _reduce(frame, partitions, zones, detector, counts)
+        last_id = int(frame['id'].iloc[-1])
+        del frame
+
+    totals = running_stats.combine(partitions).metrics
+    quartiles = {metric: _exact_quartiles(conn, metric, totals[metric].count, max_id, chunk_rows)
+                 for metric in METRICS}
+    report = _partition_report(conn, partitions, quartiles, zones if _has_zones(conn) else None)
+    if report is not None and anomalies:
+        report['anomalies'] = _anomaly_frame(counts)
+    return report
+
+def _sensor_batches(conn, max_id, batches):
+    """Sensor ids (None for NULL) split into batches of similar reading counts"""
+    counts = conn.execute('''
+        SELECT sensor_id, COUNT(*) FROM sensor_data WHERE id <= ? GROUP BY sensor_id
+    ''', (max_id,)).fetchall()
+    loads = [[0, []] for _ in range(batches)]
+    # Largest sensors first, each into the currently lightest batch
+    for sensor_id, count in sorted(counts, key=lambda row: row[1], reverse=True):
+        lightest = min(loads, key=lambda load: load[0])
+        lightest[0] += count
+        lightest[1].append(sensor_id)
+    return [sensor_ids for _, sensor_ids in loads if sensor_ids]
+
+def _analyze_sensors(database, sensor_ids, max_id, anomalies=False):
+    """--parallel task: partitions and zone aggregates of some sensors'
+    readings, and with anomalies their anomaly counts"""
+    conn = db.connect(readonly=True, database=database)
+    partitions = {}
+    zones = {}
+    # Each sensor's readings are all in this task, in id order
+    detector = anomaly_detector.AnomalyDetector() if anomalies else None
+    counts = {}
+    try:
+        for start in range(0, len(sensor_ids), SENSORS_PER_QUERY):
+            batch = sensor_ids[start:start + SENSORS_PER_QUERY]
+            keys = [sensor_id for sensor_id in batch if sensor_id is not None]
+            conditions = [f"sensor_id IN ({', '.join('?' * len(keys))})"] if keys else []
+            if len(keys) < len(batch):
+                conditions.append('sensor_id IS NULL')
+            # Seeks on idx_sensor_data_sensor_id: the unary + keeps SQLite from
+            # scanning the whole table by rowid for the id bound instead
+            frame = data_loader.load_readings(conn, where=f"({' OR '.join(conditions)}) AND +id <= ?",
+                                              params=(*keys, max_id))
+            _reduce(frame, partitions, zones, detector, counts)
+    finally:
+        conn.close()
+    return partitions, zones, counts
+
+def _quartiles_task(database, metric, max_id, chunk_rows):
+    """--parallel task: exact quartiles of one metric"""
+    conn = db.connect(readonly=True, database=database)
+    try:
+        count = conn.execute(f"SELECT COUNT({metric}) FROM sensor_data WHERE id <= ?",
+                             (max_id,)).fetchone()[0]
+        return _exact_quartiles(conn, metric, count, max_id, chunk_rows)
+    finally:
+        conn.close()
+
+def compute_parallel_report(conn, database='database.db', workers=None, anomalies=False):
+    """Report sections computed on a process pool, partitioned by sensor_id.
+
+    Each task reads its own sensors' readings through the sensor_id index
+    and returns mergeable aggregates (and, with anomalies, its sensors'
+    anomaly counts); the exact quartiles run as separate tasks. The output
+    is the same as the in-memory report's.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+    batches = _sensor_batches(conn, max_id, workers * BATCHES_PER_WORKER)
+
+    partitions = {}
+    zones = {}
+    counts = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Whole-table sorts are the longest tasks: start them first
+        quartile_tasks = {metric: pool.submit(_quartiles_task, database, metric, max_id,
+                                              _chunk_rows(CHUNK_MEMORY_MB))
+                          for metric in METRICS}
+        tasks = [pool.submit(_analyze_sensors, database, batch, max_id, anomalies)
+                 for batch in batches]
+        for task in as_completed(tasks):
+            task_partitions, task_zones, task_counts = task.result()
+            running_stats.merge_into(partitions, task_partitions)
+            running_stats.merge_into(zones, task_zones)
+            # Sensors do not span tasks: no count is in two of them
+            counts.update(task_counts)
+        quartiles = {metric: task.result() for metric, task in quartile_tasks.items()}
+    report = _partition_report(conn, partitions, quartiles, zones if _has_zones(conn) else None)
+    if report is not None and anomalies:
+        report['anomalies'] = _anomaly_frame(counts)
+    return report
+
+def print_report(report):
+    print("=== OVERALL STATISTICS ===")
+    print(report['overall'])
+    if 'approximate' in report:
+        print(f"(quartiles from quantile sketches, within {report['approximate']:.1%} of the exact values)")
+
+    print("\n=== STATISTICS BY SENSOR ===")
+    print(report['by_sensor'])
+
+    print("\n=== STATISTICS BY SENSOR TYPE ===")
+    if 'by_type' in report:
+        print(report['by_type'])
+
+    print("\n=== STATISTICS BY LOCATION ===")
+    if 'by_location' in report:
+        print(report['by_location'])
+
+    if 'by_zone' in report:
+        print("\n=== STATISTICS BY ZONE ===")
+        print(report['by_zone'])
+
+    print("\n=== STATISTICS BY HOUR ===")
+    print(report['by_hour'])
+
+    if 'quantiles' in report:
+        print(f"\n=== QUANTILES BY {report['quantiles'].index.name.replace('_id', '').upper()} (approximate) ===")
+        print(report['quantiles'])
+
+    if report.get('anomalies') is not None:
+        print("\n=== ANOMALIES BY SENSOR ===")
+        if report['anomalies'].empty:
+            print("No anomalies found.")
+        else:
+            print(report['anomalies'])
+
+    print("\n=== SENSOR TYPE COMPARISON ===")
+    if 'comparison' in report:
+        temp_count, temp_mean = report['comparison']['temperature']
+        humid_count, humid_mean = report['comparison']['humidity']
+        combined_count, combined_temp, combined_humid = report['comparison']['combined']
+
+        if temp_count:
+            print(f"Temperature-only sensors: {temp_count} readings, avg: {temp_mean:.2f}°C")
+        if humid_count:
+            print(f"Humidity-only sensors: {humid_count} readings, avg: {humid_mean:.2f}%")
+        if combined_count:
+            print(f"Combined sensors: {combined_count} readings")
+            if combined_temp is not None:
+                print(f"  - Avg temperature: {combined_temp:.2f}°C")
+            if combined_humid is not None:
+                print(f"  - Avg humidity: {combined_humid:.2f}%")
+
+def print_correlations(frame, group_by='location', tolerance_s=sensor_alignment.TOLERANCE_S):
+    print(f"\n=== CO-LOCATED SENSOR CORRELATION (by {group_by}, nearest reading within {tolerance_s:g} s) ===")
+    groups = sensor_alignment.correlations(frame, group_by, tolerance_s)
+    if not groups:
+        print("No co-located sensors found.")
+    for group, (readings, matrix) in sorted(groups.items()):
+        print(f"\n{group} ({readings} readings on the reference timeline)")
+        print(matrix.round(3).to_string())
+
+def analyze_data(incremental=False, chunked=False, memory_mb=CHUNK_MEMORY_MB,
+                 parallel=False, workers=None, correlate=None,
+                 tolerance_s=sensor_alignment.TOLERANCE_S, anomalies=False):
+    conn = sqlite3.connect('database.db')
+    df = None
+
+    if incremental or chunked or parallel:
+        # Merge the running aggregates instead of rescanning every reading,
+        # stream the table when it does not fit in memory, or split it by sensor
+        if incremental:
+            report = compute_running_report(conn, anomalies)
+        elif chunked:
+            report = compute_chunked_report(conn, memory_mb, anomalies)
+        else:
+            report = compute_parallel_report(conn, 'database.db', workers, anomalies)
+        if report is not None and correlate:
+            df = data_loader.load_data(conn)
+        conn.close()
+        if report is None:
+            print("No data found.")
+            return
+    else:
+        # Get data with sensor information (typed, timestamps already parsed)
+        df = data_cache.get_data(conn)
+        conn.close()
+
+        if df.empty:
+            print("No data found.")
+            return
+        report = compute_report(df, anomalies)
+
+    print_report(report)
+    if correlate:
+        print_correlations(df, correlate, tolerance_s)
 
 if __name__ == "__main__":
-    analyze_data()
+    parser = argparse.ArgumentParser(description="Sensor data statistics")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--incremental', action='store_true',
+                      help='use the persisted running aggregates and quantile sketches (quartiles within 0.5%%)')
+    mode.add_argument('--chunked', action='store_true',
+                      help='stream the table in chunks instead of loading it (same output)')
+    mode.add_argument('--parallel', action='store_true',
+                      help='partition the readings by sensor over a process pool (same output)')
+    parser.add_argument('--memory-mb', type=float, default=CHUNK_MEMORY_MB,
+                        help=f'memory budget of --chunked (default {CHUNK_MEMORY_MB})')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes of --parallel (default: CPU count)')
+    parser.add_argument('--correlate', nargs='?', const='location', choices=sensor_alignment.GROUP_BY,
+                        help='also correlate co-located sensors aligned on time (default: by location)')
+    parser.add_argument('--tolerance', type=float, default=sensor_alignment.TOLERANCE_S,
+                        help=f'seconds between aligned readings (default {sensor_alignment.TOLERANCE_S})')
+    parser.add_argument('--anomalies', action='store_true',
+                        help='also count anomalies per sensor (--incremental: from the anomalies table)')
+    args = parser.parse_args()
+    analyze_data(args.incremental, args.chunked, args.memory_mb, args.parallel, args.workers,
+                 args.correlate, args.tolerance, args.anomalies)
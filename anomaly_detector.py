@@ -0,0 +1,489 @@
+"""
+Streaming anomaly detection on sensor readings
+Every reading is scored against its sensor's recent history, kept in NumPy
+arrays indexed by sensor slot (a few hundred bytes per sensor and metric):
+
+    out_of_range   outside the DHT22 measuring range (never folded in)
+    spike          more than SPIKE_SCORE deviations away from the rolling
+                   median of the last WINDOW readings; the deviation is the
+                   larger of the window's MAD and the long-run noise (below)
+    stuck          the same value STUCK_READINGS times in a row
+    drift          a fast EWMA (alpha FAST_ALPHA) more than DRIFT_SCORE
+                   noise standard deviations away from a slow EWMA (alpha
+                   SLOW_ALPHA); the noise variance is the slow EWMA of the
+                   squared errors of the fast one. Reported once per episode
+
+A batch is scored with array operations over all of its sensors at once.
+Readings of the same sensor within a batch are split into rounds (its
+first reading in round 0, the second in round 1, ...) so that each one
+still sees the state left by the previous one.
+
+refresh() scores the readings added since the last processed sensor_data
+id (tracked in rollup_state like the rollups), stores what it finds in
+the anomalies table and publishes each anomaly on MQTT_ANOMALY_TOPIC.
+
+The state lives in the memory of one process, so scoring runs as its own
+service next to the MQTT subscribers:
+
+    python anomaly_detector.py [--db database.db] [--interval 2]
+
+It takes an exclusive lock next to ANOMALY_STATE_PATH (a second instance
+exits), scores the backlog stored while it was not running without
+publishing it, then scores the new readings every ANOMALY_INTERVAL_SECONDS,
+one transaction per batch. The state is saved to ANOMALY_STATE_PATH at
+most every ANOMALY_SAVE_SECONDS and on exit so a restart does not have to
+warm up again; readings scored after the last save are missing from the
+restored history.
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+
+import db
+import rollups
+from mqtt_publisher import LazyPublisher, PublishQueueFull
+
+METRICS = rollups.METRICS
+
+MQTT_BROKER = "broker.mqttdashboard.com"
+MQTT_ANOMALY_TOPIC = "sensor-anomalies"
+
+STATE_NAME = 'anomalies'
+CHUNK_ROWS = 50000
+
+STATE_PATH = os.environ.get('ANOMALY_STATE_PATH', 'anomaly_state.npz')
+SAVE_INTERVAL = float(os.environ.get('ANOMALY_SAVE_SECONDS', 60))
+INTERVAL = float(os.environ.get('ANOMALY_INTERVAL_SECONDS', 2))
+
+# DHT22 measuring range and accuracy; deviations smaller than the accuracy
+# are never scored as anomalies, however flat the recent readings were
+VALID_RANGE = {'temperature': (-40.0, 80.0), 'humidity': (0.0, 100.0)}
+MIN_SCALE = {'temperature': 0.5, 'humidity': 2.0}
+
+WINDOW = 9
+MIN_WINDOW = 5
+SPIKE_SCORE = float(os.environ.get('ANOMALY_SPIKE_SCORE', 6))
+STUCK_READINGS = int(os.environ.get('ANOMALY_STUCK_READINGS', 60))
+FAST_ALPHA = 0.2
+SLOW_ALPHA = 0.01
+DRIFT_WARMUP = 100
+# Readings folded in before the noise estimate is trusted to score spikes
+SPIKE_WARMUP = 20
+DRIFT_SCORE = float(os.environ.get('ANOMALY_DRIFT_SCORE', 4))
+
+# MAD of a normal distribution times this is its standard deviation
+_MAD_TO_STD = 1.4826
+
+# Per metric state: (field, dtype, initial value); window is (sensors, WINDOW)
+_FIELDS = (
+    ('seen', np.int64, 0),          # readings written to the window
+    ('count', np.int64, 0),         # readings folded into the EWMAs
+    ('fast', np.float64, 0.0),
+    ('slow', np.float64, 0.0),
+    ('noise_var', np.float64, 0.0),
+    ('last', np.float32, np.nan),
+    ('run', np.int32, 0),           # consecutive readings equal to last
+    ('drifting', np.bool_, False),
+    ('window', np.float32, np.nan),
+)
+
+
+class _MetricState:
+    """Arrays of one metric's state, indexed by sensor slot"""
+
+    def __init__(self, capacity):
+        for field, dtype, initial in _FIELDS:
+            shape = (capacity, WINDOW) if field == 'window' else capacity
+            setattr(self, field, np.full(shape, initial, dtype=dtype))
+
+    def grow(self, capacity):
+        for field, dtype, initial in _FIELDS:
+            old = getattr(self, field)
+            new = np.full((capacity,) + old.shape[1:], initial, dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, field, new)
+
+
+def _row_medians(rows, full):
+    """Median of each row; rows that are not full hold NaN padding"""
+    medians = np.empty(len(rows))
+    medians[full] = np.median(rows[full], axis=1)
+    if not full.all():
+        medians[~full] = np.nanmedian(rows[~full], axis=1)
+    return medians
+
+
+def _noise_std(state, slots):
+    """Long-run noise standard deviation of the sensors in slots.
+
+    noise_var is an EWMA started at 0 with the second reading; dividing by
+    the weight it has accumulated since removes that start's pull to 0.
+    """
+    weight = 1 - (1 - SLOW_ALPHA) ** np.maximum(state.count[slots] - 1, 1)
+    return np.sqrt(state.noise_var[slots] / weight)
+
+
+class AnomalyDetector:
+    """Per-sensor streaming state and vectorized scoring of readings"""
+
+    def __init__(self, capacity=1024):
+        self.slots = {}
+        self.sensor_ids = []
+        self.capacity = capacity
+        self.state = {metric: _MetricState(capacity) for metric in METRICS}
+
+    def slots_of(self, sensor_ids):
+        """Slot of each sensor id, allocating slots for new sensors"""
+        slots = self.slots
+        result = np.fromiter((slots.get(sensor_id, -1) for sensor_id in sensor_ids),
+                             dtype=np.int64, count=len(sensor_ids))
+        missing = np.flatnonzero(result < 0)
+        for i in missing:
+            sensor_id = sensor_ids[i]
+            if sensor_id not in slots:
+                slots[sensor_id] = len(self.sensor_ids)
+                self.sensor_ids.append(sensor_id)
+            result[i] = slots[sensor_id]
+        if len(self.sensor_ids) > self.capacity:
+            self.capacity = max(len(self.sensor_ids), 2 * self.capacity)
+            for state in self.state.values():
+                state.grow(self.capacity)
+        return result
+
+    def score(self, sensor_ids, values):
+        """Score a batch of readings, in arrival order, and update the state.
+
+        values maps each metric to an array of readings (NaN when missing).
+        Returns the anomalies as dicts (index = position in the batch),
+        ordered by index.
+        """
+        slots = self.slots_of(sensor_ids)
+        values = {metric: np.asarray(values[metric], dtype=np.float64) for metric in METRICS}
+        found = []
+        for rows in self._rounds(slots):
+            for metric in METRICS:
+                self._score_round(metric, rows, slots[rows], values[metric][rows], found)
+        found.sort(key=lambda anomaly: anomaly['index'])
+        for anomaly in found:
+            anomaly['sensor_id'] = sensor_ids[anomaly['index']]
+        return found
+
+    @staticmethod
+    def _rounds(slots):
+        """Row indexes split so that no sensor appears twice in a round"""
+        if not len(slots):
+            return []
+        order = np.argsort(slots, kind='stable')
+        ordered = slots[order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        if len(starts) == len(slots):
+            return [np.arange(len(slots))]
+        # Rank of each reading among its sensor's readings in this batch
+        positions = np.arange(len(slots))
+        rank = positions - np.repeat(starts, np.diff(np.r_[starts, len(slots)]))
+        by_round = order[np.argsort(rank, kind='stable')]
+        return np.split(by_round, np.cumsum(np.bincount(rank))[:-1])
+
+    def _score_round(self, metric, rows, slots, x, found):
+        state = self.state[metric]
+        present = ~np.isnan(x)
+        if not present.all():
+            rows, slots, x = rows[present], slots[present], x[present]
+        low, high = VALID_RANGE[metric]
+        invalid = (x < low) | (x > high)
+        if invalid.any():
+            limits = np.clip(x[invalid], low, high)
+            self._emit(found, rows[invalid], metric, 'out_of_range', x[invalid], limits,
+                       np.abs(x[invalid] - limits) / MIN_SCALE[metric])
+            valid = ~invalid
+            rows, slots, x = rows[valid], slots[valid], x[valid]
+        if not len(x):
+            return
+
+        # Stuck: compared as float32, the precision the state keeps
+        x32 = x.astype(np.float32)
+        run = np.where(state.last[slots] == x32, state.run[slots] + 1, 1)
+        state.run[slots] = run
+        state.last[slots] = x32
+        stuck = run == STUCK_READINGS
+        if stuck.any():
+            self._emit(found, rows[stuck], metric, 'stuck', x[stuck], x[stuck], run[stuck])
+
+        # Spike: distance to the rolling median of the window, in units of
+        # the larger of the window's MAD and the long-run noise: a MAD of
+        # WINDOW readings often comes out far below the actual spread
+        seen = state.seen[slots]
+        spike = np.zeros(len(x), dtype=bool)
+        warm = (seen >= MIN_WINDOW) & (state.count[slots] >= SPIKE_WARMUP)
+        if warm.any():
+            window = state.window[slots[warm]]
+            full = seen[warm] >= WINDOW
+            median = _row_medians(window, full)
+            mad = _row_medians(np.abs(window - median[:, None]), full)
+            scale = np.maximum(mad * _MAD_TO_STD, _noise_std(state, slots[warm]))
+            scores = np.abs(x[warm] - median) / np.maximum(scale, MIN_SCALE[metric])
+            spiked = scores > SPIKE_SCORE
+            if spiked.any():
+                spike[np.flatnonzero(warm)[spiked]] = True
+                self._emit(found, rows[warm][spiked], metric, 'spike', x[warm][spiked],
+                           median[spiked], scores[spiked])
+        # Spikes still enter the window, so a genuine level change becomes
+        # the new median after WINDOW / 2 readings
+        state.window[slots, seen % WINDOW] = x32
+        state.seen[slots] = seen + 1
+
+        # EWMAs: spikes are left out so one bad reading cannot drag them
+        if spike.any():
+            kept = ~spike
+            rows, slots, x = rows[kept], slots[kept], x[kept]
+        count = state.count[slots]
+        first = count == 0
+        error = x - state.fast[slots]
+        fast = np.where(first, x, state.fast[slots] + FAST_ALPHA * error)
+        slow = np.where(first, x, state.slow[slots] + SLOW_ALPHA * (x - state.slow[slots]))
+        noise_var = np.where(first, 0.0,
+                             state.noise_var[slots] + SLOW_ALPHA * (error * error - state.noise_var[slots]))
+        count += 1
+        state.fast[slots] = fast
+        state.slow[slots] = slow
+        state.noise_var[slots] = noise_var
+        state.count[slots] = count
+
+        # Drift: reported when an episode starts, cleared at half the score
+        scores = np.abs(fast - slow) / np.maximum(np.sqrt(noise_var), MIN_SCALE[metric])
+        drifting = state.drifting[slots]
+        started = (count >= DRIFT_WARMUP) & (scores > DRIFT_SCORE) & ~drifting
+        state.drifting[slots] = (drifting & (scores >= DRIFT_SCORE / 2)) | started
+        if started.any():
+            self._emit(found, rows[started], metric, 'drift', x[started], slow[started],
+                       scores[started])
+
+    @staticmethod
+    def _emit(found, rows, metric, kind, values, expected, scores):
+        found.extend({'index': int(row), 'metric': metric, 'kind': kind, 'value': float(value),
+                      'expected': float(expected_value), 'score': float(score)}
+                     for row, value, expected_value, score in zip(rows, values, expected, scores))
+
+    def save(self, path=STATE_PATH):
+        """Write the state to an .npz file (atomically)"""
+        arrays = {f'{metric}_{field}': getattr(self.state[metric], field)[:len(self.sensor_ids)]
+                  for metric in METRICS for field, _, _ in _FIELDS}
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, sensor_ids=np.array(self.sensor_ids, dtype=str), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        """Detector restored from save(); a fresh one if the file is missing"""
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as saved:
+            sensor_ids = saved['sensor_ids'].tolist()
+            detector = cls(max(len(sensor_ids), 1024))
+            detector.sensor_ids = sensor_ids
+            detector.slots = {sensor_id: slot for slot, sensor_id in enumerate(sensor_ids)}
+            for metric in METRICS:
+                for field, _, _ in _FIELDS:
+                    getattr(detector.state[metric], field)[:len(sensor_ids)] = saved[f'{metric}_{field}']
+        return detector
+
+
+def create_tables(cursor):
+    """Create the anomalies and state tables (idempotent)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS anomalies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reading_id INTEGER NOT NULL,
+            sensor_id TEXT,
+            timestamp DATETIME,
+            metric TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value REAL,
+            expected REAL,
+            score REAL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_sensor ON anomalies (sensor_id, id)")
+    rollups.create_rollup_tables(cursor)
+
+
+# MQTT publisher for anomaly alerts, connected lazily on first use
+publisher = LazyPublisher(MQTT_BROKER, client_id="anomaly_detector", max_queue=1000)
+
+_detector = None
+_saved_at = 0.0
+
+
+def get_detector():
+    """This process's detector, restored from STATE_PATH on first use"""
+    global _detector, _saved_at
+    if _detector is None:
+        _detector = AnomalyDetector.load()
+        _saved_at = time.monotonic()
+    return _detector
+
+
+def _publish(anomalies):
+    for i, anomaly in enumerate(anomalies):
+        try:
+            publisher.publish(MQTT_ANOMALY_TOPIC, json.dumps(anomaly))
+        except PublishQueueFull as e:
+            print(f"Anomaly publisher dropped {len(anomalies) - i} alerts: {e}")
+            return
+
+
+def _pending(conn, name=STATE_NAME):
+    """Whether sensor_data has grown since the last refresh (no write lock)"""
+    row = conn.execute('''
+        SELECT (SELECT MAX(id) FROM sensor_data),
+               (SELECT last_id FROM rollup_state WHERE name = ?)
+    ''', (name,)).fetchone()
+    return (row[0] or 0) > (row[1] or 0)
+
+
+def refresh(conn=None, detector=None, name=STATE_NAME, chunk_rows=CHUNK_ROWS, publish=True,
+            max_rows=None):
+    """Score readings added since the last refresh, at most max_rows of them.
+
+    Anomalies are stored in the anomalies table and, with publish, sent
+    on MQTT_ANOMALY_TOPIC. Returns the list of anomalies found.
+    """
+    global _saved_at
+    shared = detector is None
+    detector = get_detector() if shared else detector
+    own_conn = conn is None
+    if own_conn:
+        conn = db.connect()
+    try:
+        # Same locking as rollups.refresh: each reading is scored once
+        conn.execute("BEGIN IMMEDIATE")
+        create_tables(conn.cursor())
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE name = ?", (name,)).fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+        if max_rows and max_id - last_id > max_rows:
+            # Keeps the write lock short while a backlog is worked off
+            # (ids can have gaps, so there may be fewer rows than that)
+            row = conn.execute("SELECT id FROM sensor_data WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?",
+                               (last_id, max_rows - 1)).fetchone()
+            if row:
+                max_id = row[0]
+        if max_id <= last_id:
+            conn.rollback()
+            return []
+
+        cursor = conn.execute(f'''
+            SELECT id, COALESCE(sensor_id, ''), timestamp, {', '.join(METRICS)}
+            FROM sensor_data
+            WHERE id > ? AND id <= ?
+            ORDER BY id
+        ''', (last_id, max_id))
+        anomalies = []
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            ids, sensor_ids, timestamps, *metric_values = zip(*rows)
+            # None (missing metric) becomes NaN
+            values = {metric: np.array(column, dtype=np.float64)
+                      for metric, column in zip(METRICS, metric_values)}
+            for anomaly in detector.score(sensor_ids, values):
+                index = anomaly.pop('index')
+                anomaly['reading_id'] = ids[index]
+                anomaly['timestamp'] = timestamps[index]
+                anomalies.append(anomaly)
+
+        conn.executemany('''
+            INSERT INTO anomalies (reading_id, sensor_id, timestamp, metric, kind, value, expected, score)
+            VALUES (:reading_id, :sensor_id, :timestamp, :metric, :kind, :value, :expected, :score)
+        ''', anomalies)
+        conn.execute("INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES (?, ?)",
+                     (name, max_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+    if shared and time.monotonic() - _saved_at >= SAVE_INTERVAL:
+        detector.save()
+        _saved_at = time.monotonic()
+    if publish:
+        _publish(anomalies)
+    return anomalies
+
+
+def _lock_owner(path):
+    """Open file holding an exclusive lock on path; None if another process has it"""
+    import fcntl
+
+    lock = open(path, 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+def _catch_up(conn, publish):
+    """Score everything pending, CHUNK_ROWS readings per transaction"""
+    found = 0
+    while _pending(conn):
+        found += len(refresh(conn, publish=publish, max_rows=CHUNK_ROWS))
+    return found
+
+
+def run(database=None, interval=INTERVAL):
+    """Score new readings every interval seconds until interrupted"""
+    lock = _lock_owner(f'{STATE_PATH}.lock')
+    if lock is None:
+        print(f"Another anomaly detector owns {STATE_PATH}, exiting")
+        raise SystemExit(1)
+    # Stopped like a service (SIGTERM): still save the state on the way out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    detector = get_detector()
+    conn = db.connect(database=database)
+    try:
+        create_tables(conn.cursor())
+        conn.commit()
+        # Readings stored while no detector ran are scored but not alerted on
+        started = time.perf_counter()
+        backlog = _catch_up(conn, publish=False)
+        print(f"Anomaly detector caught up in {time.perf_counter() - started:.1f}s "
+              f"({backlog} anomalies in the backlog), scoring every {interval}s")
+        while True:
+            time.sleep(interval)
+            try:
+                _catch_up(conn, publish=True)
+            except Exception as e:
+                print(f"Anomaly detector refresh failed: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        detector.save()
+        conn.close()
+        lock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=db.DATABASE)
+    parser.add_argument('--interval', type=float, default=INTERVAL,
+                        help='seconds between two batches')
+    args = parser.parse_args()
+    run(args.db, args.interval)
+
+
+if __name__ == "__main__":
+    main()
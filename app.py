@@ -1,50 +1,98 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import sqlite3
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # Use non-GUI backend for Flask
-import matplotlib.pyplot as plt
-import io
 import base64
 import json
-import paho.mqtt.client as mqtt
+import os
 import threading
 import time
+from datetime import datetime
+import chart_renderer
+import db
+import export
+import fast_json
+import geo_index
+import init_db
+import init_irrigation_db
+import live_stream
+import profiling
+import rollups
+import singleflight
+from mqtt_publisher import LazyPublisher, PublishQueueFull
+from response_cache import ResponseCache, table_version
+from shared_cache import SharedCache
 
 app = Flask(__name__)
+shared_cache = SharedCache()
+response_cache = ResponseCache(app, shared=shared_cache)
+profiler = profiling.Profiler(app)
+
+_indexes_ready = False
 
 # MQTT Configuration for irrigation control
 MQTT_BROKER = "broker.mqttdashboard.com"
 MQTT_CONTROL_TOPIC = "irrigation-control"
 
-# Initialize MQTT client for sending irrigation commands
-mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "flask_irrigation_control")
-mqtt_client.connect(MQTT_BROKER, 1883, 60)
-mqtt_client.loop_start()
+# MQTT publisher for irrigation commands, connected lazily on first use
+control_publisher = LazyPublisher(MQTT_BROKER, client_id="flask_irrigation_control")
+
+# Concurrent identical dashboard computations run once and share the result
+data_flights = singleflight.Group('data')
+chart_flights = singleflight.Group('charts')
+
+# Legacy /api/irrigation/events pages longer than this are streamed
+STREAM_MIN_ROWS = 1000
 
 def get_data():
-    conn = sqlite3.connect('database.db')
-    query = '''
-    SELECT sd.*, s.sensor_type, s.latitude, s.longitude, s.description
-    FROM sensor_data sd
-    LEFT JOIN sensors s ON sd.sensor_id = s.sensor_id
-    '''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    if not df.empty:
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-    return df
+    # Only readings added since the previous call are read from SQLite, and
+    # concurrent requests share one refresh. data_cache (like
+    # quantile_sketch and aggregation_cube below) needs numpy, so it is
+    # imported on first use to keep app.py's own import light
+    import data_cache
+    return data_flights.do('sensor_data', data_cache.get_data)
 
 def get_sensors():
-    conn = sqlite3.connect('database.db')
-    sensors_df = pd.read_sql_query("SELECT * FROM sensors", conn)
-    conn.close()
+    # pandas (and matplotlib, in chart_renderer) load on first use so that
+    # importing app.py, e.g. for a worker restart or the API routes, stays fast
+    import pandas as pd
+    sensors_df = pd.read_sql_query("SELECT * FROM sensors", db.get_connection())
     return sensors_df
 
+def chart_spec(data, column, title, ylabel):
+    """Describe one line per sensor for the render pool"""
+    series = []
+    for sensor in data['sensor_id'].unique():
+        sensor_data = data[data['sensor_id'] == sensor]
+        series.append((sensor, sensor_data['timestamp'].to_numpy(), sensor_data[column].to_numpy()))
+    return chart_renderer.ChartSpec(title, ylabel, series)
+
+def render_plots(filtered_df, data_version, selection):
+    """Temperature and humidity charts of one selection as base64 PNGs;
+    charts missing from the cache are rendered in parallel by the render pool"""
+    plot_urls = {}
+    to_render = {}
+    for column, title, ylabel in (('temperature', 'Temperature over Time', 'Temperature (°C)'),
+                                  ('humidity', 'Humidity over Time', 'Humidity (%)')):
+        series_data = filtered_df.dropna(subset=[column])
+        if series_data.empty:
+            continue
+        cache_key = f"plot|{column}|{data_version}|{selection}"
+        plot_url = shared_cache.get(cache_key)
+        if plot_url is None:
+            to_render[column] = (cache_key, chart_spec(series_data, column, title, ylabel))
+        else:
+            plot_urls[column] = plot_url
+    
+    rendered = chart_renderer.render_many(spec for _, spec in to_render.values())
+    for (column, (cache_key, _)), plot_url in zip(to_render.items(), rendered):
+        shared_cache.set(cache_key, plot_url)
+        plot_urls[column] = plot_url
+    return plot_urls
+
 @app.route('/')
 def index():
-    df = get_data()
-    sensors_df = get_sensors()
+    with profiling.phase('db'):
+        df = get_data()
+        sensors_df = get_sensors()
     
     if df.empty:
         return render_template('index.html', 
@@ -62,71 +110,45 @@ def index():
     selected_type = request.args.get('type', 'all')
     
     # Filter data based on selection
-    filtered_df = df.copy()
-    if selected_sensors:
-        filtered_df = filtered_df[filtered_df['sensor_id'].isin(selected_sensors)]
-    if selected_type != 'all':
-        filtered_df = filtered_df[filtered_df['sensor_type'] == selected_type]
+    with profiling.phase('dataframe'):
+        filtered_df = df.copy()
+        if selected_sensors:
+            filtered_df = filtered_df[filtered_df['sensor_id'].isin(selected_sensors)]
+        if selected_type != 'all':
+            filtered_df = filtered_df[filtered_df['sensor_type'] == selected_type]
     
-    # Create plots
+    # Create plots (cached across workers until the data changes); screens
+    # refreshing together wait for one render of the same selection
     plot_urls = {}
     
     if not filtered_df.empty:
-        # Temperature plot
-        temp_data = filtered_df.dropna(subset=['temperature'])
-        if not temp_data.empty:
-            plt.figure(figsize=(12, 6))
-            for sensor in temp_data['sensor_id'].unique():
-                sensor_data = temp_data[temp_data['sensor_id'] == sensor]
-                plt.plot(sensor_data['timestamp'], sensor_data['temperature'], 
-                        label=f"{sensor}", marker='o', markersize=3)
-            plt.title('Temperature over Time')
-            plt.xlabel('Time')
-            plt.ylabel('Temperature (°C)')
-            plt.legend()
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            
-            img = io.BytesIO()
-            plt.savefig(img, format='png', dpi=100, bbox_inches='tight')
-            plt.close()
-            img.seek(0)
-            plot_urls['temperature'] = base64.b64encode(img.getvalue()).decode()
-        
-        # Humidity plot
-        humid_data = filtered_df.dropna(subset=['humidity'])
-        if not humid_data.empty:
-            plt.figure(figsize=(12, 6))
-            for sensor in humid_data['sensor_id'].unique():
-                sensor_data = humid_data[humid_data['sensor_id'] == sensor]
-                plt.plot(sensor_data['timestamp'], sensor_data['humidity'], 
-                        label=f"{sensor}", marker='o', markersize=3)
-            plt.title('Humidity over Time')
-            plt.xlabel('Time')
-            plt.ylabel('Humidity (%)')
-            plt.legend()
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            
-            img = io.BytesIO()
-            plt.savefig(img, format='png', dpi=100, bbox_inches='tight')
-            plt.close()
-            img.seek(0)
-            plot_urls['humidity'] = base64.b64encode(img.getvalue()).decode()
-
-    # Prepare sensor statistics - ensure all values are Python types
+        data_version = table_version(db.get_connection(), ('sensor_data', 'sensors'))
+        selection = f"{','.join(sorted(selected_sensors))}|{selected_type}"
+        with profiling.phase('charts'):
+            plot_urls = chart_flights.do(f"{data_version}|{selection}",
+                                         render_plots, filtered_df, data_version, selection)
+
+    # Sensor statistics from the incrementally maintained rollups
+    with profiling.phase('stats'):
+        rollups.ensure_fresh()
+        type_stats = rollups.query_stats(group_by='type', sensors=selected_sensors,
+                                         sensor_type=None if selected_type == 'all' else selected_type)
     stats_by_type = {}
-    if 'sensor_type' in filtered_df.columns:
-        for sensor_type in filtered_df['sensor_type'].dropna().unique():
-            type_data = filtered_df[filtered_df['sensor_type'] == sensor_type]
-            temp_avg = type_data['temperature'].mean()
-            humid_avg = type_data['humidity'].mean()
-            
-            stats_by_type[sensor_type] = {
-                'count': int(len(type_data)),
-                'temp_avg': float(temp_avg) if pd.notnull(temp_avg) else None,
-                'humid_avg': float(humid_avg) if pd.notnull(humid_avg) else None
-            }
+    for group in type_stats:
+        if group['key'] is None:
+            continue
+        stats_by_type[group['key']] = {
+            'count': group['count'],
+            'temp_avg': group['temperature']['mean'],
+            'humid_avg': group['humidity']['mean']
+        }
+
+    try:
+        map_bounds = geo_index.fleet_bounds()
+    except sqlite3.OperationalError as e:
+        # No sensors_rtree (ensure_indexes could not create it): default map view
+        print(f"Map bounds unavailable: {e}")
+        map_bounds = None
 
     return render_template('index.html', 
                          plot_urls=plot_urls,
@@ -135,50 +157,101 @@ def index():
                          selected_sensors=selected_sensors,
                          selected_type=selected_type,
                          stats_by_type=stats_by_type,
-                         sensors_info=sensors_df.to_dict('records') if not sensors_df.empty else [])
+                         sensors_info=sensors_df.to_dict('records') if not sensors_df.empty else [],
+                         map_bounds=map_bounds)
+
+@app.before_request
+def ensure_indexes():
+    """Create the dashboard indexes once per process, for databases set up
+    before init_db added them"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    _indexes_ready = True
+    for create_indexes in (init_db.create_indexes, init_irrigation_db.create_irrigation_indexes):
+        try:
+            conn = db.connect()
+            create_indexes(conn.cursor())
+            conn.commit()
+            conn.close()
+        except sqlite3.OperationalError as e:
+            # Read-only or locked database, or table not created yet:
+            # queries still work, just unindexed
+            print(f"Could not create indexes: {e}")
+
+def to_isoformat(timestamp):
+    """Normalize a stored timestamp (SQLite text or epoch seconds) to ISO 8601"""
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, (int, float)):
+        return datetime.fromtimestamp(timestamp).isoformat()
+    return str(timestamp).replace(' ', 'T')
 
 @app.route('/api/sensors')
+@response_cache.cached(tables=('sensors', 'sensor_data'))
 def api_sensors():
     """API endpoint to get sensor data for map"""
-    sensors_df = get_sensors()
-    df = get_data()
-    
+    conn = db.get_connection()
+
+    # One pass over sensors, one index seek per sensor for its latest reading
+    rows = conn.execute('''
+    SELECT s.sensor_id, s.sensor_type, s.latitude, s.longitude, s.description,
+           sd.temperature, sd.humidity, sd.timestamp
+    FROM sensors s
+    LEFT JOIN sensor_data sd ON sd.id = (
+        SELECT MAX(id) FROM sensor_data WHERE sensor_id = s.sensor_id
+    )
+    ''').fetchall()
+
     sensors_data = []
-    for _, sensor in sensors_df.iterrows():
-        # Get latest reading for this sensor
-        sensor_data = df[df['sensor_id'] == sensor['sensor_id']]
-        latest_temp = None
-        latest_humidity = None
-        last_seen = None
-        
-        if not sensor_data.empty:
-            latest = sensor_data.iloc[-1]
-            latest_temp = float(latest['temperature']) if pd.notnull(latest['temperature']) else None
-            latest_humidity = float(latest['humidity']) if pd.notnull(latest['humidity']) else None
-            last_seen = latest['timestamp'].isoformat() if pd.notnull(latest['timestamp']) else None
-        
+    for (sensor_id, sensor_type, latitude, longitude, description,
+         temperature, humidity, timestamp) in rows:
         sensors_data.append({
-            'sensor_id': str(sensor['sensor_id']),
-            'sensor_type': str(sensor['sensor_type']),
-            'latitude': float(sensor['latitude']) if pd.notnull(sensor['latitude']) else None,
-            'longitude': float(sensor['longitude']) if pd.notnull(sensor['longitude']) else None,
-            'description': str(sensor['description']) if pd.notnull(sensor['description']) else "",
-            'latest_temp': latest_temp,
-            'latest_humidity': latest_humidity,
-            'last_seen': last_seen
+            'sensor_id': str(sensor_id),
+            'sensor_type': str(sensor_type),
+            'latitude': float(latitude) if latitude is not None else None,
+            'longitude': float(longitude) if longitude is not None else None,
+            'description': str(description) if description is not None else "",
+            'latest_temp': float(temperature) if temperature is not None else None,
+            'latest_humidity': float(humidity) if humidity is not None else None,
+            'last_seen': to_isoformat(timestamp)
         })
-    
-    return jsonify(sensors_data)
+
+    return fast_json.response(sensors_data)
+
+@app.route('/api/sensors/geo')
+@response_cache.cached(tables=('sensors', 'sensor_data'))
+def api_sensors_geo():
+    """Sensors inside a map viewport, or grid clusters when zoomed out
+
+    Query parameters:
+        bbox  west,south,east,north in degrees (Leaflet's toBBoxString)
+        zoom  map zoom level, which sets the cluster grid size
+
+    With more than geo_index.MAX_MARKERS sensors in view the response holds
+    grid clusters with a count and mean latest humidity instead of sensors.
+    """
+    try:
+        boxes = geo_index.parse_bbox(request.args.get('bbox', '-180,-90,180,90'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    zoom = request.args.get('zoom', 0, type=int)
+
+    if geo_index.count_in_bbox(boxes) <= geo_index.MAX_MARKERS:
+        sensors = geo_index.sensors_in_bbox(boxes)
+        for sensor in sensors:
+            sensor['last_seen'] = to_isoformat(sensor['last_seen'])
+        return fast_json.response({'mode': 'sensors', 'sensors': sensors})
+
+    return fast_json.response({'mode': 'clusters', 'clusters': geo_index.clusters_in_bbox(boxes, zoom)})
 
 # Level 3: Irrigation Control Endpoints
 
 @app.route('/api/irrigation/status')
+@response_cache.cached(tables=('irrigation_settings', 'sensor_data', 'irrigation_events'))
 def irrigation_status():
     """Get irrigation status for all sensors"""
-    conn = sqlite3.connect('database.db')
-    
-    # Get current irrigation settings
-    settings_df = pd.read_sql_query("SELECT * FROM irrigation_settings", conn)
+    conn = db.get_connection()
     
     # Get latest sensor data with irrigation info
     query = '''
@@ -191,21 +264,18 @@ def irrigation_status():
         GROUP BY sensor_id
     )
     '''
-    data_df = pd.read_sql_query(query, conn)
-    
-    # Get recent irrigation events
-    events_df = pd.read_sql_query("""
-        SELECT * FROM irrigation_events 
-        ORDER BY timestamp DESC LIMIT 10
-    """, conn)
-    
-    conn.close()
-    
-    return jsonify({
-        'settings': settings_df.to_dict('records'),
-        'current_data': data_df.to_dict('records'),
-        'recent_events': events_df.to_dict('records')
-    })
+    with profiling.phase('db'):
+        status = {
+            # Current irrigation settings
+            'settings': fast_json.query(conn, "SELECT * FROM irrigation_settings"),
+            'current_data': fast_json.query(conn, query),
+            # Recent irrigation events
+            'recent_events': fast_json.query(conn, """
+                SELECT * FROM irrigation_events 
+                ORDER BY timestamp DESC LIMIT 10
+            """)
+        }
+    return fast_json.response(status)
 
 @app.route('/api/irrigation/control', methods=['POST'])
 def irrigation_control():
@@ -227,8 +297,8 @@ def irrigation_control():
         elif command == "set_mode":
             message["mode"] = data.get('mode', 'manual')
         
-        # Send MQTT command
-        mqtt_client.publish(MQTT_CONTROL_TOPIC, json.dumps(message))
+        # Queue MQTT command (delivered once the broker connection is up)
+        control_publisher.publish(MQTT_CONTROL_TOPIC, json.dumps(message))
         
         return jsonify({
             'success': True,
@@ -236,33 +306,253 @@ def irrigation_control():
             'data': message
         })
         
+    except PublishQueueFull as e:
+        return jsonify({
+            'success': False,
+            'error': f'MQTT broker unavailable: {e}'
+        }), 503
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
+def encode_cursor(timestamp, event_id):
+    """Opaque keyset cursor for the event after which the next page starts"""
+    # JSON keeps the timestamp's type: SQLite orders numbers before text
+    raw = json.dumps([timestamp, event_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    timestamp, event_id = json.loads(raw)
+    if not isinstance(event_id, int) or not isinstance(timestamp, (str, int, float)):
+        raise ValueError("malformed cursor")
+    return timestamp, event_id
+
 @app.route('/api/irrigation/events')
+@response_cache.cached(tables=('irrigation_events', 'sensors'))
 def irrigation_events():
-    """Get irrigation events history"""
-    conn = sqlite3.connect('database.db')
+    """Get irrigation events history, newest first
+
+    Keyset pagination: pass ?cursor= (empty for the first page) and follow
+    the returned ``next`` cursor; every page costs one index range scan.
+    Without ``cursor`` the legacy ?limit=&offset= mode returns a plain list.
+    """
+    conn = db.get_connection()
     
     # Get pagination parameters
     limit = request.args.get('limit', 50, type=int)
     offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')
+    
+    if cursor is not None:
+        limit = max(1, min(limit, 1000))
+        where = ''
+        params = []
+        if cursor:
+            try:
+                params = list(decode_cursor(cursor))
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            where = 'WHERE (ie.timestamp, ie.id) < (?, ?)'
+        
+        query = f'''
+        SELECT ie.*, s.sensor_type, s.description
+        FROM irrigation_events ie
+        LEFT JOIN sensors s ON ie.sensor_id = s.sensor_id
+        {where}
+        ORDER BY ie.timestamp DESC, ie.id DESC
+        LIMIT ?
+        '''
+        with profiling.phase('db'):
+            events = fast_json.query(conn, query, params + [limit])
+        
+        next_cursor = None
+        if len(events) == limit:
+            last = events[-1]
+            next_cursor = encode_cursor(last['timestamp'], last['id'])
+        return fast_json.response({'events': events, 'next': next_cursor})
     
     query = '''
     SELECT ie.*, s.sensor_type, s.description
     FROM irrigation_events ie
     LEFT JOIN sensors s ON ie.sensor_id = s.sensor_id
-    ORDER BY ie.timestamp DESC
+    ORDER BY ie.timestamp DESC, ie.id DESC
     LIMIT ? OFFSET ?
     '''
     
-    events_df = pd.read_sql_query(query, conn, params=(limit, offset))
-    conn.close()
-    
-    return jsonify(events_df.to_dict('records'))
+    if limit < 0 or limit > STREAM_MIN_ROWS:
+        # Large (or unbounded, limit=-1) pages are encoded while being read
+        return fast_json.stream_rows(conn, query, (limit, offset))
+    with profiling.phase('db'):
+        events = fast_json.query(conn, query, (limit, offset))
+    return fast_json.response(events)
+
+@app.route('/api/stats')
+@response_cache.cached(tables=('sensor_data', 'sensors'))
+def api_stats():
+    """Aggregate statistics (count, mean, min, max, std) per group
+
+    Query parameters:
+        group_by  sensor (default), type, zone or location
+        from, to  window bounds as ISO 8601 (UTC) or epoch seconds,
+                  resolved to whole hours; omit both for all-time stats
+        sensors   restrict to these sensor ids (repeatable)
+        type      restrict to one sensor type
+    """
+    try:
+        start = rollups.parse_time(request.args.get('from'))
+        end = rollups.parse_time(request.args.get('to'))
+        rollups.ensure_fresh()
+        stats = rollups.query_stats(group_by=request.args.get('group_by', 'sensor'),
+                                    start=start, end=end,
+                                    sensors=request.args.getlist('sensors'),
+                                    sensor_type=request.args.get('type'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return fast_json.response({
+        'group_by': request.args.get('group_by', 'sensor'),
+        'from': start,
+        'to': end,
+        'stats': stats
+    })
+
+@app.route('/api/quantiles')
+@response_cache.cached(tables=('sensor_data', 'sensors'))
+def api_quantiles():
+    """Approximate quantiles per group from the per-hour quantile sketches
+
+    Values are within 0.5% (relative) of the exact quantile readings.
+
+    Query parameters:
+        group_by  zone (default), sensor, type or all
+        metric    humidity (default) or temperature
+        q         quantiles in [0, 1], comma-separated (default 0.05,0.5,0.95)
+        from, to  window bounds as ISO 8601 (UTC) or epoch seconds,
+                  resolved to whole hours
+        sensors   restrict to these sensor ids (repeatable)
+    """
+    import quantile_sketch
+
+    group_by = request.args.get('group_by', 'zone')
+    metric = request.args.get('metric', 'humidity')
+    try:
+        quantiles = [float(q) for q in request.args.get('q', '0.05,0.5,0.95').split(',')]
+        start = rollups.parse_time(request.args.get('from'))
+        end = rollups.parse_time(request.args.get('to'))
+        quantile_sketch.ensure_fresh()
+        with profiling.phase('db'):
+            groups = quantile_sketch.query_quantiles(quantiles, group_by=group_by, metric=metric,
+                                                     start=start, end=end,
+                                                     sensors=request.args.getlist('sensors'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return fast_json.response({
+        'group_by': group_by,
+        'metric': metric,
+        'from': start,
+        'to': end,
+        'relative_accuracy': quantile_sketch.RELATIVE_ACCURACY,
+        'groups': groups
+    })
+
+@app.route('/api/heatmap')
+@response_cache.cached(tables=('sensor_data',))
+def api_heatmap():
+    """Hour-of-day heatmaps sliced from the sensor x day x hour aggregation cube
+
+    Query parameters:
+        view      weekday (default, 7 x 24), calendar (days x 24) or hour (24)
+        metric    temperature (default) or humidity
+        from, to  window bounds as ISO 8601 (UTC) or epoch seconds,
+                  resolved to whole UTC days
+        sensors   restrict to these sensor ids (repeatable)
+    """
+    import aggregation_cube
+
+    view = request.args.get('view', 'weekday')
+    metric = request.args.get('metric', 'temperature')
+    try:
+        start = rollups.parse_time(request.args.get('from'))
+        end = rollups.parse_time(request.args.get('to'))
+        aggregation_cube.ensure_fresh()
+        with profiling.phase('db'):
+            heatmap = aggregation_cube.query_heatmap(view, metric, start, end,
+                                                     sensors=request.args.getlist('sensors'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return fast_json.response({
+        'view': view,
+        'metric': metric,
+        'from': start,
+        'to': end,
+        **heatmap
+    })
+
+@app.route('/api/export')
+def api_export():
+    """Stream sensor readings as CSV or Parquet
+
+    Query parameters:
+        format    csv (default) or parquet (requires pyarrow)
+        from, to  time bounds as ISO 8601 (UTC) or epoch seconds
+        sensors   restrict to these sensor ids (repeatable or comma separated)
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        export.check_format(fmt)
+        start = rollups.parse_time(request.args.get('from'))
+        end = rollups.parse_time(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    sensors = [sensor for value in request.args.getlist('sensors')
+               for sensor in value.split(',') if sensor]
+
+    mimetype, extension = export.FORMATS[fmt]
+    response = Response(stream_with_context(export.stream_export(fmt, start, end, sensors)),
+                        mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="sensor_data.{extension}"'
+    # Let chunks through reverse proxies as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/debug/coalescing')
+def debug_coalescing():
+    """Single-flight counters of this worker: computations run vs. shared"""
+    if not profiler.capture_allowed():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'pid': os.getpid(), 'groups': singleflight.stats()})
+
+@app.route('/api/stream')
+def stream():
+    """Server-Sent Events stream of live readings, irrigation events and alerts
+
+    Optional filters: ?sensor=<id>&zone=<id>&type=reading|irrigation|alert
+    (each may be repeated). Reconnecting clients resume from Last-Event-ID.
+    Answers 503 when this worker already serves STREAM_MAX_CLIENTS streams.
+    """
+    # Started before taking a slot: if it raises, no slot is left taken
+    live_stream.start_mqtt_feed()
+    if not live_stream.stream_slots.acquire():
+        return jsonify({'error': 'Too many live streams on this server'}), 503, {'Retry-After': '30'}
+
+    event_filter = live_stream.EventFilter(
+        sensors=request.args.getlist('sensor'),
+        zones=request.args.getlist('zone'),
+        types=request.args.getlist('type'))
+    last_id = request.headers.get('Last-Event-ID', type=int)
+
+    response = Response(
+        stream_with_context(live_stream.stream_events(live_stream.broker, event_filter, last_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the client disconnects, even before the first event was sent
+    response.call_on_close(live_stream.stream_slots.release)
+    return response
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
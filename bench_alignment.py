@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the as-of alignment of co-located sensors
+Builds a synthetic fleet of locations, each with a temperature-only and a
+humidity-only sensor reporting every 3 to 8 seconds (as publisher.py
+does), and times:
+
+    align       sensor_alignment.combined_series (sort + searchsorted)
+    corr        sensor_alignment.correlations (align + correlation matrices)
+    merge_asof  pandas.merge_asof(direction='nearest') per location
+
+checking that align and merge_asof give the same combined series.
+
+Usage:
+    python bench_alignment.py --rows 2000000 --locations 100
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import sensor_alignment
+
+
+def fleet(rows, locations, seed=0):
+    """Readings frame with temp-only and humid-only sensors per location"""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    per_sensor = rows // (2 * locations)
+    start = np.datetime64('2024-01-01T00:00:00', 'ms').astype(np.int64)
+    frames = []
+    for location in range(locations):
+        latitude, longitude = 40 + location * 0.01, 2 + location * 0.01
+        for kind in ('temp', 'humid'):
+            times = start + np.cumsum(rng.integers(3000, 8000, per_sensor))
+            values = rng.normal(20 if kind == 'temp' else 60, 3, per_sensor)
+            frames.append(pd.DataFrame({
+                'sensor_id': f'{kind}-sensor-{location:04d}',
+                'timestamp': times.astype('datetime64[ms]'),
+                'temperature': values if kind == 'temp' else np.nan,
+                'humidity': values if kind == 'humid' else np.nan,
+                'latitude': latitude,
+                'longitude': longitude,
+            }))
+    # Interleaved in arrival order, as stored in sensor_data
+    frame = pd.concat(frames, ignore_index=True).sort_values('timestamp', kind='stable')
+    frame['sensor_id'] = frame['sensor_id'].astype('category')
+    frame[['temperature', 'humidity']] = frame[['temperature', 'humidity']].astype('float32')
+    return frame.reset_index(drop=True)
+
+
+def merge_asof(frame, tolerance_s):
+    """Reference: pandas.merge_asof of each location's two sensors"""
+    import pandas as pd
+
+    combined = {}
+    tolerance = pd.Timedelta(seconds=tolerance_s)
+    for location, readings in frame.groupby(frame['latitude'].astype(str) + ',' +
+                                            frame['longitude'].astype(str)):
+        columns = {}
+        for sensor_id, sensor in readings.groupby('sensor_id', observed=True):
+            metric = 'temperature' if sensor['humidity'].isna().all() else 'humidity'
+            columns[f'{sensor_id}.{metric}'] = sensor[['timestamp', metric]].rename(
+                columns={metric: f'{sensor_id}.{metric}'}).astype({f'{sensor_id}.{metric}': 'float64'})
+        reference = max(columns, key=lambda column: len(columns[column]))
+        merged = columns[reference]
+        for column, right in columns.items():
+            if column != reference:
+                merged = pd.merge_asof(merged, right, on='timestamp', direction='nearest',
+                                       tolerance=tolerance)
+        combined[location] = merged.set_index('timestamp')
+    return combined
+
+
+def timed(compute):
+    started = time.perf_counter()
+    result = compute()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--locations', type=int, default=100)
+    parser.add_argument('--tolerance', type=float, default=sensor_alignment.TOLERANCE_S)
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows} readings at {args.locations} locations...")
+    frame = fleet(args.rows, args.locations)
+    runs = [
+        ('align', lambda: sensor_alignment.combined_series(frame, 'location', args.tolerance)),
+        ('corr', lambda: sensor_alignment.correlations(frame, 'location', args.tolerance)),
+        ('merge_asof', lambda: merge_asof(frame, args.tolerance)),
+    ]
+
+    print(f"{'mode':<12} {'seconds':>9} {'rows/s':>14}")
+    print("=" * 37)
+    results = {}
+    for name, compute in runs:
+        elapsed, results[name] = timed(compute)
+        print(f"{name:<12} {elapsed:>9.2f} {len(frame) / elapsed:>14,.0f}")
+
+    aligned, reference = results['align'], results['merge_asof']
+    same = aligned.keys() == reference.keys() and all(
+        aligned[key].index.equals(reference[key].index) and
+        aligned[key].equals(reference[key][aligned[key].columns]) for key in aligned)
+    matched = np.mean([series.notna().all(axis=1).mean() for series in aligned.values()])
+    print(f"\nalign vs merge_asof: {'same' if same else 'DIFFERENT'}; "
+          f"{matched:.1%} of reference readings matched within {args.tolerance:g} s")
+
+
+if __name__ == "__main__":
+    main()
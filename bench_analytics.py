@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark of analyse_donnees report computation modes
+Times, on an existing database:
+
+    memory      data_loader.load_data + compute_report (one core)
+    chunked     compute_chunked_report (streamed, bounded memory)
+    parallel    compute_parallel_report with each --workers count
+
+and checks that every mode prints the same report as the in-memory one.
+cpu is the CPU time of the run including its worker processes: wall time
+can only drop below it with as many free cores as workers, so on a
+machine with fewer cores the parallel rows show the pool's overhead
+rather than its speedup.
+
+Usage:
+    python bench_analytics.py --db database.db --workers 1 2 4 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import time
+
+import analyse_donnees
+import data_loader
+
+
+def _cpu_seconds():
+    # Children are counted once reaped, i.e. after the pool shut down
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def timed(compute):
+    cpu = _cpu_seconds()
+    started = time.perf_counter()
+    report = compute()
+    elapsed = time.perf_counter() - started
+    cpu = _cpu_seconds() - cpu
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        analyse_donnees.print_report(report)
+    return elapsed, cpu, output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--memory-mb', type=float, default=analyse_donnees.CHUNK_MEMORY_MB)
+    parser.add_argument('--anomalies', action='store_true', help='include the anomaly scan')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    runs = [('memory', lambda: analyse_donnees.compute_report(data_loader.load_data(conn), args.anomalies)),
+            ('chunked', lambda: analyse_donnees.compute_chunked_report(conn, args.memory_mb, args.anomalies))]
+    runs += [(f'parallel/{workers}',
+              lambda workers=workers: analyse_donnees.compute_parallel_report(conn, args.db, workers,
+                                                                              args.anomalies))
+             for workers in args.workers]
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'mode':<12} {'seconds':>9} {'cpu':>9} {'speedup':>8}  output")
+    print("=" * 54)
+    baseline = reference = None
+    for name, compute in runs:
+        elapsed, cpu, output = timed(compute)
+        if baseline is None:
+            baseline, reference = elapsed, output
+        print(f"{name:<12} {elapsed:>9.2f} {cpu:>9.2f} {baseline / elapsed:>7.2f}x  "
+              f"{'same' if output == reference else 'DIFFERENT'}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
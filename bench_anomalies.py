@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the streaming anomaly detector
+Feeds a synthetic fleet (every sensor reports once per interval, in random
+order, with diurnal temperature and humidity noise; with --noise publisher,
+independent uniform readings like publisher.py's instead) to
+anomaly_detector.AnomalyDetector in ingest-sized batches, after injecting
+spikes, stuck sensors and drifting sensors, and reports:
+
+    readings/s     scoring throughput (--batch readings per score() call);
+                   with --sqlite, per anomaly_detector.refresh() on a
+                   temporary database instead: reading the batch back from
+                   sensor_data, scoring it and storing the anomalies in one
+                   write transaction, as the detector service does
+    needed/s       ingest rate of the fleet: --sensors / --interval
+    detected       injected faults found, healthy sensors with any alert
+    false alarms   share of the healthy readings that raised an alert
+
+Usage:
+    python bench_anomalies.py --sensors 100000 --rounds 200 --batch 1000 10000
+    python bench_anomalies.py --sensors 10000 --rounds 100 --batch 100 1000 --sqlite
+    python bench_anomalies.py --sensors 1000 --rounds 200 --noise publisher
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+import anomaly_detector
+
+
+def fleet(sensors, rounds, interval, seed=0, noise='gaussian'):
+    """Readings in arrival order, the injected faults ({kind: sensor slots})
+    and the indexes of the spiked readings"""
+    rng = np.random.default_rng(seed)
+    base_temp = rng.uniform(5, 30, sensors)
+    base_hum = rng.uniform(30, 80, sensors)
+    ids = np.array([f'sensor_{i:06d}' for i in range(sensors)], dtype=object)
+
+    slots, temps, hums = [], [], []
+    for r in range(rounds):
+        order = rng.permutation(sensors)
+        daily = np.sin(2 * np.pi * r * interval / 86400)
+        slots.append(order)
+        if noise == 'publisher':
+            # publisher.py: round(random.uniform(18, 32), 2) and (30, 80)
+            temps.append(np.round(rng.uniform(18, 32, sensors), 2))
+            hums.append(np.round(rng.uniform(30, 80, sensors), 2))
+        else:
+            # DHT22 resolution
+            temps.append(np.round(base_temp[order] + 3 * daily + rng.normal(0, 0.2, sensors), 1))
+            hums.append(np.round(base_hum[order] - 5 * daily + rng.normal(0, 1.0, sensors), 1))
+    slots, temps, hums = np.concatenate(slots), np.concatenate(temps), np.concatenate(hums)
+
+    faults = {}
+    warm = sensors * rounds // 4
+    # Spikes: 0.05% of the readings after warm-up, +-8 C
+    spikes = rng.choice(np.arange(warm, len(slots)), len(slots) // 2000, replace=False)
+    temps[spikes] += rng.choice([-8.0, 8.0], len(spikes))
+    faults['spike'] = set(slots[spikes].tolist())
+    # Stuck: 0.1% of the sensors repeat one value in the second half
+    stuck = rng.choice(sensors, max(sensors // 1000, 1), replace=False)
+    late = np.flatnonzero(np.isin(slots, stuck) & (np.arange(len(slots)) >= len(slots) // 2))
+    hums[late] = 55.0
+    faults['stuck'] = set(stuck.tolist())
+    # Drift: another 0.1% gain 0.05 C per reading in the second half
+    drift = rng.choice(np.setdiff1d(np.arange(sensors), stuck), max(sensors // 1000, 1), replace=False)
+    late = np.flatnonzero(np.isin(slots, drift) & (np.arange(len(slots)) >= len(slots) // 2))
+    temps[late] += 0.05 * (np.arange(len(late)) // len(drift) + 1)
+    faults['drift'] = set(drift.tolist())
+    return ids[slots], {'temperature': temps, 'humidity': hums}, faults, set(spikes.tolist())
+
+
+def score_numpy(sensor_ids, values, batch):
+    """(seconds spent in score(), anomalies found); index is the reading's position"""
+    detector = anomaly_detector.AnomalyDetector()
+    found = []
+    started = time.perf_counter()
+    for start in range(0, len(sensor_ids), batch):
+        end = start + batch
+        chunk = {metric: column[start:end] for metric, column in values.items()}
+        for anomaly in detector.score(sensor_ids[start:end], chunk):
+            anomaly['index'] += start
+            found.append(anomaly)
+    return time.perf_counter() - started, found
+
+
+def score_sqlite(sensor_ids, values, batch):
+    """(seconds spent in refresh(), anomalies found); the inserts are not timed"""
+    detector = anomaly_detector.AnomalyDetector()
+    found = []
+    elapsed = 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        conn.execute('''
+            CREATE TABLE sensor_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sensor_id TEXT,
+                temperature REAL,
+                humidity REAL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        anomaly_detector.create_tables(conn.cursor())
+        conn.commit()
+        for start in range(0, len(sensor_ids), batch):
+            end = start + batch
+            conn.executemany("INSERT INTO sensor_data (sensor_id, temperature, humidity) VALUES (?, ?, ?)",
+                             zip(sensor_ids[start:end], values['temperature'][start:end].tolist(),
+                                 values['humidity'][start:end].tolist()))
+            conn.commit()
+            started = time.perf_counter()
+            anomalies = anomaly_detector.refresh(conn, detector, publish=False)
+            elapsed += time.perf_counter() - started
+            for anomaly in anomalies:
+                anomaly['index'] = anomaly['reading_id'] - 1
+            found.extend(anomalies)
+        conn.close()
+    return elapsed, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sensors', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--interval', type=float, default=10,
+                        help='seconds between two readings of a sensor')
+    parser.add_argument('--noise', choices=['gaussian', 'publisher'], default='gaussian',
+                        help='diurnal cycle plus Gaussian noise, or publisher.py-like uniform readings')
+    parser.add_argument('--sqlite', action='store_true',
+                        help='time refresh() on a database instead of score() alone')
+    args = parser.parse_args()
+    score = score_sqlite if args.sqlite else score_numpy
+
+    print(f"Generating {args.sensors} sensors x {args.rounds} readings...")
+    sensor_ids, values, faults, spiked = fleet(args.sensors, args.rounds, args.interval,
+                                               noise=args.noise)
+    total = len(sensor_ids)
+    faulty = set().union(*faults.values())
+    healthy = total - len(spiked) - args.rounds * len(faults['stuck'] | faults['drift'])
+    needed = args.sensors / args.interval
+    print(f"{'batch':>8} {'readings/s':>12} {'needed/s':>10} {'headroom':>9}  detected")
+    print("=" * 78)
+    for batch in args.batch:
+        elapsed, anomalies = score(sensor_ids, values, batch)
+        found = {}
+        for anomaly in anomalies:
+            found.setdefault(anomaly['kind'], set()).add(int(anomaly['sensor_id'][7:]))
+        rate = total / elapsed
+        detected = ', '.join(f"{kind} {len(found.get(kind, set()) & sensors)}/{len(sensors)}"
+                             for kind, sensors in faults.items())
+        flagged_sensors = len(set().union(*found.values()) - faulty) if found else 0
+        # Alerts on readings that are neither spiked nor from a stuck or drifting sensor
+        false_alarms = len({anomaly['index'] for anomaly in anomalies
+                            if anomaly['index'] not in spiked
+                            and int(anomaly['sensor_id'][7:]) not in faults['stuck'] | faults['drift']})
+        print(f"{batch:>8} {rate:>12,.0f} {needed:>10,.0f} {rate / needed:>8.1f}x  "
+              f"{detected}, healthy sensors flagged {flagged_sensors}, "
+              f"false alarms {false_alarms / healthy:.3%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark of dashboard chart rendering under concurrent clients
+Each simulated client renders a page of two charts (temperature and
+humidity, several sensors each). Compares:
+
+    pyplot    the former global pyplot state machine, serialized by a lock
+              (required, since concurrent pyplot calls corrupt each other)
+    threads   chart_renderer's Figure-based renderer in the client threads
+    pool      chart_renderer.render_many on the process pool
+
+With --micro, instead measures single-thread CPU time per chart of a new
+figure per render (render_fresh) vs. the reused figure template
+(render_time_series).
+
+Usage:
+    python bench_charts.py --clients 1 4 8 --pages 4 --points 500
+    python bench_charts.py --micro --renders 20
+"""
+
+import argparse
+import base64
+import io
+import threading
+import time
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import chart_renderer
+
+_pyplot_lock = threading.Lock()
+
+
+def make_specs(sensors, points):
+    rng = np.random.default_rng(42)
+    start = np.datetime64('2026-01-01T00:00:00')
+    x = start + np.arange(points) * np.timedelta64(60, 's')
+    specs = []
+    for title, ylabel, low, high in (('Temperature over Time', 'Temperature (°C)', 18, 32),
+                                     ('Humidity over Time', 'Humidity (%)', 30, 80)):
+        series = [(f"sensor-{i:03d}", x, rng.uniform(low, high, points)) for i in range(sensors)]
+        specs.append(chart_renderer.ChartSpec(title, ylabel, series))
+    return specs
+
+
+def render_pyplot(spec):
+    with _pyplot_lock:
+        plt.figure(figsize=(12, 6))
+        for label, x, y in spec.series:
+            plt.plot(x, y, label=label, marker='o', markersize=3)
+        plt.title(spec.title)
+        plt.xlabel('Time')
+        plt.ylabel(spec.ylabel)
+        plt.legend()
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+        img = io.BytesIO()
+        plt.savefig(img, format='png', dpi=100, bbox_inches='tight')
+        plt.close()
+        return base64.b64encode(img.getvalue()).decode()
+
+
+MODES = {
+    'pyplot': lambda specs: [render_pyplot(spec) for spec in specs],
+    'threads': lambda specs: [chart_renderer.render_time_series(spec) for spec in specs],
+    'pool': chart_renderer.render_many,
+}
+
+
+def run(mode, clients, pages, specs):
+    render = MODES[mode]
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(pages):
+            start = time.perf_counter()
+            render(specs)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'pages_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+    }
+
+
+def micro(specs, renders):
+    """CPU ms per chart of each single-thread renderer"""
+    results = {}
+    for name, render in (('fresh', chart_renderer.render_fresh),
+                         ('template', chart_renderer.render_time_series)):
+        for spec in specs:
+            render(spec)  # warm up imports, fonts and templates
+        started = time.process_time()
+        for _ in range(renders):
+            for spec in specs:
+                render(spec)
+        results[name] = (time.process_time() - started) * 1000 / (renders * len(specs))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--pages', type=int, default=4, help='pages rendered per client')
+    parser.add_argument('--sensors', type=int, default=3, help='series per chart')
+    parser.add_argument('--points', type=int, default=500, help='points per series')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--micro', action='store_true', help='per-render CPU time, fresh vs. template')
+    parser.add_argument('--renders', type=int, default=20, help='renders per chart with --micro')
+    args = parser.parse_args()
+
+    specs = make_specs(args.sensors, args.points)
+    if args.micro:
+        results = micro(specs, args.renders)
+        print(f"PNG compress level: {chart_renderer.CHART_PNG_COMPRESS}")
+        print(f"{'renderer':<10} {'CPU ms/chart':>12}")
+        print("=" * 23)
+        for name, ms in results.items():
+            print(f"{name:<10} {ms:>12.1f}")
+        print(f"template saves {1 - results['template'] / results['fresh']:.0%}")
+        return
+
+    # Start the pool (and its forkserver) outside the measurements
+    chart_renderer.render_many(specs)
+
+    print(f"Render pool workers: {chart_renderer.CHART_WORKERS}")
+    print(f"{'mode':<8} {'clients':>7} {'pages/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    print("=" * 46)
+    for clients in args.clients:
+        for mode in args.modes:
+            stats = run(mode, clients, args.pages, specs)
+            print(f"{mode:<8} {clients:>7} {stats['pages_per_s']:>9.2f} "
+                  f"{stats['p50_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+    chart_renderer.shutdown()
+
+
+if __name__ == "__main__":
+    main()
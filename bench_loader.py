@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark of sensor_data loading: DataFrame path vs. compact typed loader
+Compares, on an existing database:
+
+    read_sql    pd.read_sql_query of the joined query + pd.to_datetime
+                (the former get_data() / analyse_donnees path)
+    loader      data_loader.load_data (fetchmany into typed NumPy buffers)
+
+and reports load time, the resulting frame's memory and peak allocation.
+
+Usage:
+    python bench_loader.py --db database.db --runs 3
+"""
+
+import argparse
+import sqlite3
+import statistics
+import time
+import tracemalloc
+
+import pandas as pd
+
+import data_loader
+
+QUERY = '''
+    SELECT sd.*, s.sensor_type, s.latitude, s.longitude, s.description
+    FROM sensor_data sd
+    LEFT JOIN sensors s ON sd.sensor_id = s.sensor_id
+'''
+
+
+def load_read_sql(conn):
+    df = pd.read_sql_query(QUERY, conn)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='mixed')
+    return df
+
+
+def load_typed(conn):
+    return data_loader.load_data(conn)
+
+
+def measure(loader, conn, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        df = loader(conn)
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    df = loader(conn)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'rows': len(df),
+        'seconds': statistics.median(times),
+        'frame_mb': df.memory_usage(deep=True).sum() / 1e6,
+        'peak_mb': peak / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--runs', type=int, default=3, help='timed runs per loader (median)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    results = [(name, measure(loader, conn, args.runs))
+               for name, loader in (('read_sql', load_read_sql), ('loader', load_typed))]
+    conn.close()
+
+    print("=" * 64)
+    print(f"{'path':<10} {'rows':>10} {'load s':>9} {'frame MB':>10} {'peak MB':>10} {'B/row':>8}")
+    print("=" * 64)
+    for name, stats in results:
+        per_row = stats['frame_mb'] * 1e6 / stats['rows'] if stats['rows'] else 0
+        print(f"{name:<10} {stats['rows']:>10} {stats['seconds']:>9.3f} {stats['frame_mb']:>10.1f} "
+              f"{stats['peak_mb']:>10.1f} {per_row:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
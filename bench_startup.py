@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the project's entry points
+Imports each entry point in a fresh interpreter under ``python -X importtime``
+and reports the cumulative import time of the module, the wall time of the
+process and the heaviest imports it pulled in. Results can be saved and
+compared against an earlier run to catch import-time regressions.
+
+Usage:
+    python bench_startup.py                      # all entry points
+    python bench_startup.py app check_db -n 5    # selected modules, 5 runs each
+    python bench_startup.py --save startup.json
+    python bench_startup.py --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = [
+    'app',
+    'check_db',
+    'init_db',
+    'analyse_donnees',
+    'graphiques_donnees',
+    'subscriber_db',
+    'subscriber_irrigation',
+    'multi_zone_controller',
+    'intrusion_detection',
+]
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def import_once(module):
+    """Import a module in a new interpreter; returns timings or None on error"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+
+    cumulative = 0
+    top_level = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        if name == module:
+            cumulative = int(cumulative_us)
+        # Packages imported directly by the entry point (second level)
+        if len(indent) == 3:
+            top_level[name] = int(cumulative_us)
+    return {'import_ms': cumulative / 1000, 'wall_ms': wall * 1000,
+            'heaviest': sorted(top_level.items(), key=lambda item: -item[1])[:3]}, None
+
+
+def measure(module, runs):
+    samples = []
+    for _ in range(runs):
+        sample, error = import_once(module)
+        if sample is None:
+            return {'error': error}
+        samples.append(sample)
+    return {
+        'import_ms': statistics.median(sample['import_ms'] for sample in samples),
+        'wall_ms': statistics.median(sample['wall_ms'] for sample in samples),
+        'heaviest': samples[-1]['heaviest'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS)
+    parser.add_argument('-n', '--runs', type=int, default=3, help='runs per module (median)')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print("=" * 86)
+    print(f"{'entry point':<24} {'import ms':>10} {'wall ms':>9} {'vs base':>8}  heaviest imports")
+    print("=" * 86)
+    for module in args.modules:
+        stats = measure(module, args.runs)
+        results[module] = stats
+        if 'error' in stats:
+            print(f"{module:<24} {'-':>10} {'-':>9} {'':>8}  ❌ {stats['error']}")
+            continue
+        delta = ''
+        if 'import_ms' in baseline.get(module, {}):
+            delta = f"{stats['import_ms'] - baseline[module]['import_ms']:+.0f}"
+        heaviest = ', '.join(f"{name} {us / 1000:.0f}ms" for name, us in stats['heaviest'])
+        print(f"{module:<24} {stats['import_ms']:>10.1f} {stats['wall_ms']:>9.1f} {delta:>8}  {heaviest}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Thread-safe chart rendering for the web dashboard
+Charts are drawn on standalone ``matplotlib.figure.Figure`` objects with an
+Agg canvas instead of the global ``pyplot`` state machine, so concurrent
+requests never share a current figure. Rendering runs in a process pool:
+independent charts of one page are drawn in parallel and CPU-heavy
+rasterization does not hold the web worker's GIL.
+
+Time series reuse a per-thread figure template of each chart type with
+fixed margins: a render only swaps the line data and rasterizes, with no
+figure construction, tight_layout or bbox_inches='tight' pass.
+
+In a gevent worker the pool's pipes would block the event loop (a full
+pipe write stalls every greenlet, including the thread that drains the
+results), so charts are rendered on gevent's pool of native threads
+instead; waiting for them yields to the other requests and streams.
+
+Environment:
+    CHART_WORKERS        processes in the render pool (default min(4, CPU count)),
+                         threads under gevent; 0 renders in the calling thread
+    CHART_PNG_COMPRESS   zlib level of the PNGs (default 6); 1 encodes about
+                         twice as fast for ~25% larger images
+"""
+
+import base64
+import io
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', min(4, os.cpu_count() or 1)))
+CHART_PNG_COMPRESS = int(os.environ.get('CHART_PNG_COMPRESS', 6))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class ChartSpec:
+    """Picklable description of a line chart: one (label, x, y) per series"""
+
+    def __init__(self, title, ylabel, series, xlabel='Time', marker='o'):
+        self.title = title
+        self.ylabel = ylabel
+        self.xlabel = xlabel
+        self.series = series
+        self.marker = marker
+
+
+def render_fresh(spec):
+    """Draw one chart on a new figure and return the PNG as base64"""
+    # matplotlib is imported on first render, not when app.py is imported
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for label, x, y in spec.series:
+        ax.plot(x, y, label=f"{label}", marker=spec.marker, markersize=3)
+    ax.set_title(spec.title)
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+
+    img = io.BytesIO()
+    fig.savefig(img, format='png', dpi=100, bbox_inches='tight',
+                pil_kwargs={'compress_level': CHART_PNG_COMPRESS})
+    return base64.b64encode(img.getvalue()).decode()
+
+
+class _Template:
+    """Pre-built figure of one chart type; renders only swap the line data"""
+
+    def __init__(self, spec):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.fig = Figure(figsize=(12, 6), dpi=100)
+        self.canvas = FigureCanvasAgg(self.fig)
+        # Fixed margins instead of tight_layout / bbox_inches='tight': the
+        # canvas size never changes, so the layout is computed only here
+        self.fig.subplots_adjust(left=0.07, right=0.98, top=0.94, bottom=0.17)
+        self.ax = self.fig.add_subplot()
+        self.ax.set_title(spec.title)
+        self.ax.set_xlabel(spec.xlabel)
+        self.ax.set_ylabel(spec.ylabel)
+        self.ax.xaxis_date()
+        self.ax.tick_params(axis='x', labelrotation=45)
+        self.marker = spec.marker
+        self.lines = []
+        self.labels = None
+
+    def render(self, spec):
+        from matplotlib.dates import date2num
+
+        while len(self.lines) < len(spec.series):
+            # New lines take the next colour of the cycle, as plot() would
+            line, = self.ax.plot([], [], marker=self.marker, markersize=3)
+            self.lines.append(line)
+        for line, (label, x, y) in zip(self.lines, spec.series):
+            line.set_data(date2num(x), y)
+            line.set_visible(True)
+        for line in self.lines[len(spec.series):]:
+            line.set_visible(False)
+
+        labels = [f"{label}" for label, _, _ in spec.series]
+        if labels != self.labels:
+            self.ax.legend(self.lines[:len(labels)], labels)
+            self.labels = labels
+
+        self.ax.relim(visible_only=True)
+        self.ax.autoscale_view()
+
+        img = io.BytesIO()
+        self.canvas.print_png(img, pil_kwargs={'compress_level': CHART_PNG_COMPRESS})
+        return base64.b64encode(img.getvalue()).decode()
+
+
+_templates = threading.local()
+
+
+def _is_time_series(spec):
+    return all(getattr(x, 'dtype', None) is not None and x.dtype.kind == 'M'
+               for _, x, _ in spec.series)
+
+
+def render_time_series(spec):
+    """Draw one chart and return the PNG as base64.
+
+    Datetime series are drawn on a per-thread template of the chart type
+    (title, labels, marker); anything else falls back to render_fresh().
+    """
+    if not spec.series or not _is_time_series(spec):
+        return render_fresh(spec)
+    templates = getattr(_templates, 'by_type', None)
+    if templates is None:
+        templates = _templates.by_type = {}
+    key = (spec.title, spec.ylabel, spec.xlabel, spec.marker)
+    template = templates.get(key)
+    if template is None:
+        template = templates[key] = _Template(spec)
+    return template.render(spec)
+
+
+def _gevent_patched():
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            if _gevent_patched():
+                from gevent.threadpool import ThreadPoolExecutor
+                _pool = ThreadPoolExecutor(max_workers=CHART_WORKERS)
+                _pool_pid = os.getpid()
+                return _pool
+            # forkserver children start from a clean single-threaded process,
+            # not from a copy of a multi-threaded web worker
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            if 'forkserver' in methods:
+                context.set_forkserver_preload([__name__, 'matplotlib.figure',
+                                                'matplotlib.backends.backend_agg'])
+            _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=context)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def render_many(specs):
+    """Render several charts in parallel; returns base64 PNGs in order"""
+    specs = list(specs)
+    if CHART_WORKERS <= 0 or len(specs) == 0:
+        return [render_time_series(spec) for spec in specs]
+    try:
+        return list(_get_pool().map(render_time_series, specs))
+    except BrokenProcessPool:
+        # A render process died (e.g. OOM-killed): start a fresh pool next time
+        _reset_pool()
+        return [render_time_series(spec) for spec in specs]
+
+
+def shutdown():
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+    _reset_pool()
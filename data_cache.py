@@ -0,0 +1,243 @@
+"""
+Incremental in-memory cache of sensor_data joined with sensor metadata
+The table is loaded once into compact typed columns by data_loader
+(categorical ids and metadata, float32 readings, datetime64 timestamps).
+Every later call only fetches the rows with ``id > last_id`` and appends
+them, so a reader asking for "all recent data" pays for the delta since the
+previous call instead of re-reading and re-parsing the whole table.
+
+Columns live in preallocated NumPy buffers (categorical columns as their
+codes) and the frame handed out wraps a view of the live rows. A delta is
+written past the end of the buffers, so its cost does not depend on the
+size of the cache and frames returned earlier never change; only a new
+category value, a sensor metadata change or a full buffer (which grows it
+by half) rewrites the existing rows, into new arrays.
+
+Sensor metadata (type, position, description) is re-applied to all cached
+rows only when the sensors table changes; the subscribers only rewrite a
+sensor's row when its metadata differs.
+Old rows are evicted by reading age and/or a memory cap; evicted rows are
+not fetched again.
+
+Environment:
+    DATA_CACHE_MAX_AGE  keep readings at most this many seconds old (default 0: all)
+    DATA_CACHE_MAX_MB   memory cap of the cached frame in MB (default 0: none)
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+import data_loader
+import db
+
+# Spare rows allocated past the live ones: half as many again, at least this
+MIN_SPARE_ROWS = 1024
+
+
+def _codes_dtype(categories):
+    # The dtype pandas itself picks for the codes, so a buffer of it can be
+    # wrapped in a Categorical without a copy
+    for dtype in (np.int8, np.int16, np.int32):
+        if len(categories) < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _expired_prefix(times, cutoff, step=4096):
+    """Length of the leading run of timestamps older than cutoff (NaT included)"""
+    for offset in range(0, len(times), step):
+        fresh = np.flatnonzero(times[offset:offset + step] >= cutoff)
+        if len(fresh):
+            return offset + int(fresh[0])
+    return len(times)
+
+
+class SensorDataCache:
+    """sensor_data rows (plus sensor metadata) kept in memory and tailed by id"""
+
+    def __init__(self, max_age=0, max_bytes=0):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._buffers = None  # column -> ndarray (codes for categorical columns)
+        self._categories = {}  # categorical column -> pandas Index
+        self._start = self._end = 0  # live rows of the buffers
+        self._frame = None
+        self._last_id = 0
+        self._sensors = None
+        self._lookups = None  # (sensor_id categories, {column: value by sensor code})
+        self._sensors_version = None
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.delta_rows = 0
+
+    def clear(self):
+        with self._lock:
+            self._buffers = None
+            self._categories = {}
+            self._start = self._end = 0
+            self._frame = None
+            self._last_id = 0
+            self._sensors = None
+            self._lookups = None
+            self._sensors_version = None
+
+    def _view(self):
+        """DataFrame over the live rows of the buffers, without copying them"""
+        import pandas as pd
+
+        columns = {}
+        for column, buffer in self._buffers.items():
+            values = buffer[self._start:self._end]
+            if column in self._categories:
+                values = pd.Categorical.from_codes(values, self._categories[column], validate=False)
+            columns[column] = values
+        return pd.DataFrame(columns, copy=False)
+
+    def _fill(self, frame, spare=MIN_SPARE_ROWS):
+        """Replace the buffers by new ones holding frame's rows"""
+        rows = len(frame)
+        capacity = rows + max(rows // 2, spare)
+        self._buffers, self._categories = {}, {}
+        for column in frame.columns:
+            values = frame[column]
+            if values.dtype == 'category':
+                # Sensors whose rows were all evicted should not linger as categories
+                values = values.cat.remove_unused_categories()
+                categories = values.cat.categories
+                self._categories[column] = categories
+                values = values.cat.codes.to_numpy().astype(_codes_dtype(categories), copy=False)
+            else:
+                values = values.to_numpy()
+            buffer = np.empty(capacity, dtype=values.dtype)
+            buffer[:rows] = values
+            self._buffers[column] = buffer
+        self._start, self._end = 0, rows
+        self._lookups = None
+
+    def _delta_codes(self, column, values):
+        """Codes of values in the column's categories, adding new ones if needed"""
+        import pandas as pd
+
+        categories = self._categories[column]
+        values = values.astype('category')
+        lookup = categories.get_indexer(values.cat.categories)
+        if (lookup < 0).any():
+            # New value: re-code the cached rows into a new buffer, keeping
+            # categories sorted like data_loader's
+            merged = pd.Index(sorted(set(categories) | set(values.cat.categories), key=str))
+            remap = np.append(merged.get_indexer(categories), -1)
+            buffer = self._buffers[column]
+            recoded = np.empty(len(buffer), dtype=_codes_dtype(merged))
+            recoded[self._start:self._end] = remap[buffer[self._start:self._end]]
+            self._buffers[column] = recoded
+            self._categories[column] = categories = merged
+            lookup = categories.get_indexer(values.cat.categories)
+        return np.append(lookup, -1)[values.cat.codes.to_numpy()]
+
+    def _sensor_lookups(self):
+        """Code (or value) of each metadata column per sensor code, -1 last"""
+        sensor_ids = self._categories['sensor_id']
+        if self._lookups is None or self._lookups[0] is not sensor_ids:
+            rows = self._sensors.reindex(sensor_ids).reset_index(drop=True)
+            lookups = {}
+            for column in data_loader.SENSOR_COLUMNS:
+                if column in self._categories:
+                    lookups[column] = np.append(self._delta_codes(column, rows[column]), -1)
+                elif column in self._buffers:
+                    lookups[column] = np.append(rows[column].to_numpy(dtype=np.float64), np.nan)
+            self._lookups = (sensor_ids, lookups)
+        return self._lookups[1]
+
+    def _append(self, delta):
+        """Write the readings of delta after the live rows, growing the
+        buffers if full; metadata columns are looked up by sensor"""
+        rows = len(delta)
+        if self._end + rows > len(next(iter(self._buffers.values()))):
+            self._fill(self._view(), spare=rows)
+        end = self._end + rows
+        sensor_codes = self._delta_codes('sensor_id', delta['sensor_id'])
+        lookups = self._sensor_lookups()
+        for column in list(self._buffers):
+            if column in lookups:
+                values = lookups[column][sensor_codes]
+            elif column == 'sensor_id':
+                values = sensor_codes
+            elif column not in delta.columns:
+                # e.g. zone_id added to the schema after the first load
+                values = -1 if column in self._categories else np.nan
+            elif column in self._categories:
+                # May move the column to a re-coded buffer
+                values = self._delta_codes(column, delta[column])
+            else:
+                values = delta[column].to_numpy()
+            self._buffers[column][self._end:end] = values
+        self._end = end
+
+    def _evict(self):
+        if self.max_age and self._end > self._start:
+            cutoff = np.datetime64(int((time.time() - self.max_age) * 1000), 'ms')
+            # Rows are in id (arrival) order: the expired ones come first
+            self._start += _expired_prefix(self._buffers['timestamp'][self._start:self._end], cutoff)
+        if self.max_bytes and self._end > self._start:
+            size = self._view().memory_usage(deep=True).sum()
+            if size > self.max_bytes:
+                # Drop the oldest share
+                rows = self._end - self._start
+                self._start = self._end - int(rows * self.max_bytes / size)
+
+    def get_data(self, conn=None):
+        """All cached readings with sensor metadata, refreshed incrementally.
+
+        The returned frame is a shallow copy: adding columns to it is fine,
+        modifying values in place is not.
+        """
+        conn = conn or db.get_connection()
+        with self._lock:
+            max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+            sensors_version = conn.execute("SELECT COUNT(*), MAX(rowid) FROM sensors").fetchone()
+
+            if self._buffers is None or max_id < self._last_id:
+                # First call, or the table was recreated: full load
+                self._sensors = data_loader.load_sensors(conn)
+                # Bounded by max_id: rows inserted since then are the next delta
+                readings = data_loader.load_readings(conn, where='id <= ?', params=(max_id,))
+                self._fill(data_loader.attach_sensors(readings, self._sensors))
+                self.full_loads += 1
+                self._frame = None
+            else:
+                if sensors_version != self._sensors_version:
+                    self._sensors = data_loader.load_sensors(conn)
+                    self._fill(data_loader.attach_sensors(self._view(), self._sensors))
+                    self._frame = None
+                if max_id > self._last_id:
+                    delta = data_loader.load_readings(conn, self._last_id, where='id <= ?',
+                                                      params=(max_id,))
+                    self.delta_rows += len(delta)
+                    self._append(delta)
+                    self._frame = None
+
+            bounds = (self._start, self._end)
+            self._evict()
+            if self._frame is None or (self._start, self._end) != bounds:
+                self._frame = self._view()
+            self._last_id = max_id
+            self._sensors_version = sensors_version
+            return self._frame.copy(deep=False)
+
+    def memory_usage(self):
+        """Bytes held by the cached frame"""
+        frame = self._frame
+        return 0 if frame is None else int(frame.memory_usage(deep=True).sum())
+
+
+# Shared by every reader in this process
+cache = SensorDataCache(max_age=float(os.environ.get('DATA_CACHE_MAX_AGE', 0)),
+                        max_bytes=float(os.environ.get('DATA_CACHE_MAX_MB', 0)) * 1024 * 1024)
+
+
+def get_data(conn=None):
+    """sensor_data joined with sensors, served from the process-wide cache"""
+    return cache.get_data(conn)
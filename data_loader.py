@@ -0,0 +1,136 @@
+"""
+Compact typed loader for sensor readings
+Reads sensor_data with ``fetchmany`` straight into NumPy buffers instead of
+going through ``pd.read_sql_query``:
+
+    sensor_id, zone_id, location   categorical (int32 codes + one copy of each string)
+    temperature, humidity          float32
+    timestamp                      int64 epoch milliseconds, exposed as datetime64[ms]
+
+so a reading costs a few dozen bytes instead of several Python objects.
+Sensor metadata is attached per distinct sensor and expanded by code.
+``bench_loader.py`` compares load time and memory with the DataFrame path.
+"""
+
+import numpy as np
+
+# Epoch milliseconds of a stored timestamp: CURRENT_TIMESTAMP text (UTC)
+# or the numeric epoch seconds written by upgrade_db_level4
+EPOCH_MS_SQL = '''
+    CASE WHEN typeof(timestamp) IN ('integer', 'real') THEN CAST(timestamp * 1000 AS INTEGER)
+         ELSE CAST(ROUND((julianday(timestamp) - 2440587.5) * 86400000.0) AS INTEGER) END
+'''
+
+CHUNK_ROWS = 50000
+
+SENSOR_COLUMNS = ('sensor_type', 'latitude', 'longitude', 'description')
+CATEGORICAL_COLUMNS = ('sensor_id', 'zone_id', 'location', 'sensor_type', 'description')
+
+_OPTIONAL_COLUMNS = ('zone_id', 'location')
+_NAT = np.iinfo(np.int64).min  # NaT as int64
+
+
+class _Dictionary:
+    """Incremental string -> int32 code mapping (None -> -1)"""
+
+    def __init__(self):
+        self.codes = {None: -1}
+
+    def encode(self, values):
+        codes = self.codes
+        return np.fromiter((codes[v] if v in codes else codes.setdefault(v, len(codes) - 1)
+                            for v in values), dtype=np.int32, count=len(values))
+
+    def categorical(self, codes):
+        """Categorical of the codes, with categories in sorted order"""
+        import pandas as pd
+
+        categories = [value for value in self.codes if value is not None]
+        categorical = pd.Categorical.from_codes(codes, categories)
+        # Sorted like object columns so that groupby output order is unchanged
+        return categorical.reorder_categories(sorted(categories, key=str))
+
+
+def load_readings(conn, after_id=0, chunk_rows=CHUNK_ROWS, where=None, params=(), limit=None):
+    """sensor_data rows with id > after_id as a compact DataFrame, in id order.
+
+    where/params optionally restrict the rows further (an SQL condition);
+    limit caps the number of rows read.
+    """
+    import pandas as pd
+
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(sensor_data)")}
+    optional = [column for column in _OPTIONAL_COLUMNS if column in existing]
+    cursor = conn.execute(f'''
+        SELECT id, sensor_id, temperature, humidity, {EPOCH_MS_SQL}
+               {''.join(', ' + column for column in optional)}
+        FROM sensor_data
+        WHERE id > ? {'AND (' + where + ')' if where else ''}
+        ORDER BY id
+        LIMIT ?
+    ''', (after_id, *params, -1 if limit is None else limit))
+
+    dictionaries = {column: _Dictionary() for column in ['sensor_id'] + optional}
+    chunks = {column: [] for column in ['id', 'temperature', 'humidity', 'timestamp'] + list(dictionaries)}
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        count = len(rows)
+        values = list(zip(*rows))
+        chunks['id'].append(np.fromiter(values[0], dtype=np.int64, count=count))
+        chunks['temperature'].append(np.array(values[2], dtype=np.float32))
+        chunks['humidity'].append(np.array(values[3], dtype=np.float32))
+        chunks['timestamp'].append(np.fromiter((_NAT if v is None else v for v in values[4]),
+                                               dtype=np.int64, count=count))
+        chunks['sensor_id'].append(dictionaries['sensor_id'].encode(values[1]))
+        for offset, column in enumerate(optional, start=5):
+            chunks[column].append(dictionaries[column].encode(values[offset]))
+
+    def column(name, dtype):
+        return np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype=dtype)
+
+    frame = {
+        'id': column('id', np.int64),
+        'sensor_id': dictionaries['sensor_id'].categorical(column('sensor_id', np.int32)),
+        'temperature': column('temperature', np.float32),
+        'humidity': column('humidity', np.float32),
+        'timestamp': column('timestamp', np.int64).view('datetime64[ms]'),
+    }
+    for name in optional:
+        frame[name] = dictionaries[name].categorical(column(name, np.int32))
+    return pd.DataFrame(frame)
+
+
+def load_sensors(conn):
+    """Sensor metadata indexed by sensor_id"""
+    import pandas as pd
+
+    return pd.read_sql_query(
+        f"SELECT sensor_id, {', '.join(SENSOR_COLUMNS)} FROM sensors", conn
+    ).set_index('sensor_id')
+
+
+def attach_sensors(frame, sensors):
+    """Set the sensor metadata columns of a readings frame (in place)"""
+    import pandas as pd
+
+    # Look metadata up once per distinct sensor, then expand by code;
+    # code -1 (NULL sensor_id) or an unknown sensor gives NaN
+    ids = frame['sensor_id'].astype('category')
+    codes = ids.cat.codes.to_numpy()
+    for column in SENSOR_COLUMNS:
+        lookup = sensors[column].reindex(ids.cat.categories)
+        if column in CATEGORICAL_COLUMNS:
+            categories = pd.Index(lookup.dropna().unique()).sort_values()
+            lookup_codes = np.append(categories.get_indexer(lookup), -1)
+            frame[column] = pd.Categorical.from_codes(lookup_codes[codes], categories)
+        else:
+            frame[column] = np.append(lookup.to_numpy(dtype=np.float64), np.nan)[codes]
+    return frame
+
+
+def load_data(conn, after_id=0, where=None, params=()):
+    """Readings with sensor metadata, as the dashboard and analytics use them"""
+    return attach_sensors(load_readings(conn, after_id, where=where, params=params),
+                          load_sensors(conn))
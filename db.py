@@ -0,0 +1,59 @@
+"""
+SQLite connection management for the web dashboard
+Each worker process (and each thread inside it) keeps one long-lived
+read-only connection instead of opening database.db on every request,
+opened on the thread's first query. Connections are tied to the process
+that opened them, so a connection made before a fork is never reused by
+the child. Under gevent all the greenlets of a worker run on one thread
+and share its connection.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+
+DATABASE = os.environ.get('WEATHER_DB', 'database.db')
+
+
+def thread_local():
+    """threading.local() that stays per OS thread under gevent, whose
+    patched threading.local is per greenlet, i.e. per request"""
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return monkey.get_original('threading', 'local')()
+    return threading.local()
+
+
+_local = thread_local()
+
+
+def connect(readonly=False, database=None):
+    """Open a new connection; read-only connections can't take write locks"""
+    database = database or DATABASE
+    if readonly:
+        conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(database)
+    # Wait for the MQTT subscribers' short write transactions instead of failing
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def get_connection():
+    """Read-only connection shared by all requests of the current thread"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = connect(readonly=True)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def preload():
+    """Open the current thread's connection ahead of the first request"""
+    try:
+        get_connection()
+    except sqlite3.OperationalError as e:
+        print(f"Could not preload database connection: {e}")
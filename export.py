@@ -0,0 +1,153 @@
+"""
+Streaming bulk export of sensor readings
+Rows are read from a dedicated SQLite cursor in chunks of CHUNK_ROWS and
+encoded chunk by chunk, so the first bytes leave the server as soon as the
+first chunk is read and memory stays constant whatever the time range.
+
+CSV needs only the standard library; Parquet needs the optional pyarrow
+package and is written as one row group per chunk.
+"""
+
+import csv
+import io
+
+import db
+import rollups
+
+CHUNK_ROWS = 5000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Exported columns in order, with the SQL producing each and its Parquet type.
+# Epoch timestamps are rendered like CURRENT_TIMESTAMP text (UTC).
+_COLUMNS = [
+    ('id', 'id', 'int64'),
+    ('sensor_id', 'sensor_id', 'string'),
+    ('temperature', 'temperature', 'float64'),
+    ('humidity', 'humidity', 'float64'),
+    ('timestamp', '''CASE WHEN typeof(timestamp) IN ('integer', 'real')
+                          THEN datetime(timestamp, 'unixepoch') ELSE timestamp END''', 'string'),
+]
+_OPTIONAL_COLUMNS = [
+    ('zone_id', 'zone_id', 'string'),
+    ('location', 'location', 'string'),
+]
+
+
+def check_format(fmt):
+    """Raise ValueError for an unknown or unavailable export format"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("parquet export requires the pyarrow package")
+
+
+def _columns(conn):
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(sensor_data)")}
+    return _COLUMNS + [column for column in _OPTIONAL_COLUMNS if column[0] in existing]
+
+
+def _iter_chunks(start=None, end=None, sensors=None, chunk_rows=CHUNK_ROWS):
+    """Yield (columns, rows) once, then lists of rows from one open cursor"""
+    conn = db.connect(readonly=True)
+    try:
+        columns = _columns(conn)
+        where = []
+        params = []
+        if start is not None:
+            where.append(f'({rollups.EPOCH_SQL}) >= ?')
+            params.append(start)
+        if end is not None:
+            where.append(f'({rollups.EPOCH_SQL}) < ?')
+            params.append(end)
+        if sensors:
+            where.append(f"sensor_id IN ({', '.join('?' * len(sensors))})")
+            params.extend(sensors)
+
+        cursor = conn.execute(f'''
+            SELECT {', '.join(expression for _, expression, _ in columns)}
+            FROM sensor_data
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY id
+        ''', params)
+        yield columns
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def _csv_stream(chunks):
+    columns = next(chunks)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _, _ in columns)
+    yield buffer.getvalue()
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_stream(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = next(chunks)
+    schema = pa.schema([(name, getattr(pa, type_name)()) for name, _, type_name in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            table = pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                schema=schema)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        # Footer: without it the file is unreadable, so always close
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(fmt, start=None, end=None, sensors=None, chunk_rows=CHUNK_ROWS):
+    """Generator of encoded export chunks (str for CSV, bytes for Parquet)"""
+    chunks = _iter_chunks(start, end, sensors, chunk_rows)
+    if fmt == 'parquet':
+        return _parquet_stream(chunks)
+    return _csv_stream(chunks)
@@ -0,0 +1,67 @@
+"""
+Fast JSON responses straight from SQLite rows
+The JSON endpoints read rows with ``sqlite3.Row`` cursors and encode them
+directly, without building a pandas DataFrame just to call
+``to_dict('records')``. Encoding uses orjson when the optional package is
+installed (falling back to the standard library), and long lists can be
+streamed item by item so the body is never held in memory as a whole.
+
+Unlike the DataFrame round trip, NULLs stay ``null`` (pandas turned them
+into NaN, which is not valid JSON) and integer columns stay integers.
+"""
+
+import json
+import sqlite3
+
+from flask import Response
+
+import profiling
+
+try:
+    import orjson
+except ImportError:  # Optional dependency
+    orjson = None
+
+# Rows per chunk when streaming a JSON list
+STREAM_CHUNK_ROWS = 500
+
+
+def dumps(obj):
+    """Encode to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def query(conn, sql, params=()):
+    """Run a query and return its rows as a list of dicts"""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return [dict(row) for row in cursor.execute(sql, params)]
+
+
+def response(obj, status=200):
+    """JSON response encoded with dumps()"""
+    with profiling.phase('serialize'):
+        body = dumps(obj)
+    return Response(body, status=status, mimetype='application/json')
+
+
+def stream_rows(conn, sql, params=(), chunk_rows=STREAM_CHUNK_ROWS):
+    """Streamed JSON list of the query's rows, encoded chunk by chunk"""
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(sql, params)
+
+    def generate():
+        yield b'['
+        separator = b''
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield separator + b','.join(dumps(dict(row)) for row in rows)
+            separator = b','
+        yield b']'
+
+    return Response(generate(), mimetype='application/json')
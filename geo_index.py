@@ -0,0 +1,208 @@
+"""
+Spatial index of sensor positions for the dashboard map
+Sensor coordinates are mirrored into an SQLite R*Tree virtual table by
+triggers on ``sensors``, so a map viewport query touches only the sensors
+inside it. When a zoomed-out viewport holds too many sensors, they are
+aggregated server-side into grid clusters (count, centroid, mean latest
+humidity) instead of being sent one by one.
+
+R*Tree ids must be integers and ``sensors`` is keyed by text and rewritten
+with INSERT OR REPLACE (which changes its rowid without firing delete
+triggers), so each sensor gets a stable integer id in ``sensor_geo_ids``.
+"""
+
+import math
+
+import db
+
+# Above this many sensors in view, send clusters instead of markers
+MAX_MARKERS = 500
+# Cluster grid: cells per 256px map tile at the requested zoom
+CELLS_PER_TILE = 4
+# Deepest zoom a web map asks for; larger zooms are clamped to it
+MAX_ZOOM = 22
+
+_IN_BBOX = '''
+    r.min_lat <= :north AND r.max_lat >= :south
+    AND r.min_lon <= :east AND r.max_lon >= :west
+'''
+
+_LATEST_READING = '''
+    LEFT JOIN sensor_data sd ON sd.id = (
+        SELECT MAX(id) FROM sensor_data WHERE sensor_id = s.sensor_id
+    )
+'''
+
+
+def create_geo_index(cursor):
+    """Create the R*Tree, its id mapping and sync triggers, then backfill"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensor_geo_ids (
+            geo_id INTEGER PRIMARY KEY,
+            sensor_id TEXT UNIQUE NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS sensors_rtree
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS sensors_geo_insert AFTER INSERT ON sensors
+        BEGIN
+            -- No conflict clauses in here: an outer INSERT OR REPLACE would
+            -- override them and reallocate the sensor's geo_id
+            INSERT INTO sensor_geo_ids (sensor_id)
+            SELECT new.sensor_id
+            WHERE NOT EXISTS (SELECT 1 FROM sensor_geo_ids WHERE sensor_id = new.sensor_id);
+            DELETE FROM sensors_rtree
+            WHERE id = (SELECT geo_id FROM sensor_geo_ids WHERE sensor_id = new.sensor_id);
+            INSERT INTO sensors_rtree
+            SELECT geo_id, new.latitude, new.latitude, new.longitude, new.longitude
+            FROM sensor_geo_ids
+            WHERE sensor_id = new.sensor_id
+              AND new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS sensors_geo_update
+        AFTER UPDATE OF latitude, longitude ON sensors
+        BEGIN
+            DELETE FROM sensors_rtree
+            WHERE id = (SELECT geo_id FROM sensor_geo_ids WHERE sensor_id = old.sensor_id);
+            INSERT INTO sensors_rtree
+            SELECT geo_id, new.latitude, new.latitude, new.longitude, new.longitude
+            FROM sensor_geo_ids
+            WHERE sensor_id = new.sensor_id
+              AND new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS sensors_geo_delete AFTER DELETE ON sensors
+        BEGIN
+            DELETE FROM sensors_rtree
+            WHERE id = (SELECT geo_id FROM sensor_geo_ids WHERE sensor_id = old.sensor_id);
+        END
+    ''')
+
+    # Backfill sensors registered before the index existed
+    cursor.execute('''
+        INSERT OR IGNORE INTO sensor_geo_ids (sensor_id) SELECT sensor_id FROM sensors
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO sensors_rtree
+        SELECT g.geo_id, s.latitude, s.latitude, s.longitude, s.longitude
+        FROM sensors s JOIN sensor_geo_ids g ON g.sensor_id = s.sensor_id
+        WHERE s.latitude IS NOT NULL AND s.longitude IS NOT NULL
+    ''')
+
+
+def parse_bbox(value):
+    """Parse 'west,south,east,north' (Leaflet's toBBoxString) into boxes.
+
+    Leaflet does not wrap longitudes: a viewport across the antimeridian
+    is e.g. 170..190 (170..-170 is read the same way). It is split into
+    two boxes within -180..180, each with the shift (a multiple of 360)
+    that brings its longitudes back into the viewport.
+    """
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be 'west,south,east,north'")
+    if not (math.isfinite(west) and math.isfinite(east)):
+        raise ValueError("bbox longitudes must be finite")
+    if east < west:
+        # GeoJSON's way of writing the same crossing: 170..-170
+        east += 360
+    south, north = max(south, -90.0), min(north, 90.0)
+    if east - west >= 360:
+        return [{'west': -180.0, 'south': south, 'east': 180.0, 'north': north, 'shift': 0.0}]
+    shift = 360.0 * math.floor((west + 180) / 360)
+    west, east = west - shift, east - shift
+    if east <= 180:
+        return [{'west': west, 'south': south, 'east': east, 'north': north, 'shift': shift}]
+    return [{'west': west, 'south': south, 'east': 180.0, 'north': north, 'shift': shift},
+            {'west': -180.0, 'south': south, 'east': east - 360, 'north': north, 'shift': shift + 360}]
+
+
+def fleet_bounds(conn=None):
+    """[[south, west], [north, east]] around every positioned sensor, or None"""
+    conn = conn or db.get_connection()
+    south, west, north, east = conn.execute(
+        "SELECT MIN(min_lat), MIN(min_lon), MAX(max_lat), MAX(max_lon) FROM sensors_rtree").fetchone()
+    if south is None:
+        return None
+    return [[south, west], [north, east]]
+
+
+def count_in_bbox(boxes, conn=None):
+    conn = conn or db.get_connection()
+    return sum(conn.execute(f"SELECT COUNT(*) FROM sensors_rtree r WHERE {_IN_BBOX}", bbox).fetchone()[0]
+               for bbox in boxes)
+
+
+def sensors_in_bbox(boxes, limit=MAX_MARKERS, conn=None):
+    """Sensors inside the boxes (from parse_bbox) with their latest reading"""
+    conn = conn or db.get_connection()
+    sensors = []
+    for bbox in boxes:
+        sensors += _sensors_in_box(conn, bbox, limit - len(sensors))
+    return sensors
+
+
+def _sensors_in_box(conn, bbox, limit):
+    rows = conn.execute(f'''
+        SELECT s.sensor_id, s.sensor_type, s.latitude, s.longitude, s.description,
+               sd.temperature, sd.humidity, sd.timestamp
+        FROM sensors_rtree r
+        JOIN sensor_geo_ids g ON g.geo_id = r.id
+        JOIN sensors s ON s.sensor_id = g.sensor_id
+        {_LATEST_READING}
+        WHERE {_IN_BBOX}
+        LIMIT :limit
+    ''', dict(bbox, limit=limit)).fetchall()
+    return [{
+        'sensor_id': sensor_id,
+        'sensor_type': sensor_type,
+        'latitude': latitude,
+        'longitude': longitude + bbox['shift'],
+        'description': description or "",
+        'latest_temp': temperature,
+        'latest_humidity': humidity,
+        'last_seen': timestamp,
+    } for (sensor_id, sensor_type, latitude, longitude, description,
+           temperature, humidity, timestamp) in rows]
+
+
+def clusters_in_bbox(boxes, zoom, conn=None):
+    """Grid clusters of the sensors inside the boxes (from parse_bbox).
+
+    The grid is anchored at (-90, -180) rather than at the viewport so that
+    clusters stay put while the map is panned; no cell straddles the
+    antimeridian, so the boxes of a split viewport share none. zoom is
+    clamped to 0..MAX_ZOOM.
+    """
+    conn = conn or db.get_connection()
+    cell = 360.0 / (2 ** min(max(zoom, 0), MAX_ZOOM)) / CELLS_PER_TILE
+    return [cluster for bbox in boxes for cluster in _clusters_in_box(conn, bbox, cell)]
+
+
+def _clusters_in_box(conn, bbox, cell):
+    rows = conn.execute(f'''
+        SELECT CAST((r.min_lat + 90) / :cell AS INTEGER) AS gy,
+               CAST((r.min_lon + 180) / :cell AS INTEGER) AS gx,
+               COUNT(*), AVG(r.min_lat), AVG(r.min_lon),
+               AVG(sd.humidity), COUNT(sd.humidity)
+        FROM sensors_rtree r
+        JOIN sensor_geo_ids g ON g.geo_id = r.id
+        JOIN sensors s ON s.sensor_id = g.sensor_id
+        {_LATEST_READING}
+        WHERE {_IN_BBOX}
+        GROUP BY gy, gx
+    ''', dict(bbox, cell=cell)).fetchall()
+    return [{
+        'count': count,
+        'latitude': latitude,
+        'longitude': longitude + bbox['shift'],
+        'mean_humidity': mean_humidity,
+        'humidity_sensors': humidity_sensors,
+    } for _, _, count, latitude, longitude, mean_humidity, humidity_sensors in rows]
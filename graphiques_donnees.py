@@ -1,36 +1,21 @@
 import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
+import data_cache
+import matplotlib
 import numpy as np
 
-def plot_data():
-    conn = sqlite3.connect('database.db')
-    
-    # Get data with sensor information
-    query = '''
-    SELECT sd.*, s.sensor_type, s.latitude, s.longitude, s.description
-    FROM sensor_data sd
-    LEFT JOIN sensors s ON sd.sensor_id = s.sensor_id
-    '''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+DASHBOARD_TITLE = 'MQTT Weather Logger Dashboard - Multi-Sensor Analysis'
 
-    if df.empty:
-        print("No data found.")
-        return
-
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-    # Create comprehensive plots
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-    fig.suptitle('MQTT Weather Logger Dashboard - Multi-Sensor Analysis', fontsize=16, fontweight='bold')
+def draw_dashboard(fig, df, title=DASHBOARD_TITLE):
+    """Draw the 2x2 multi-sensor dashboard of df on fig (pyplot or standalone Figure)"""
+    axes = fig.subplots(2, 2)
+    fig.suptitle(title, fontsize=16, fontweight='bold')
 
     # Plot 1: Temperature over time for each sensor
     ax1 = axes[0, 0]
     temp_data = df.dropna(subset=['temperature'])
     if not temp_data.empty:
         sensors = temp_data['sensor_id'].unique()
-        colors = plt.cm.tab10(np.linspace(0, 1, len(sensors)))
+        colors = matplotlib.colormaps['tab10'](np.linspace(0, 1, len(sensors)))
         
         for i, sensor in enumerate(sensors):
             sensor_data = temp_data[temp_data['sensor_id'] == sensor]
@@ -51,7 +36,7 @@ def plot_data():
     humid_data = df.dropna(subset=['humidity'])
     if not humid_data.empty:
         sensors = humid_data['sensor_id'].unique()
-        colors = plt.cm.tab10(np.linspace(0, 1, len(sensors)))
+        colors = matplotlib.colormaps['tab10'](np.linspace(0, 1, len(sensors)))
         
         for i, sensor in enumerate(sensors):
             sensor_data = humid_data[humid_data['sensor_id'] == sensor]
@@ -70,7 +55,7 @@ def plot_data():
     # Plot 3: Average values by sensor type
     ax3 = axes[1, 0]
     if 'sensor_type' in df.columns:
-        type_stats = df.groupby('sensor_type').agg({
+        type_stats = df.groupby('sensor_type', observed=True).agg({
             'temperature': 'mean',
             'humidity': 'mean'
         }).dropna()
@@ -116,8 +101,10 @@ def plot_data():
     # Plot 4: Data distribution (readings per sensor)
     ax4 = axes[1, 1]
     sensor_counts = df['sensor_id'].value_counts()
+    # Categorical ids also count sensors that have no rows in df
+    sensor_counts = sensor_counts[sensor_counts > 0]
     if not sensor_counts.empty:
-        colors = plt.cm.Set3(np.linspace(0, 1, len(sensor_counts)))
+        colors = matplotlib.colormaps['Set3'](np.linspace(0, 1, len(sensor_counts)))
         wedges, texts, autotexts = ax4.pie(sensor_counts.values, labels=sensor_counts.index, 
                                           autopct='%1.1f%%', colors=colors, startangle=90)
         ax4.set_title('Data Distribution by Sensor', fontweight='bold')
@@ -130,10 +117,10 @@ def plot_data():
         ax4.text(0.5, 0.5, 'No data', ha='center', va='center', transform=ax4.transAxes)
         ax4.set_title('Data Distribution by Sensor')
 
-    plt.tight_layout()
-    plt.subplots_adjust(top=0.93)
-    plt.show()
+    fig.tight_layout()
+    fig.subplots_adjust(top=0.93)
 
+def print_summary(df):
     # Print summary statistics
     print("\n" + "="*60)
     print("SUMMARY STATISTICS")
@@ -155,5 +142,24 @@ def plot_data():
             if not type_data['humidity'].dropna().empty:
                 print(f"  Avg Humidity: {type_data['humidity'].mean():.2f}%")
 
+def plot_data():
+    conn = sqlite3.connect('database.db')
+    
+    # Get data with sensor information (typed, timestamps already parsed)
+    df = data_cache.get_data(conn)
+    conn.close()
+
+    if df.empty:
+        print("No data found.")
+        return
+
+    # Interactive window; reports.py renders the same dashboard headless
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(16, 12))
+    draw_dashboard(fig, df)
+    plt.show()
+
+    print_summary(df)
+
 if __name__ == "__main__":
     plot_data()
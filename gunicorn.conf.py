@@ -0,0 +1,72 @@
+"""
+Production server configuration for the web dashboard
+Runs app.py under gunicorn with several worker processes:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Environment overrides:
+    WEB_BIND            listen address (default 0.0.0.0:5000)
+    WEB_WORKERS         worker processes (default 2 x CPU + 1)
+    WEB_WORKER_CLASS    gevent (default when installed), gthread or sync
+    WEB_THREADS         threads per gthread worker (default 4)
+    WEB_CONNECTIONS     concurrent connections per gevent worker (default 1000)
+    STREAM_MAX_CLIENTS  open /api/stream connections per worker (default:
+                        half the gevent connections; gthread threads - 1; 0 for sync)
+
+Every open /api/stream client holds a request handler until it leaves. With
+gevent that is one greenlet; with gthread it is a whole thread, so the
+stream cap keeps a thread free for regular requests (the dashboard page
+opens a stream per tab), and clients above it get a 503.
+"""
+
+import importlib.util
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('WEB_WORKER_CLASS',
+                              'gevent' if importlib.util.find_spec('gevent') else 'gthread')
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_connections = int(os.environ.get('WEB_CONNECTIONS', 1000))
+
+# Patch before app.py is preloaded: the locks its modules create at import
+# (live_stream, data_cache, response_cache...) must be gevent locks, or a
+# greenlet waiting on one held across a yield blocks the whole worker.
+# STREAM_MAX_CLIENTS is read by live_stream at that import too
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    os.environ.setdefault('STREAM_MAX_CLIENTS', str(worker_connections // 2))
+elif worker_class == 'gthread':
+    os.environ.setdefault('STREAM_MAX_CLIENTS', str(max(threads - 1, 0)))
+else:
+    os.environ.setdefault('STREAM_MAX_CLIENTS', '0')
+
+# Import app.py once in the master and fork it; nothing in app.py opens a
+# socket or database handle at import time
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound matplotlib/pandas memory growth
+max_requests = 10000
+max_requests_jitter = 1000
+
+
+def on_starting(server):
+    # app.py imports pandas lazily so CLI tools and the dev server start fast;
+    # under gunicorn, load it once in the master instead so that new and
+    # recycled workers fork with it already imported
+    import pandas  # noqa: F401
+
+
+def post_fork(server, worker):
+    # A gevent worker serves every request from its one thread's connection:
+    # open it before traffic. gthread request threads each open their own
+    # on first use, so there is nothing to warm from here
+    if server.cfg.worker_class_str == 'gevent':
+        import db
+        db.preload()
@@ -1,4 +1,15 @@
 import sqlite3
+import geo_index
+
+def create_indexes(cursor):
+    """Create the indexes used by the dashboard queries (idempotent)"""
+    # Latest reading per sensor: MAX(id) WHERE sensor_id = ? is a single index seek
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_data_sensor_id
+        ON sensor_data (sensor_id, id)
+    ''')
+    # Map viewport queries: R*Tree over sensor coordinates
+    geo_index.create_geo_index(cursor)
 
 def init_db():
     conn = sqlite3.connect('database.db')
@@ -28,6 +39,8 @@ def init_db():
         )
     ''')
     
+    create_indexes(cursor)
+    
     # Insert sample sensors if they don't exist
     sample_sensors = [
         ('temp-sensor-001', 'temperature', 48.8566, 2.3522, 'Paris Temperature Sensor'),
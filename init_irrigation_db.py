@@ -1,5 +1,13 @@
 import sqlite3
 
+def create_irrigation_indexes(cursor):
+    """Create the indexes used by the irrigation API (idempotent)"""
+    # Newest-first event history and keyset pagination on (timestamp, id)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_irrigation_events_timestamp_id
+        ON irrigation_events (timestamp, id)
+    ''')
+
 def init_irrigation_db():
     """Initialize database with irrigation tables for Level 3"""
     conn = sqlite3.connect('database.db')
@@ -19,6 +27,8 @@ def init_irrigation_db():
         )
     ''')
     
+    create_irrigation_indexes(cursor)
+    
     # Create irrigation_settings table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS irrigation_settings (
@@ -7,13 +7,11 @@ Date: Décembre 2024
 Version: Level 4+ Intrusion Detection
 """
 
-import cv2
 import json
 import time
 import paho.mqtt.client as mqtt
 import threading
 from datetime import datetime
-import numpy as np
 
 MQTT_BROKER = "broker.mqttdashboard.com" 
 MQTT_INTRUSION_TOPIC = "security-alerts"
@@ -46,9 +44,9 @@ class IntrusionDetectionSystem:
             }
         }
         
-        # Initialisation OpenCV pour détection de personnes
-        self.hog = cv2.HOGDescriptor()
-        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        # Détecteur de personnes OpenCV, construit au premier usage caméra
+        # (le mode simulation n'a jamais besoin de charger cv2)
+        self._hog = None
         
         # MQTT client pour alertes
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "intrusion_detector")
@@ -59,11 +57,22 @@ class IntrusionDetectionSystem:
         self.last_detection = {}
         self.detection_cooldown = 10  # 10 secondes entre détections
         
+    @property
+    def hog(self):
+        """Détecteur HOG de personnes (charge OpenCV au premier accès)"""
+        if self._hog is None:
+            import cv2
+            hog = cv2.HOGDescriptor()
+            hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+            self._hog = hog
+        return self._hog
+
     def on_connect(self, client, userdata, flags, rc):
         print(f"🔐 Système de détection connecté au MQTT (rc={rc})")
     
     def detect_intrusion_camera(self, zone_id):
         """Détection d'intrusion par caméra pour une zone"""
+        import cv2
         zone = self.zones[zone_id]
         camera_id = zone["camera_id"]
         
@@ -244,7 +253,9 @@ class IntrusionDetectionSystem:
             self.detection_running = False
             self.client.loop_stop()
             self.client.disconnect()
-            cv2.destroyAllWindows()
+            if self._hog is not None:
+                import cv2
+                cv2.destroyAllWindows()
 
 def install_opencv_if_needed():
     """Installer OpenCV si nécessaire"""
@@ -261,10 +272,6 @@ def install_opencv_if_needed():
 def main():
     print("🔐 Initialisation du système de détection d'intrusion...")
     
-    if not install_opencv_if_needed():
-        print("⚠️  OpenCV requis pour la détection d'intrusion")
-        return
-    
     print("🎮 Options:")
     print("1. 🚀 Lancer détection complète (avec caméra)")
     print("2. 🧪 Mode test (simulation uniquement)")
@@ -273,6 +280,10 @@ def main():
     choice = input("\nChoisissez une option (1-3): ").strip()
     
     if choice == "1":
+        # OpenCV n'est requis (et chargé) que pour la surveillance caméra
+        if not install_opencv_if_needed():
+            print("⚠️  OpenCV requis pour la détection d'intrusion")
+            return
         print("🚀 Lancement du système complet...")
         detector = IntrusionDetectionSystem()
         detector.start_detection_system()
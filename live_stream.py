@@ -0,0 +1,190 @@
+"""
+Live event stream for the web dashboard (Server-Sent Events)
+Fans out sensor readings, irrigation events and security alerts received over
+MQTT to every browser connected to /api/stream.
+
+All clients share one ring buffer of recent events and wait on a single
+condition variable, each keeping only its own cursor (the last event id it
+sent). An open stream holds its request thread (a greenlet under the
+gevent worker, the gunicorn.conf.py default) until the client leaves, so
+each worker admits at most STREAM_MAX_CLIENTS streams and answers 503
+above that; gunicorn.conf.py sets it from the worker class so that
+thread-based workers always keep a thread free for regular requests. A
+client that went away is only noticed when a write to it fails, so its
+slot is released within two heartbeats.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+MQTT_BROKER = "broker.mqttdashboard.com"
+MQTT_SENSOR_TOPIC = "wokwi-weather"
+MQTT_EVENTS_TOPIC = "irrigation-events"
+MQTT_INTRUSION_TOPIC = "security-alerts"
+MQTT_ANOMALY_TOPIC = "sensor-anomalies"
+
+# SSE event name sent to the browser for each MQTT topic
+TOPIC_EVENT_TYPES = {
+    MQTT_SENSOR_TOPIC: "reading",
+    MQTT_EVENTS_TOPIC: "irrigation",
+    MQTT_INTRUSION_TOPIC: "alert",
+    MQTT_ANOMALY_TOPIC: "anomaly",
+}
+
+HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments
+RETRY_MS = 3000  # reconnection delay suggested to EventSource clients
+
+# Open streams admitted per worker process
+STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', 100))
+
+
+class StreamSlots:
+    """Counter of open streams, bounded per process"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._open = 0
+        self._lock = threading.Lock()
+
+    @property
+    def open(self):
+        return self._open
+
+    def acquire(self):
+        """Take a slot; False when all are in use"""
+        with self._lock:
+            if self._open >= self.limit:
+                return False
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._open -= 1
+
+
+class EventBroker:
+    """In-process publish/subscribe hub backed by a bounded ring buffer"""
+
+    def __init__(self, history=1000):
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data):
+        """Append an event and wake up every waiting client"""
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, data))
+            self._cond.notify_all()
+            return self._last_id
+
+    def _events_after(self, last_id):
+        # Events are stored in id order, so walk back from the newest one
+        pending = []
+        for event in reversed(self._events):
+            if event[0] <= last_id:
+                break
+            pending.append(event)
+        pending.reverse()
+        return pending
+
+    def wait_for_events(self, last_id, timeout):
+        """Return events newer than last_id, blocking up to timeout seconds"""
+        with self._cond:
+            if self._last_id <= last_id:
+                self._cond.wait(timeout)
+            return self._events_after(last_id)
+
+
+class EventFilter:
+    """Client-side selection of events by sensor, zone and event type"""
+
+    def __init__(self, sensors=None, zones=None, types=None):
+        self.sensors = set(sensors or [])
+        self.zones = set(zones or [])
+        self.types = set(types or [])
+
+    def matches(self, event_type, data):
+        if self.types and event_type not in self.types:
+            return False
+        if not self.sensors and not self.zones:
+            return True
+        return (data.get("sensor_id") in self.sensors
+                or data.get("zone_id") in self.zones)
+
+
+def format_sse(event_id, event_type, data):
+    """Serialize one event in the text/event-stream wire format"""
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_events(broker, event_filter, last_id=None, heartbeat=HEARTBEAT_INTERVAL):
+    """Generator yielding SSE frames for one client until it disconnects"""
+    if last_id is None or last_id > broker.last_id:
+        # New client, or an id handed out before this process restarted
+        last_id = broker.last_id
+    yield f"retry: {RETRY_MS}\n\n"
+    while True:
+        events = broker.wait_for_events(last_id, heartbeat)
+        if not events:
+            yield ": keep-alive\n\n"
+            continue
+        for event_id, event_type, data in events:
+            last_id = event_id
+            if event_filter.matches(event_type, data):
+                yield format_sse(event_id, event_type, data)
+
+
+broker = EventBroker()
+stream_slots = StreamSlots(STREAM_MAX_CLIENTS)
+
+_feed_lock = threading.Lock()
+_feed_client = None
+_feed_pid = None
+
+
+def _on_connect(client, userdata, flags, rc):
+    print(f"Live stream feed connected with result code {rc}")
+    for topic in TOPIC_EVENT_TYPES:
+        client.subscribe(topic)
+
+
+def _on_message(client, userdata, msg):
+    try:
+        data = json.loads(msg.payload.decode())
+    except (UnicodeDecodeError, ValueError) as e:
+        print(f"Live stream feed ignored malformed message on {msg.topic}: {e}")
+        return
+    if not isinstance(data, dict):
+        data = {"value": data}
+    data.setdefault("received_at", time.time())
+    broker.publish(TOPIC_EVENT_TYPES[msg.topic], data)
+
+
+def start_mqtt_feed(broker_host=MQTT_BROKER):
+    """Subscribe this process to the MQTT topics feeding the stream.
+
+    Called lazily on the first /api/stream request. Safe to call repeatedly;
+    a forked worker gets its own connection instead of the parent's socket.
+    """
+    global _feed_client, _feed_pid
+    with _feed_lock:
+        if _feed_client is not None and _feed_pid == os.getpid():
+            return _feed_client
+        import paho.mqtt.client as mqtt
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+        client.on_connect = _on_connect
+        client.on_message = _on_message
+        client.connect_async(broker_host, 1883, 60)
+        client.loop_start()
+        _feed_client = client
+        _feed_pid = os.getpid()
+        return client
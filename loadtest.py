@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Load test for the production dashboard server
+Starts gunicorn (gunicorn.conf.py) with an increasing number of workers and
+reports requests/s and latency percentiles for the main endpoints.
+
+Usage:
+    python loadtest.py --workers 1 2 4 --duration 10 --concurrency 16
+"""
+
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_ENDPOINTS = ['/', '/api/sensors', '/api/irrigation/status']
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def wait_for_server(host, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/api/sensors')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_client(host, port, path, stop_at, latencies, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {'Accept-Encoding': 'gzip'}
+    while time.time() < stop_at:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def load_endpoint(host, port, path, duration, concurrency):
+    latencies = []
+    errors = []
+    stop_at = time.time() + duration
+    threads = [threading.Thread(target=run_client,
+                                args=(host, port, path, stop_at, latencies, errors))
+               for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': len(errors),
+    }
+
+
+def start_server(workers, port, worker_class):
+    env = dict(os.environ,
+               WEB_WORKERS=str(workers),
+               WEB_BIND=f'127.0.0.1:{port}',
+               WEB_WORKER_CLASS=worker_class)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--endpoints', nargs='+', default=DEFAULT_ENDPOINTS)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--worker-class', default='gthread')
+    args = parser.parse_args()
+
+    host = '127.0.0.1'
+    results = []
+    for workers in args.workers:
+        print(f"Starting gunicorn with {workers} worker(s)...")
+        server = start_server(workers, args.port, args.worker_class)
+        try:
+            if not wait_for_server(host, args.port):
+                print("❌ Server did not start")
+                continue
+            for path in args.endpoints:
+                # Warm caches and per-worker connections before measuring
+                load_endpoint(host, args.port, path, 1, args.concurrency)
+                stats = load_endpoint(host, args.port, path, args.duration, args.concurrency)
+                results.append((workers, path, stats))
+                print(f"  {path:<28} {stats['rps']:>9.1f} req/s  p99 {stats['p99_ms']:>8.1f} ms")
+        finally:
+            server.terminate()
+            server.wait()
+
+    print("\n" + "=" * 78)
+    print(f"{'workers':>7}  {'endpoint':<28} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    print("=" * 78)
+    for workers, path, stats in results:
+        print(f"{workers:>7}  {path:<28} {stats['rps']:>9.1f} {stats['p50_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Lazy, fork-safe MQTT publisher for the web dashboard
+The connection is only opened on the first publish in each process, so
+importing app.py never touches the network and every forked WSGI worker gets
+its own socket instead of a broken copy of its parent's.
+
+Messages go through a bounded outbound queue drained by a sender thread that
+waits for the broker connection; paho's network loop reconnects with
+exponential backoff whenever the broker drops, and queued commands are sent
+once it is back.
+"""
+
+import os
+import threading
+from collections import deque
+
+
+class PublishQueueFull(Exception):
+    """Raised when the outbound queue is full (broker unreachable for too long)"""
+
+
+class LazyPublisher:
+    def __init__(self, broker, port=1883, client_id="publisher", max_queue=100,
+                 keepalive=60, min_reconnect_delay=1, max_reconnect_delay=30):
+        self.broker = broker
+        self.port = port
+        self.client_id = client_id
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._connected = False
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        with self._cond:
+            self._connected = rc == 0
+            self._cond.notify_all()
+        print(f"Control publisher connected with result code {rc}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._cond:
+            self._connected = False
+        print(f"Control publisher disconnected with result code {rc}, reconnecting...")
+
+    def _start(self):
+        """Create this process's client, network loop and sender thread"""
+        import paho.mqtt.client as mqtt
+        # Inherited state from a parent process is unusable after fork
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._connected = False
+
+        # Broker sessions are keyed by client id, so make it unique per worker
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"{self.client_id}-{os.getpid()}")
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.reconnect_delay_set(self.min_reconnect_delay, self.max_reconnect_delay)
+        client.connect_async(self.broker, self.port, self.keepalive)
+        client.loop_start()
+
+        self._client = client
+        self._pid = os.getpid()
+        threading.Thread(target=self._sender, daemon=True).start()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+
+    def _sender(self):
+        import paho.mqtt.client as mqtt
+        while True:
+            with self._cond:
+                while not (self._queue and self._connected):
+                    self._cond.wait()
+                topic, payload, qos = self._queue[0]
+            info = self._client.publish(topic, payload, qos=qos)
+            with self._cond:
+                if info.rc == mqtt.MQTT_ERR_NO_CONN:
+                    # Connection dropped between the check and the publish:
+                    # keep the message at the head and wait for the reconnect
+                    self._connected = False
+                    continue
+                self._queue.popleft()
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                print(f"Control publisher dropped message on {topic}: {mqtt.error_string(info.rc)}")
+
+    def publish(self, topic, payload, qos=0):
+        """Queue a message for delivery; raises PublishQueueFull when saturated"""
+        self._ensure_started()
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise PublishQueueFull(
+                    f"{len(self._queue)} messages waiting for {self.broker}")
+            self._queue.append((topic, payload, qos))
+            self._cond.notify_all()
@@ -0,0 +1,303 @@
+"""
+Per-request timing and on-demand profiling for the web dashboard
+Views mark their phases with ``phase()``; each response then carries a
+``Server-Timing`` header (shown in the browser devtools' Timing tab) and the
+durations are aggregated into per-route, per-phase histograms.
+
+    with profiling.phase('db'):
+        df = get_data()
+
+Phases recorded automatically: ``template`` (Jinja rendering), ``serialize``
+(JSON encoding) and ``total``. Time not covered by any phase is reported as
+``other``.
+
+With capture enabled, a single request can be profiled by adding
+``?_profile=cprofile`` (deterministic, top functions by cumulative time) or
+``?_profile=sample`` (stack sampling every ``_interval`` ms, default 1, as
+collapsed stacks for flame graph tools); the report replaces the response
+body. ``/debug/timings`` returns the histograms of the current process.
+
+Configuration (Flask ``app.config``):
+    PROFILING_CAPTURE   allow ?_profile= and /debug/timings (default: when the
+                        WEB_PROFILING environment variable is "1" or in debug mode)
+"""
+
+import _thread
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import (Response, abort, before_render_template, g, has_request_context, jsonify,
+                   request, template_rendered)
+from flask.json.provider import DefaultJSONProvider
+
+# Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def phase(name):
+    """Time a block as one phase of the current request (no-op outside one)"""
+    if not has_request_context() or 'phases' not in g:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.phases[name] = g.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+class _Histogram:
+    __slots__ = ('count', 'total', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile"""
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else None
+        return None
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else None,
+            'p50_ms': self.quantile(0.50),
+            'p90_ms': self.quantile(0.90),
+            'p99_ms': self.quantile(0.99),
+            'buckets': {f"le_{bound}" if i < len(BUCKETS_MS) else 'inf': count
+                        for i, (bound, count) in enumerate(zip(BUCKETS_MS + (None,), self.buckets))},
+        }
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing jsonify() as the ``serialize`` phase"""
+
+    def response(self, *args, **kwargs):
+        with phase('serialize'):
+            return super().response(*args, **kwargs)
+
+
+class _Sampler:
+    """Samples one request's Python stack at a fixed interval.
+
+    Runs in its own OS thread. Under gevent, where requests are greenlets
+    sharing a thread, it samples the request's greenlet: its own frame
+    while it is suspended (time spent waiting is sampled too), the
+    thread's current frame while it runs.
+    """
+
+    def __init__(self, interval):
+        """Sampler of the calling request"""
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = False
+        self._greenlet = None
+        self._sleep = time.sleep
+        self._start_new_thread = _thread.start_new_thread
+        allocate_lock = _thread.allocate_lock
+        get_ident = _thread.get_ident
+        if 'gevent' in sys.modules:
+            from gevent import monkey
+            if monkey.is_module_patched('threading'):
+                import greenlet
+                self._greenlet = greenlet.getcurrent()
+                self._sleep = monkey.get_original('time', 'sleep')
+                self._start_new_thread = monkey.get_original('_thread', 'start_new_thread')
+                allocate_lock = monkey.get_original('_thread', 'allocate_lock')
+                # The patched get_ident is the greenlet's
+                get_ident = monkey.get_original('_thread', 'get_ident')
+        self.thread_id = get_ident()
+        # Held while the sampling thread runs
+        self._running = allocate_lock()
+
+    def _frame(self):
+        if self._greenlet is not None and self._greenlet.gr_frame is not None:
+            return self._greenlet.gr_frame
+        return sys._current_frames().get(self.thread_id)
+
+    def _run(self):
+        try:
+            while True:
+                self._sleep(self.interval)
+                if self._stopped:
+                    break
+                frame = self._frame()
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+        finally:
+            self._running.release()
+
+    def start(self):
+        self._running.acquire()
+        self._start_new_thread(self._run, ())
+
+    def stop(self):
+        self._stopped = True
+        # Blocks for one interval at most
+        self._running.acquire()
+        self._running.release()
+
+    def report(self):
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """Phase timing middleware with histograms and on-demand capture"""
+
+    def __init__(self, app=None):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILING_CAPTURE', None)
+        app.json = _TimedJSONProvider(app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.add_url_rule('/debug/timings', 'debug_timings', self.timings_view)
+        self.app = app
+
+    # Template rendering has no single call site to wrap: use Flask's signals
+    @staticmethod
+    def _template_started(sender, template, context, **extra):
+        if 'phases' in g:
+            g.template_started = time.perf_counter()
+
+    @staticmethod
+    def _template_finished(sender, template, context, **extra):
+        started = g.pop('template_started', None)
+        if started is not None:
+            g.phases['template'] = g.phases.get('template', 0.0) + time.perf_counter() - started
+
+    def capture_allowed(self):
+        allowed = self.app.config['PROFILING_CAPTURE']
+        if allowed is None:
+            # Decided per request: debug mode is usually set after import
+            return os.environ.get('WEB_PROFILING') == '1' or self.app.debug
+        return allowed
+
+    def _before_request(self):
+        g.phases = {}
+        g.request_started = time.perf_counter()
+
+        mode = request.args.get('_profile')
+        if mode is None or not self.capture_allowed():
+            return None
+        if mode not in ('cprofile', 'sample'):
+            return jsonify({'error': "_profile must be 'cprofile' or 'sample'"}), 400
+        # Only one profiler can be active per interpreter
+        if not _profile_lock.acquire(blocking=False):
+            return jsonify({'error': 'another request is being profiled'}), 409
+        if mode == 'cprofile':
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+        else:
+            interval = request.args.get('_interval', 1.0, type=float)
+            g.profiler = _Sampler(max(interval, 0.1) / 1000)
+            g.profiler.start()
+        return None
+
+    @staticmethod
+    def _stop_profiler(profiler):
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+        _profile_lock.release()
+
+    def _profile_report(self, profiler, response):
+        self._stop_profiler(profiler)
+        if isinstance(profiler, cProfile.Profile):
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(60)
+            report = out.getvalue()
+        else:
+            report = profiler.report()
+        profiled = Response(report, mimetype='text/plain')
+        profiled.headers['X-Profiled-Status'] = str(response.status_code)
+        return profiled
+
+    def _after_request(self, response):
+        if 'phases' not in g:
+            return response
+        profiler = g.pop('profiler', None)
+        total = time.perf_counter() - g.request_started
+        phases = dict(g.phases)
+        phases['other'] = max(total - sum(phases.values()), 0.0)
+        phases['total'] = total
+
+        timing = ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items())
+        if profiler is not None:
+            response = self._profile_report(profiler, response)
+        response.headers['Server-Timing'] = timing
+
+        route = request.endpoint or 'unknown'
+        with self._lock:
+            for name, seconds in phases.items():
+                histogram = self._histograms.get((route, name))
+                if histogram is None:
+                    histogram = self._histograms[(route, name)] = _Histogram()
+                histogram.add(seconds * 1000)
+        return response
+
+    def _teardown_request(self, exc):
+        # The view raised before after_request could stop the capture
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            self._stop_profiler(profiler)
+
+    def snapshot(self):
+        """Histograms of this process as {route: {phase: summary}}"""
+        routes = {}
+        with self._lock:
+            for (route, name), histogram in sorted(self._histograms.items()):
+                routes.setdefault(route, {})[name] = histogram.to_dict()
+        return routes
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def timings_view(self):
+        """Aggregated phase histograms (per worker process)"""
+        if not self.capture_allowed():
+            abort(404)
+        if request.args.get('reset'):
+            self.reset()
+        return jsonify({'pid': os.getpid(), 'routes': self.snapshot()})
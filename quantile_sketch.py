@@ -0,0 +1,379 @@
+"""
+Mergeable quantile sketches of sensor readings
+A QuantileSketch keeps counts in logarithmically sized buckets (the
+DDSketch scheme): a value x > 0 goes to bucket ceil(log(x) / log(gamma))
+with gamma = (1 + a) / (1 - a), negative values to a mirrored set of
+buckets and values closer to 0 than MIN_VALUE to a zero bucket.
+
+Error bound: for any q, quantile(q) is within a relative error of
+a = RELATIVE_ACCURACY (0.5 %) of the exact reading of rank
+floor(q * (count - 1)) - e.g. +-0.25 %RH at 50 %RH, +-0.1 C at 20 C -
+whatever the distribution and the number of readings. Merging two
+sketches adds bucket counts, so a merged sketch is exactly the sketch of
+all their readings and the bound holds for any merge of sensors, zones
+or hours.
+
+The quantile_sketches table holds one serialized sketch per metric for
+every (sensor, zone, UTC hour). refresh() folds readings added since the
+last processed sensor_data id. The MQTT subscribers run it from a
+background thread every QUANTILE_REFRESH_SECONDS (start_refresher()), off
+the per-message insert path, and readers call ensure_fresh() like the
+rollups to fold in whatever arrived since.
+"""
+
+import math
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+import db
+import rollups
+
+METRICS = rollups.METRICS
+
+RELATIVE_ACCURACY = 0.005
+# Values with a smaller magnitude are counted as 0
+MIN_VALUE = 1e-6
+
+STATE_NAME = 'quantile_sketches'
+CHUNK_ROWS = 50000
+
+# Seconds between two background refreshes in the subscribers
+REFRESH_INTERVAL = float(os.environ.get('QUANTILE_REFRESH_SECONDS', 10))
+
+# Hour of readings without a usable timestamp (all-time queries only)
+NO_HOUR = -1
+
+GROUP_BY = {
+    'sensor': "NULLIF(q.sensor_id, '')",
+    'zone': "NULLIF(q.zone_id, '')",
+    'type': 's.sensor_type',
+    'all': "''",
+}
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_VERSION = 1
+# version, count, zero count, min, max, positive buckets, negative buckets
+_HEADER = struct.Struct('<BqqddII')
+_INDEX = np.dtype('<i2')
+_COUNT = np.dtype('<u4')
+
+_tables_ready = False
+
+
+def _bucket_value(index):
+    # Centre of (gamma^(i-1), gamma^i] in relative terms: at most a away from any value in it
+    return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch; mergeable and serializable"""
+
+    __slots__ = ('positive', 'negative', 'zero', 'count', 'min', 'max')
+
+    def __init__(self):
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value is None or math.isnan(value):
+            return self
+        if value > MIN_VALUE:
+            index = math.ceil(math.log(value) / _LOG_GAMMA)
+            self.positive[index] = self.positive.get(index, 0) + 1
+        elif value < -MIN_VALUE:
+            index = math.ceil(math.log(-value) / _LOG_GAMMA)
+            self.negative[index] = self.negative.get(index, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def add_many(self, values):
+        """Add an array of values (NaN ignored)"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        for store, selected in ((self.positive, values[values > MIN_VALUE]),
+                                (self.negative, -values[values < -MIN_VALUE])):
+            if len(selected):
+                indexes, counts = np.unique(np.ceil(np.log(selected) / _LOG_GAMMA).astype(np.int64),
+                                            return_counts=True)
+                for index, count in zip(indexes.tolist(), counts.tolist()):
+                    store[index] = store.get(index, 0) + count
+        self.zero += int(np.count_nonzero(np.abs(values) <= MIN_VALUE))
+        self.count += len(values)
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        return self
+
+    def merge(self, other):
+        """Fold in another sketch; returns self"""
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Value at quantile q in [0, 1] (within RELATIVE_ACCURACY), None if empty"""
+        if not self.count:
+            return None
+        if not 0 <= q <= 1:
+            raise ValueError("quantiles must be between 0 and 1")
+        rank = int(q * (self.count - 1))
+        return min(self.max, max(self.min, self._rank_value(rank)))
+
+    def _rank_value(self, rank):
+        seen = 0
+        # Ascending values: most negative first, then zero, then positive
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -_bucket_value(index)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return _bucket_value(index)
+        return self.max
+
+    def to_bytes(self):
+        positive = sorted(self.positive.items())
+        negative = sorted(self.negative.items())
+        parts = [_HEADER.pack(_VERSION, self.count, self.zero,
+                              math.nan if self.min is None else self.min,
+                              math.nan if self.max is None else self.max,
+                              len(positive), len(negative))]
+        for items in (positive, negative):
+            parts.append(np.array([index for index, _ in items], dtype=_INDEX).tobytes())
+            parts.append(np.array([count for _, count in items], dtype=_COUNT).tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls()
+        version, sketch.count, sketch.zero, low, high, n_positive, n_negative = \
+            _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"unknown sketch format version {version}")
+        sketch.min = None if math.isnan(low) else low
+        sketch.max = None if math.isnan(high) else high
+        offset = _HEADER.size
+        for store, size in ((sketch.positive, n_positive), (sketch.negative, n_negative)):
+            indexes = np.frombuffer(data, _INDEX, size, offset)
+            offset += size * _INDEX.itemsize
+            counts = np.frombuffer(data, _COUNT, size, offset)
+            offset += size * _COUNT.itemsize
+            store.update(zip(indexes.tolist(), counts.tolist()))
+        return sketch
+
+
+def create_tables(cursor):
+    """Create the sketch and state tables (idempotent)"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS quantile_sketches (
+            sensor_id TEXT NOT NULL,
+            zone_id TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            {', '.join(f'{m} BLOB' for m in METRICS)},
+            PRIMARY KEY (sensor_id, zone_id, hour)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quantile_sketches_hour
+        ON quantile_sketches (hour)
+    ''')
+    rollups.create_rollup_tables(cursor)
+
+
+def _flush(conn, groups):
+    """Merge {key: [values per metric]} into the stored sketches"""
+    rows = []
+    for key, values in groups.items():
+        stored = conn.execute(f'''
+            SELECT {', '.join(METRICS)} FROM quantile_sketches
+            WHERE sensor_id = ? AND zone_id = ? AND hour = ?
+        ''', key).fetchone() or (None,) * len(METRICS)
+        blobs = []
+        for blob, metric_values in zip(stored, values):
+            sketch = QuantileSketch.from_bytes(blob) if blob is not None else QuantileSketch()
+            if len(metric_values) > 16:
+                sketch.add_many(metric_values)
+            else:
+                for value in metric_values:
+                    sketch.add(value)
+            blobs.append(sketch.to_bytes() if sketch.count else None)
+        rows.append((*key, *blobs))
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO quantile_sketches (sensor_id, zone_id, hour, {', '.join(METRICS)})
+        VALUES ({', '.join('?' * (3 + len(METRICS)))})
+    ''', rows)
+
+
+def refresh(conn=None, name=STATE_NAME, chunk_rows=CHUNK_ROWS):
+    """Fold readings added since the last refresh into the sketches.
+
+    Returns the number of new sensor_data ids processed.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = db.connect()
+    try:
+        # Same locking as rollups.refresh: concurrent refreshers serialize
+        conn.execute("BEGIN IMMEDIATE")
+        create_tables(conn.cursor())
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE name = ?", (name,)).fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+        if max_id <= last_id:
+            conn.rollback()
+            return 0
+
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sensor_data)")}
+        zone = "COALESCE(zone_id, '')" if 'zone_id' in columns else "''"
+        cursor = conn.execute(f'''
+            SELECT COALESCE(sensor_id, ''), {zone}, COALESCE(({rollups.EPOCH_SQL}) / 3600, {NO_HOUR}),
+                   {', '.join(METRICS)}
+            FROM sensor_data
+            WHERE id > ? AND id <= ?
+        ''', (last_id, max_id))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            # Readings arrive roughly in time order, so a chunk's hours are
+            # rarely touched again by the next one: flush per chunk
+            groups = {}
+            for row in rows:
+                values = groups.setdefault(row[:3], tuple([] for _ in METRICS))
+                for metric_values, value in zip(values, row[3:]):
+                    if value is not None:
+                        metric_values.append(value)
+            _flush(conn, groups)
+
+        conn.execute("INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES (?, ?)",
+                     (name, max_id))
+        conn.commit()
+        return max_id - last_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def _pending(conn):
+    """Whether sensor_data has grown since the last refresh (no write lock)"""
+    row = conn.execute('''
+        SELECT (SELECT MAX(id) FROM sensor_data),
+               (SELECT last_id FROM rollup_state WHERE name = ?)
+    ''', (STATE_NAME,)).fetchone()
+    return (row[0] or 0) > (row[1] or 0)
+
+
+def ensure_fresh():
+    """Refresh the sketches if sensor_data has grown since the last refresh"""
+    global _tables_ready
+    if not _tables_ready:
+        conn = db.connect()
+        create_tables(conn.cursor())
+        conn.commit()
+        conn.close()
+        _tables_ready = True
+
+    if _pending(db.get_connection()):
+        refresh()
+
+
+def _refresh_loop(database, interval):
+    conn = db.connect(database=database)
+    try:
+        create_tables(conn.cursor())
+        conn.commit()
+        while True:
+            time.sleep(interval)
+            try:
+                if _pending(conn):
+                    refresh(conn)
+            except Exception as e:
+                print(f"Quantile sketch refresh failed: {e}")
+    finally:
+        conn.close()
+
+
+def start_refresher(database=None, interval=REFRESH_INTERVAL):
+    """Fold new readings into the sketches every interval seconds, in a
+    daemon thread; one write transaction per interval instead of per insert"""
+    thread = threading.Thread(target=_refresh_loop, args=(database, interval),
+                              name='quantile-sketch-refresh', daemon=True)
+    thread.start()
+    return thread
+
+
+def query_sketches(group_by='zone', metric='humidity', start=None, end=None, sensors=None, conn=None):
+    """{group: merged QuantileSketch} of one metric over [start, end) epoch seconds.
+
+    Windows are resolved at hour granularity.
+    """
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    conn = conn or db.get_connection()
+
+    where = [f'q.{metric} IS NOT NULL']
+    params = []
+    if start is not None or end is not None:
+        where.append('q.hour >= ?')
+        params.append(0 if start is None else int(start // 3600))
+        if end is not None:
+            where.append('q.hour < ?')
+            params.append(int(math.ceil(end / 3600)))
+    if sensors:
+        where.append(f"q.sensor_id IN ({', '.join('?' * len(sensors))})")
+        params.extend(sensors)
+
+    groups = {}
+    for key, blob in conn.execute(f'''
+        SELECT {GROUP_BY[group_by]}, q.{metric}
+        FROM quantile_sketches q
+        LEFT JOIN sensors s ON q.sensor_id = s.sensor_id
+        WHERE {' AND '.join(where)}
+    ''', params):
+        groups.setdefault(key, QuantileSketch()).merge(QuantileSketch.from_bytes(blob))
+    return groups
+
+
+def query_quantiles(quantiles=(0.05, 0.5, 0.95), **kwargs):
+    """Quantiles per group, as [{'key', 'count', 'min', 'max', 'quantiles'}]"""
+    for q in quantiles:
+        if not 0 <= q <= 1:
+            raise ValueError("quantiles must be between 0 and 1")
+    groups = query_sketches(**kwargs)
+    return [{
+        'key': key,
+        'count': sketch.count,
+        'min': sketch.min,
+        'max': sketch.max,
+        'quantiles': {f"p{q * 100:g}": sketch.quantile(q) for q in quantiles},
+    } for key, sketch in sorted(groups.items(), key=lambda item: (item[0] is None, str(item[0])))]
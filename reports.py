@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Headless batch generation of dashboard reports
+Renders the graphiques_donnees multi-sensor dashboard without a display for
+a date range, as one report per sensor, per zone and for the whole fleet,
+into an output directory (PNG or PDF). Reports are rendered in parallel on
+a process pool; each worker loads only its own report's rows.
+
+A manifest in the output directory records a fingerprint of every report's
+inputs: row count and highest id of its readings in the range, the metadata
+of the sensors it covers and the render options. Reports whose fingerprint
+and file are unchanged since the last run are skipped (--force renders
+everything).
+
+Usage:
+    python reports.py --out reports
+    python reports.py --from 2026-01-01 --to 2026-02-01 --format pdf --scope sensor zone
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import data_loader
+import db
+import rollups
+
+# Bump when the report layout changes, to re-render every report once
+REPORT_VERSION = 1
+
+SCOPES = ('sensor', 'zone', 'fleet')
+FORMATS = ('png', 'pdf')
+MANIFEST = 'manifest.json'
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class Report:
+    """One report: the rows it covers and where it is written"""
+
+    def __init__(self, scope, key=None):
+        self.scope = scope
+        self.key = key
+        self.rows = 0
+        self.fingerprint = None
+
+    @property
+    def name(self):
+        if self.scope == 'fleet':
+            return 'fleet'
+        return f"{self.scope}-{_UNSAFE.sub('_', str(self.key))}"
+
+    @property
+    def title(self):
+        if self.scope == 'fleet':
+            return 'Fleet report - all sensors'
+        return f"{self.scope.capitalize()} report - {self.key}"
+
+    def where(self, start=None, end=None):
+        """SQL condition and parameters selecting the report's readings"""
+        where = []
+        params = []
+        if self.scope != 'fleet':
+            where.append(f"{self.scope}_id = ?")
+            params.append(self.key)
+        if start is not None:
+            where.append(f'({rollups.EPOCH_SQL}) >= ?')
+            params.append(start)
+        if end is not None:
+            where.append(f'({rollups.EPOCH_SQL}) < ?')
+            params.append(end)
+        return ' AND '.join(where) or None, params
+
+
+def _sensors_digest(metadata, sensor_ids):
+    """Digest of the metadata of the given sensors (None for unregistered ones)"""
+    covered = sorted((sensor_id, metadata.get(sensor_id))
+                     for sensor_id in sensor_ids if sensor_id is not None)
+    return hashlib.sha1(json.dumps(covered).encode()).hexdigest()[:16]
+
+
+def plan_reports(conn, scopes, start=None, end=None, options=()):
+    """Every report of the given scopes with data in the range, fingerprinted"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sensor_data)")}
+    window, params = Report('fleet').where(start, end)
+    window = f"WHERE {window}" if window else ''
+    if 'zone' in scopes and 'zone_id' not in columns:
+        print("sensor_data has no zone_id column: no zone reports")
+        scopes = [scope for scope in scopes if scope != 'zone']
+
+    # The content of the covered sensors is fingerprinted, not the table's
+    # rowids: editing one sensor re-renders only the reports showing it
+    metadata = {row[0]: list(row[1:]) for row in conn.execute(
+        f"SELECT sensor_id, {', '.join(data_loader.SENSOR_COLUMNS)} FROM sensors")}
+
+    # One grouped query gives the rows, highest id and sensors of every report
+    zone = 'zone_id' if 'zone_id' in columns else 'NULL'
+    groups = conn.execute(f'''
+        SELECT sensor_id, {zone}, COUNT(*), MAX(id) FROM sensor_data {window}
+        GROUP BY sensor_id, {zone}
+    ''', params).fetchall()
+    totals = {}
+    for sensor_id, zone_id, count, max_id in groups:
+        for scope, key in (('sensor', sensor_id), ('zone', zone_id), ('fleet', None)):
+            if scope not in scopes or (scope != 'fleet' and key in (None, '')):
+                continue
+            total = totals.setdefault((scope, key), [0, max_id, set()])
+            total[0] += count
+            total[1] = max(total[1], max_id)
+            total[2].add(sensor_id)
+
+    reports = []
+    for scope in SCOPES:
+        keys = sorted((key for key_scope, key in totals if key_scope == scope), key=str)
+        for key in keys:
+            count, max_id, sensor_ids = totals[(scope, key)]
+            report = Report(scope, key)
+            report.rows = count
+            report.fingerprint = [REPORT_VERSION, count, max_id,
+                                  _sensors_digest(metadata, sensor_ids), *options]
+            reports.append(report)
+    return reports
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def render_report(database, report, path, fmt, start=None, end=None, dpi=100):
+    """Load one report's readings and write its dashboard; returns the row count"""
+    # matplotlib is only imported by the workers
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    import graphiques_donnees
+
+    conn = db.connect(readonly=True, database=database)
+    try:
+        where, params = report.where(start, end)
+        df = data_loader.load_data(conn, where=where, params=params)
+    finally:
+        conn.close()
+
+    fig = Figure(figsize=(16, 12))
+    FigureCanvasAgg(fig)
+    graphiques_donnees.draw_dashboard(fig, df, report.title)
+    # Write under a temporary name so that an interrupted run leaves no partial report
+    tmp = f"{path}.tmp"
+    fig.savefig(tmp, format=fmt, dpi=dpi)
+    os.replace(tmp, path)
+    return len(df)
+
+
+def generate(database, out_dir, scopes=SCOPES, start=None, end=None, fmt='png',
+             dpi=100, workers=None, force=False):
+    """Render the out-of-date reports; returns (rendered, skipped, failed) counts"""
+    os.makedirs(out_dir, exist_ok=True)
+    conn = db.connect(readonly=True, database=database)
+    try:
+        reports = plan_reports(conn, scopes, start, end, options=(start, end, fmt, dpi))
+    finally:
+        conn.close()
+
+    manifest = load_manifest(out_dir)
+    pending = []
+    for report in reports:
+        filename = f"{report.name}.{fmt}"
+        if (not force and manifest.get(filename) == report.fingerprint
+                and os.path.exists(os.path.join(out_dir, filename))):
+            continue
+        pending.append((report, filename))
+    skipped = len(reports) - len(pending)
+    # Largest first, so a big report doesn't start last and run alone
+    pending.sort(key=lambda item: item[0].rows, reverse=True)
+    print(f"{len(reports)} reports, {skipped} unchanged, {len(pending)} to render")
+
+    rendered = failed = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(render_report, database, report,
+                                   os.path.join(out_dir, filename), fmt, start, end, dpi):
+                       (report, filename) for report, filename in pending}
+            for future in as_completed(futures):
+                report, filename = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    failed += 1
+                    # Dropped from the manifest, so the next run retries it
+                    manifest.pop(filename, None)
+                    print(f"❌ {filename}: {e}")
+                    continue
+                rendered += 1
+                manifest[filename] = report.fingerprint
+                print(f"✅ {filename} ({rows} readings)")
+        save_manifest(out_dir, manifest)
+    return rendered, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=db.DATABASE)
+    parser.add_argument('--out', default='reports', help='output directory')
+    parser.add_argument('--from', dest='start', help='ISO date/time (UTC) or epoch seconds')
+    parser.add_argument('--to', dest='end', help='ISO date/time (UTC) or epoch seconds, exclusive')
+    parser.add_argument('--scope', nargs='+', default=list(SCOPES), choices=SCOPES)
+    parser.add_argument('--format', default='png', choices=FORMATS)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='render even unchanged reports')
+    args = parser.parse_args()
+
+    try:
+        start = rollups.parse_time(args.start)
+        end = rollups.parse_time(args.end)
+    except ValueError as e:
+        parser.error(f"invalid date: {e}")
+
+    started = time.perf_counter()
+    rendered, skipped, failed = generate(args.db, args.out, args.scope, start, end, args.format,
+                                         args.dpi, args.workers, args.force)
+    print(f"{rendered} rendered, {skipped} skipped, {failed} failed "
+          f"in {time.perf_counter() - started:.1f}s -> {args.out}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
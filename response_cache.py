@@ -0,0 +1,206 @@
+"""
+HTTP response layer for the Flask JSON endpoints
+Adds ETag validators derived from per-table data versions, answers
+conditional requests with 304, compresses large bodies (gzip, or
+brotli when the optional ``brotli`` package is installed) and keeps a
+short-TTL in-memory micro-cache so bursts of identical requests are served
+without touching SQLite.
+
+Usage:
+    cache = ResponseCache(app)
+
+    @app.route('/api/sensors')
+    @cache.cached(tables=('sensors', 'sensor_data'))
+    def api_sensors(): ...
+
+Configuration (Flask ``app.config``):
+    RESPONSE_CACHE_TTL      seconds a cached body is reused without even
+                            checking the data version (default 2, 0 disables)
+    RESPONSE_CACHE_SIZE     max number of cached URLs per process (default 256)
+    SHARED_CACHE_TTL        lifetime of bodies stored in the cross-worker
+                            cache, when one is given (default 300)
+    COMPRESS_MIN_SIZE       bodies smaller than this are sent uncompressed
+                            (default 1024 bytes)
+    COMPRESS_LEVEL          gzip level (default 6)
+"""
+
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+
+import db
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+
+def table_version(conn, tables):
+    """Version stamp of the given tables, built from their MAX(rowid).
+
+    Each lookup is O(log n). Rows in this project are only ever inserted or
+    upserted with INSERT OR REPLACE (which allocates a new rowid), so any
+    write the dashboard can observe moves the stamp.
+    """
+    parts = []
+    for table in tables:
+        row = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()
+        parts.append(str(row[0] or 0))
+    return '-'.join(parts)
+
+
+class _Entry:
+    __slots__ = ('version', 'etag', 'expires', 'body', 'mimetype', 'encoded')
+
+    def __init__(self, version, etag, expires, body, mimetype):
+        self.version = version
+        self.etag = etag
+        self.expires = expires
+        self.body = body
+        self.mimetype = mimetype
+        self.encoded = {}
+
+
+class ResponseCache:
+    """Conditional-request, compression and micro-caching layer"""
+
+    def __init__(self, app=None, shared=None):
+        # Optional second tier shared by all worker processes (shared_cache)
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.not_modified = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_TTL', 2)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 256)
+        app.config.setdefault('SHARED_CACHE_TTL', 300)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        self.app = app
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _current_version(self, tables):
+        return table_version(db.get_connection(), tables)
+
+    def _render(self, view, args, kwargs, shared_key):
+        """Run the view, or fetch its body from another worker's run"""
+        if self.shared is not None:
+            cached = self.shared.get(shared_key)
+            if cached is not None:
+                self.shared_hits += 1
+                return cached
+        response = self.app.make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        rendered = (response.get_data(), response.mimetype)
+        if self.shared is not None:
+            self.shared.set(shared_key, rendered, self.app.config['SHARED_CACHE_TTL'])
+        return rendered
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.app.config['RESPONSE_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+
+    def _encode(self, entry):
+        """Pick a content coding the client accepts and return (coding, body)"""
+        config = self.app.config
+        if len(entry.body) < config['COMPRESS_MIN_SIZE']:
+            return None, entry.body
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            coding = 'br'
+        elif accepted['gzip']:
+            coding = 'gzip'
+        else:
+            return None, entry.body
+        body = entry.encoded.get(coding)
+        if body is None:
+            if coding == 'br':
+                body = brotli.compress(entry.body)
+            else:
+                body = gzip.compress(entry.body, compresslevel=config['COMPRESS_LEVEL'])
+            entry.encoded[coding] = body
+        return coding, body
+
+    def _respond(self, entry):
+        response = Response(mimetype=entry.mimetype)
+        response.set_etag(entry.etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        if self._is_fresh_for_client(entry.etag):
+            self.not_modified += 1
+            response.status_code = 304
+            return response
+        coding, body = self._encode(entry)
+        if coding:
+            response.content_encoding = coding
+        response.set_data(body)
+        return response
+
+    @staticmethod
+    def _is_fresh_for_client(etag):
+        # No Last-Modified: the table versions carry no time, and a time
+        # each worker first saw a version differs between workers
+        return bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
+
+    def cached(self, tables):
+        """Decorate a view whose output depends only on the URL and the
+        contents of ``tables``"""
+        tables = tuple(tables)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = request.full_path
+                now = time.monotonic()
+                entry = self._entries.get(key)
+                if entry is not None and now < entry.expires:
+                    self.hits += 1
+                    return self._respond(entry)
+
+                version = self._current_version(tables)
+                ttl = self.app.config['RESPONSE_CACHE_TTL']
+                if entry is not None and entry.version == version:
+                    self.hits += 1
+                    entry.expires = now + ttl
+                    return self._respond(entry)
+
+                digest = hashlib.sha1(f"{key}|{version}".encode()).hexdigest()[:16]
+                etag = f"{request.endpoint}-{digest}"
+                if self._is_fresh_for_client(etag):
+                    # Client already holds this version: skip the view entirely
+                    self.not_modified += 1
+                    response = Response(status=304)
+                    response.set_etag(etag, weak=True)
+                    return response
+
+                self.misses += 1
+                rendered = self._render(view, args, kwargs, f"response|{key}|{version}")
+                if isinstance(rendered, Response):
+                    return rendered
+
+                body, mimetype = rendered
+                entry = _Entry(version, etag, now + ttl, body, mimetype)
+                if ttl > 0:
+                    self._store(key, entry)
+                return self._respond(entry)
+            return wrapper
+        return decorator
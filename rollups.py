@@ -0,0 +1,243 @@
+"""
+Incrementally maintained aggregate statistics for sensor_data
+Two rollup tables hold count / sum / sum of squares / min / max of
+temperature and humidity per (sensor, zone, location):
+
+    sensor_rollups_hourly   one row per key and UTC hour, for windowed queries
+    sensor_rollups_total    one row per key, for all-time queries
+
+Each refresh folds only the readings added since the last processed
+sensor_data id into both tables, inside one write transaction, so several
+web workers can refresh concurrently without double counting. Answering a
+stats query then costs O(keys x hours in window), independent of how many
+raw readings were stored.
+"""
+
+import math
+from datetime import datetime, timezone
+
+import db
+
+# Epoch seconds of a stored timestamp: SQLite CURRENT_TIMESTAMP text (UTC)
+# or the numeric epoch values written by upgrade_db_level4
+EPOCH_SQL = '''
+    CASE WHEN typeof(timestamp) IN ('integer', 'real') THEN CAST(timestamp AS INTEGER)
+         ELSE CAST(strftime('%s', timestamp) AS INTEGER) END
+'''
+
+METRICS = ('temperature', 'humidity')
+
+GROUP_BY = {
+    'sensor': "NULLIF(r.sensor_id, '')",
+    'type': 's.sensor_type',
+    'zone': "NULLIF(r.zone_id, '')",
+    'location': "COALESCE(NULLIF(r.location, ''), s.latitude || ',' || s.longitude)",
+}
+
+_AGGREGATE_COLUMNS = ''.join(f'''
+    {m}_count INTEGER NOT NULL DEFAULT 0,
+    {m}_sum REAL,
+    {m}_sumsq REAL,
+    {m}_min REAL,
+    {m}_max REAL,''' for m in METRICS)
+
+_tables_ready = False
+
+
+def create_rollup_tables(cursor):
+    """Create the rollup and state tables (idempotent)"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS sensor_rollups_hourly (
+            sensor_id TEXT NOT NULL,
+            zone_id TEXT NOT NULL,
+            location TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            readings INTEGER NOT NULL DEFAULT 0,{_AGGREGATE_COLUMNS}
+            PRIMARY KEY (sensor_id, zone_id, location, hour)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sensor_rollups_hourly_hour
+        ON sensor_rollups_hourly (hour)
+    ''')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS sensor_rollups_total (
+            sensor_id TEXT NOT NULL,
+            zone_id TEXT NOT NULL,
+            location TEXT NOT NULL,
+            readings INTEGER NOT NULL DEFAULT 0,{_AGGREGATE_COLUMNS}
+            PRIMARY KEY (sensor_id, zone_id, location)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+
+
+def _sensor_data_columns(conn):
+    return {row[1] for row in conn.execute("PRAGMA table_info(sensor_data)")}
+
+
+def _upsert_sql(table, key_columns, select_keys):
+    """INSERT ... SELECT aggregating a sensor_data id range, merged on conflict"""
+    select_metrics = ''.join(f''',
+            COUNT({m}), SUM({m}), SUM({m} * {m}), MIN({m}), MAX({m})''' for m in METRICS)
+    insert_metrics = ''.join(f', {m}_count, {m}_sum, {m}_sumsq, {m}_min, {m}_max' for m in METRICS)
+    merge_metrics = ''.join(f''',
+            {m}_count = {m}_count + excluded.{m}_count,
+            {m}_sum = COALESCE({m}_sum, 0) + COALESCE(excluded.{m}_sum, 0),
+            {m}_sumsq = COALESCE({m}_sumsq, 0) + COALESCE(excluded.{m}_sumsq, 0),
+            {m}_min = MIN(COALESCE({m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {m}_min)),
+            {m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max))'''
+                            for m in METRICS)
+    group = ', '.join(str(i + 1) for i in range(len(key_columns)))
+    return f'''
+        INSERT INTO {table} ({', '.join(key_columns)}, readings{insert_metrics})
+        SELECT {', '.join(select_keys)}, COUNT(*){select_metrics}
+        FROM sensor_data
+        WHERE id > ? AND id <= ?
+        GROUP BY {group}
+        ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET
+            readings = readings + excluded.readings{merge_metrics}
+    '''
+
+
+def refresh(conn=None, name='sensor_data'):
+    """Fold readings added since the last refresh into the rollups.
+
+    Returns the number of new sensor_data ids processed.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = db.connect()
+    try:
+        # IMMEDIATE takes the write lock up front: concurrent refreshers
+        # serialize here and each sees the previous one's last_id
+        conn.execute("BEGIN IMMEDIATE")
+        create_rollup_tables(conn.cursor())
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE name = ?", (name,)).fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+        if max_id <= last_id:
+            conn.rollback()
+            return 0
+
+        columns = _sensor_data_columns(conn)
+        zone = "COALESCE(zone_id, '')" if 'zone_id' in columns else "''"
+        location = "COALESCE(location, '')" if 'location' in columns else "''"
+        keys = ["COALESCE(sensor_id, '')", zone, location]
+
+        conn.execute(_upsert_sql('sensor_rollups_hourly',
+                                 ('sensor_id', 'zone_id', 'location', 'hour'),
+                                 keys + [f'({EPOCH_SQL}) / 3600']),
+                     (last_id, max_id))
+        conn.execute(_upsert_sql('sensor_rollups_total',
+                                 ('sensor_id', 'zone_id', 'location'), keys),
+                     (last_id, max_id))
+        conn.execute("INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES (?, ?)",
+                     (name, max_id))
+        conn.commit()
+        return max_id - last_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def ensure_fresh():
+    """Refresh the rollups if sensor_data has grown since the last refresh"""
+    global _tables_ready
+    if not _tables_ready:
+        conn = db.connect()
+        create_rollup_tables(conn.cursor())
+        conn.commit()
+        conn.close()
+        _tables_ready = True
+
+    conn = db.get_connection()
+    row = conn.execute('''
+        SELECT (SELECT MAX(id) FROM sensor_data),
+               (SELECT last_id FROM rollup_state WHERE name = 'sensor_data')
+    ''').fetchone()
+    if (row[0] or 0) > (row[1] or 0):
+        refresh()
+
+
+def parse_time(value):
+    """Parse an ISO 8601 date/time (naive = UTC) or epoch seconds"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _summary(count, total, sumsq, minimum, maximum):
+    if not count:
+        return {'count': 0, 'mean': None, 'min': None, 'max': None, 'std': None}
+    mean = total / count
+    std = None
+    if count > 1:
+        # Sample standard deviation (ddof=1), as pandas reports it
+        std = math.sqrt(max(sumsq - total * total / count, 0.0) / (count - 1))
+    return {'count': int(count), 'mean': mean, 'min': minimum, 'max': maximum, 'std': std}
+
+
+def query_stats(group_by='sensor', start=None, end=None, sensors=None, sensor_type=None, conn=None):
+    """Aggregate statistics per group over [start, end) epoch seconds.
+
+    Windows are resolved at hour granularity; without a window the all-time
+    totals table is used.
+    """
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+    conn = conn or db.get_connection()
+
+    where = []
+    params = []
+    if start is None and end is None:
+        table = 'sensor_rollups_total'
+    else:
+        table = 'sensor_rollups_hourly'
+        if start is not None:
+            where.append('r.hour >= ?')
+            params.append(int(start // 3600))
+        if end is not None:
+            where.append('r.hour < ?')
+            params.append(int(math.ceil(end / 3600)))
+    if sensors:
+        where.append(f"r.sensor_id IN ({', '.join('?' * len(sensors))})")
+        params.extend(sensors)
+    if sensor_type:
+        where.append('s.sensor_type = ?')
+        params.append(sensor_type)
+
+    metric_sums = ''.join(f''',
+            SUM(r.{m}_count), SUM(r.{m}_sum), SUM(r.{m}_sumsq), MIN(r.{m}_min), MAX(r.{m}_max)'''
+                          for m in METRICS)
+    rows = conn.execute(f'''
+        SELECT {GROUP_BY[group_by]} AS grp, SUM(r.readings){metric_sums}
+        FROM {table} r
+        LEFT JOIN sensors s ON r.sensor_id = s.sensor_id
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        GROUP BY grp
+        ORDER BY grp
+    ''', params).fetchall()
+
+    stats = []
+    for row in rows:
+        entry = {'key': row[0], 'count': int(row[1])}
+        for i, metric in enumerate(METRICS):
+            entry[metric] = _summary(*row[2 + 5 * i:7 + 5 * i])
+        stats.append(entry)
+    return stats
@@ -0,0 +1,270 @@
+"""
+Mergeable running aggregates of sensor readings (Welford)
+For every (sensor, UTC hour of day) partition, the running_stats table keeps
+the reading count and, per metric, count / mean / M2 / min / max, where M2
+is the sum of squared deviations from the mean (Welford's algorithm). Each
+refresh folds only the readings added since the last processed sensor_data
+id, so analyse_donnees no longer rescans the whole history.
+
+Two partial aggregates combine exactly (Chan et al. parallel update), so
+statistics per sensor, type, location or hour - and aggregates computed
+over separate partitions of the data - are obtained by merging:
+
+    a = RunningStats.of(values[:n]); b = RunningStats.of(values[n:])
+    a.merge(b)      # same count, mean, std, min, max as RunningStats.of(values)
+
+Sensor metadata is applied when partitions are grouped, not when readings
+are aggregated, so a sensor's current type and position always apply to
+all of its readings, as in the full recomputation.
+"""
+
+import math
+
+import numpy as np
+
+import data_loader
+import db
+import rollups
+
+METRICS = rollups.METRICS
+
+# Hour of day of readings without a usable timestamp
+NO_HOUR = -1
+
+STATE_NAME = 'running_stats'
+
+# sensor_data ids folded per pass of a refresh, bounding its memory
+CHUNK_IDS = 200000
+
+_STAT_COLUMNS = ('count', 'mean', 'm2', 'min', 'max')
+
+
+class RunningStats:
+    """count, mean, M2, min and max of a stream of values; mergeable"""
+
+    __slots__ = _STAT_COLUMNS
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=None, max=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    @classmethod
+    def of(cls, values):
+        """Aggregate of an array of values, NaN ignored"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls()
+        mean = values.mean()
+        return cls(len(values), float(mean), float(((values - mean) ** 2).sum()),
+                   float(values.min()), float(values.max()))
+
+    def add(self, value):
+        """Fold in one value (Welford's update)"""
+        if value is None or math.isnan(value):
+            return self
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def merge(self, other):
+        """Fold in another aggregate (Chan et al.); returns self"""
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1), as pandas reports it"""
+        if self.count < 2:
+            return None
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1))
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0, 'mean': None, 'min': None, 'max': None, 'std': None}
+        return {'count': self.count, 'mean': self.mean, 'min': self.min, 'max': self.max,
+                'std': self.std}
+
+
+class Partition:
+    """Readings count plus one RunningStats per metric"""
+
+    __slots__ = ('readings', 'metrics')
+
+    def __init__(self, readings=0, metrics=None):
+        self.readings = readings
+        self.metrics = metrics or {metric: RunningStats() for metric in METRICS}
+
+    def merge(self, other):
+        self.readings += other.readings
+        for metric in METRICS:
+            self.metrics[metric].merge(other.metrics[metric])
+        return self
+
+
+def combine(partitions, key=None):
+    """Merge partitions {(sensor_id, hour): Partition} into groups.
+
+    key(sensor_id, hour) gives each partition's group (None drops it);
+    without key everything is merged into a single Partition.
+    """
+    if key is None:
+        total = Partition()
+        for partition in partitions.values():
+            total.merge(partition)
+        return total
+    groups = {}
+    for (sensor_id, hour), partition in partitions.items():
+        group = key(sensor_id, hour)
+        if group is not None:
+            groups.setdefault(group, Partition()).merge(partition)
+    return groups
+
+
+def create_tables(cursor):
+    """Create the running_stats and state tables (idempotent)"""
+    metric_columns = ''.join(f'''
+            {m}_count INTEGER NOT NULL DEFAULT 0,
+            {m}_mean REAL,
+            {m}_m2 REAL,
+            {m}_min REAL,
+            {m}_max REAL,''' for m in METRICS)
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS running_stats (
+            sensor_id TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            readings INTEGER NOT NULL DEFAULT 0,{metric_columns}
+            PRIMARY KEY (sensor_id, hour)
+        )
+    ''')
+    rollups.create_rollup_tables(cursor)
+
+
+def load(conn=None):
+    """All persisted partitions, as {(sensor_id, hour): Partition}"""
+    conn = conn or db.get_connection()
+    columns = ''.join(f', {m}_{c}' for m in METRICS for c in _STAT_COLUMNS)
+    partitions = {}
+    for row in conn.execute(f"SELECT sensor_id, hour, readings{columns} FROM running_stats"):
+        metrics = {}
+        for i, metric in enumerate(METRICS):
+            count, mean, m2, minimum, maximum = row[3 + 5 * i:8 + 5 * i]
+            metrics[metric] = RunningStats(count, mean or 0.0, m2 or 0.0, minimum, maximum)
+        partitions[(row[0], row[1])] = Partition(row[2], metrics)
+    return partitions
+
+
+def merge_into(partitions, other):
+    """Merge partitions other into partitions (in place); returns the keys touched"""
+    for key, partition in other.items():
+        if key in partitions:
+            partitions[key].merge(partition)
+        else:
+            partitions[key] = partition
+    return other.keys()
+
+
+def _reduce(keyed, keys):
+    """{group key: Partition} of a frame of float64 metrics plus key columns"""
+    grouped = keyed.groupby(keys, sort=False, observed=True)
+    stats = grouped[list(METRICS)].agg(['count', 'mean', 'min', 'max', 'var'])
+    sizes = grouped.size().reindex(stats.index).to_numpy()
+    partitions = {}
+    for key, size, row in zip(stats.index, sizes, stats.itertuples(index=False)):
+        metrics = {}
+        for i, metric in enumerate(METRICS):
+            count, mean, minimum, maximum, variance = row[5 * i:5 * i + 5]
+            count = int(count)
+            # var is the sample variance (ddof=1): M2 = var * (count - 1)
+            m2 = float(variance) * (count - 1) if count > 1 else 0.0
+            metrics[metric] = (RunningStats(count, float(mean), m2, float(minimum), float(maximum))
+                               if count else RunningStats())
+        partitions[key] = Partition(int(size), metrics)
+    return partitions
+
+
+def aggregate(frame):
+    """Partitions of a data_loader readings frame, by (sensor_id, hour of day)"""
+    import pandas as pd
+
+    ids = frame['sensor_id']
+    # NULL sensor_id (code -1) is stored as '', like the rollups do
+    names = np.append(ids.cat.categories.to_numpy(dtype=object), '')
+    ms = frame['timestamp'].to_numpy().view(np.int64)
+    hours = np.where(ms == np.iinfo(np.int64).min, NO_HOUR, (ms // 3600000) % 24)
+    keyed = pd.DataFrame({'sensor_id': names[ids.cat.codes.to_numpy()], 'hour': hours})
+    for metric in METRICS:
+        keyed[metric] = frame[metric].to_numpy(dtype=np.float64)
+    return {(sensor_id, int(hour)): partition
+            for (sensor_id, hour), partition in _reduce(keyed, ['sensor_id', 'hour']).items()}
+
+
+def aggregate_by(frame, column):
+    """Partitions of a readings frame by one column's values (NULL left out)"""
+    keyed = frame[[column, *METRICS]].astype({metric: 'float64' for metric in METRICS})
+    return _reduce(keyed, column)
+
+
+def refresh(conn=None, name=STATE_NAME, chunk_ids=CHUNK_IDS):
+    """Fold readings added since the last refresh into running_stats.
+
+    Returns the number of new sensor_data ids processed.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = db.connect()
+    try:
+        # Same locking as rollups.refresh: concurrent refreshers serialize
+        conn.execute("BEGIN IMMEDIATE")
+        create_tables(conn.cursor())
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE name = ?", (name,)).fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute("SELECT MAX(id) FROM sensor_data").fetchone()[0] or 0
+        if max_id <= last_id:
+            conn.rollback()
+            return 0
+
+        partitions = load(conn)
+        touched = set()
+        for chunk_start in range(last_id, max_id, chunk_ids):
+            chunk_end = min(chunk_start + chunk_ids, max_id)
+            frame = data_loader.load_readings(conn, chunk_start, where='id <= ?', params=(chunk_end,))
+            touched.update(merge_into(partitions, aggregate(frame)))
+
+        columns = ''.join(f', {m}_{c}' for m in METRICS for c in _STAT_COLUMNS)
+        conn.executemany(f'''
+            INSERT OR REPLACE INTO running_stats (sensor_id, hour, readings{columns})
+            VALUES ({', '.join('?' * (3 + 5 * len(METRICS)))})
+        ''', [(sensor_id, hour, partitions[(sensor_id, hour)].readings,
+               *(getattr(partitions[(sensor_id, hour)].metrics[m], c)
+                 for m in METRICS for c in _STAT_COLUMNS))
+              for sensor_id, hour in touched])
+        conn.execute("INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES (?, ?)",
+                     (name, max_id))
+        conn.commit()
+        return max_id - last_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
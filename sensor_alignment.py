@@ -0,0 +1,177 @@
+"""
+As-of alignment of co-located sensor streams
+Temperature-only and humidity-only sensors at the same place (publisher.py
+puts temp-sensor-001 and humid-sensor-001 in Paris) store NULL in the
+other column, so their readings never share a row. This module groups
+sensors by location (the reading's location, else the sensor's
+coordinates) or by zone and joins their streams as of the nearest
+timestamp:
+
+    frame = data_loader.load_data(conn)
+    combined = sensor_alignment.combined_series(frame, 'location', tolerance_s=5)
+    combined['48.8566,2.3522']      # temp-sensor-001.temperature, humid-sensor-001.humidity
+    sensor_alignment.correlations(frame)
+
+Every (sensor, metric) stream of a group is matched to the group's longest
+stream, the reference timeline: each reference reading gets the value of
+the other stream's reading nearest in time (the earlier one on a tie), or
+NaN when none is within the tolerance. The readings are sorted once by
+(group, sensor, time); each match is then a np.searchsorted of one sorted
+array into another, with no per-row Python.
+"""
+
+import numpy as np
+
+METRICS = ['temperature', 'humidity']
+
+GROUP_BY = ('location', 'zone')
+
+# publisher.py sensors report every 3 to 8 seconds
+TOLERANCE_S = 5
+
+# Group key of readings with no location / zone: left out
+_NO_GROUP = -1
+_NAT = np.iinfo(np.int64).min
+
+
+def asof_indexes(times, other_times, tolerance):
+    """Index of the other_times entry nearest to each of times, -1 beyond tolerance.
+
+    Both arrays are sorted int64 timestamps in the same unit as tolerance.
+    """
+    if not len(other_times):
+        return np.full(len(times), -1, dtype=np.int64)
+    after = np.searchsorted(other_times, times)
+    before = np.maximum(after - 1, 0)
+    after_clipped = np.minimum(after, len(other_times) - 1)
+    # Sentinel distances where there is no reading on that side
+    far = np.iinfo(np.int64).max
+    to_before = np.where(after > 0, times - other_times[before], far)
+    to_after = np.where(after < len(other_times), other_times[after_clipped] - times, far)
+    nearest = np.where(to_before <= to_after, before, after_clipped)
+    return np.where(np.minimum(to_before, to_after) <= tolerance, nearest, -1)
+
+
+def _group_codes(frame, group_by, sensor_codes):
+    """(int code of each reading's group, group names); _NO_GROUP where there is none"""
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+    if group_by == 'zone':
+        if 'zone_id' not in frame.columns:
+            return np.full(len(frame), _NO_GROUP), []
+        zones = frame['zone_id'].astype('category')
+        return zones.cat.codes.to_numpy().astype(np.int64), list(zones.cat.categories)
+
+    # Same key as the rollups: the reading's location, else the sensor's
+    # position. Positions are per sensor, so the strings are built once per
+    # sensor (formatted like the STATISTICS BY LOCATION section), not per row
+    names = {}
+    # Indexed by sensor code; the extra last entry is code -1 (NULL sensor_id)
+    by_sensor = np.full(sensor_codes.max(initial=-1) + 2, _NO_GROUP, dtype=np.int64)
+    if 'latitude' in frame.columns and 'longitude' in frame.columns:
+        # First row of each sensor: scattered backwards, the earliest write wins
+        first_rows = np.full(len(by_sensor), -1, dtype=np.int64)
+        first_rows[sensor_codes[::-1]] = np.arange(len(sensor_codes) - 1, -1, -1)
+        codes = np.flatnonzero(first_rows[:-1] >= 0)
+        first = frame.iloc[first_rows[codes]]
+        positioned = (codes >= 0) & first['latitude'].notna().to_numpy() & first['longitude'].notna().to_numpy()
+        keys = first['latitude'].astype(str) + ',' + first['longitude'].astype(str)
+        for code, key in zip(codes[positioned], keys[positioned]):
+            by_sensor[code] = names.setdefault(key, len(names))
+    groups = by_sensor[sensor_codes]
+    if 'location' in frame.columns:
+        locations = frame['location'].astype('category')
+        by_location = np.array([names.setdefault(name, len(names)) if name != '' else _NO_GROUP
+                                for name in locations.cat.categories] + [_NO_GROUP], dtype=np.int64)
+        location_groups = by_location[locations.cat.codes.to_numpy()]
+        groups = np.where(location_groups != _NO_GROUP, location_groups, groups)
+    return groups, list(names)
+
+
+def _stream_order(keys, times):
+    """Indexes sorting readings by (stream key, time)"""
+    if len(times) > 1 and not (times[1:] >= times[:-1]).all():
+        return np.lexsort((times, keys))
+    # Readings are normally stored in time order, which a stable sort by key
+    # keeps; numpy radix-sorts 16-bit keys, ~5x faster than a lexsort
+    if keys.max(initial=0) < 2 ** 16:
+        keys = keys.astype(np.uint16)
+    return np.argsort(keys, kind='stable')
+
+
+def streams(frame, group_by='location'):
+    """{group: {'sensor.metric': (sorted int64 ms timestamps, float64 values)}}
+
+    frame is a data_loader readings frame with sensor metadata attached.
+    Readings without a timestamp, sensor or group, and NULL values, are
+    left out.
+    """
+    sensors = frame['sensor_id'].astype('category')
+    sensor_codes = sensors.cat.codes.to_numpy().astype(np.int64)
+    groups, group_names = _group_codes(frame, group_by, sensor_codes)
+    times = frame['timestamp'].to_numpy().view(np.int64)
+
+    usable = (groups != _NO_GROUP) & (sensor_codes >= 0) & (times != _NAT)
+    order = np.flatnonzero(usable)
+    if not len(order):
+        # No zone_id column, no positioned sensors, or no readings at all
+        return {}
+    keys = groups[order] * (len(sensors.cat.categories) + 1) + sensor_codes[order]
+    sort = _stream_order(keys, times[order])
+    order, keys = order[sort], keys[sort]
+    bounds = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True])
+
+    result = {}
+    sorted_times = times[order]
+    values = {metric: frame[metric].to_numpy(dtype=np.float64)[order] for metric in METRICS}
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        group = group_names[groups[order[start]]]
+        sensor_id = sensors.cat.categories[sensor_codes[order[start]]]
+        for metric in METRICS:
+            stream = values[metric][start:end]
+            present = ~np.isnan(stream)
+            if present.any():
+                result.setdefault(group, {})[f'{sensor_id}.{metric}'] = (
+                    sorted_times[start:end][present], stream[present])
+    return result
+
+
+def align(group_streams, tolerance_s=TOLERANCE_S):
+    """Combined series of one group: (reference timestamps, {column: values})"""
+    reference = max(group_streams, key=lambda column: len(group_streams[column][0]))
+    times = group_streams[reference][0]
+    tolerance = int(tolerance_s * 1000)
+    columns = {}
+    for column, (stream_times, stream_values) in group_streams.items():
+        if column == reference:
+            columns[column] = stream_values
+            continue
+        index = asof_indexes(times, stream_times, tolerance)
+        columns[column] = np.where(index >= 0, stream_values[index], np.nan)
+    return times, columns
+
+
+def combined_series(frame, group_by='location', tolerance_s=TOLERANCE_S, min_streams=2):
+    """{group: DataFrame of aligned columns indexed by reference timestamp}
+
+    Groups with fewer than min_streams (sensor, metric) streams are skipped.
+    """
+    import pandas as pd
+
+    combined = {}
+    for group, group_streams in streams(frame, group_by).items():
+        if len(group_streams) < min_streams:
+            continue
+        times, columns = align(group_streams, tolerance_s)
+        combined[group] = pd.DataFrame(
+            columns, index=pd.DatetimeIndex(times.astype('datetime64[ms]'), name='timestamp'))
+    return combined
+
+
+def correlations(frame, group_by='location', tolerance_s=TOLERANCE_S):
+    """{group: (aligned rows, Pearson correlation matrix of its columns)}
+
+    Pairs use the rows where both columns have a value.
+    """
+    return {group: (len(series), series.corr())
+            for group, series in combined_series(frame, group_by, tolerance_s).items()}
@@ -0,0 +1,69 @@
+"""
+Cross-worker cache for rendered plots and hot query results
+Backed by a small SQLite file in WAL mode, so every worker process of the
+production server (and every thread inside it) sees the same entries
+without running an extra service. Values are pickled; the cache file is a
+local, trusted artefact of this application and must not be shared.
+"""
+
+import os
+import pickle
+import random
+import sqlite3
+import time
+
+import db
+
+CACHE_PATH = os.environ.get('WEATHER_CACHE_DB', 'cache.db')
+
+
+class SharedCache:
+    def __init__(self, path=CACHE_PATH, default_ttl=300, cleanup_probability=0.01):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.cleanup_probability = cleanup_probability
+        # One connection per worker thread, not per request greenlet
+        self._local = db.thread_local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL
+                )
+            ''')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires > ?",
+                (key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed: {e}")
+            return default
+        return pickle.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl))
+            if random.random() < self.cleanup_probability:
+                conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            # A cache that can't be written is just a slower cache
+            print(f"Shared cache write failed: {e}")
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
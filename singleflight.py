@@ -0,0 +1,84 @@
+"""
+Single-flight deduplication of concurrent identical computations
+When several threads ask for the same key at once, the first one runs the
+computation and the others wait for it and share its result (or its
+exception) instead of repeating it. Nothing is cached once the call
+returns: a request arriving after that starts a new computation.
+
+    charts = singleflight.Group('charts')
+    plot_urls = charts.do(key, render_charts, selection)
+
+Each group counts how many computations ran and how many callers were
+served by another caller's in-flight computation.
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Group:
+    """Coalesces concurrent calls sharing a key"""
+
+    _groups = {}
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.failed = 0
+        Group._groups[name] = self
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing an identical in-flight call"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'failed': self.failed,
+            'in_flight': len(self._calls),
+        }
+
+
+def stats():
+    """Counters of every group in this process, by group name"""
+    return {name: group.stats() for name, group in sorted(Group._groups.items())}
@@ -1,6 +1,7 @@
 import paho.mqtt.client as mqtt
 import json
 import sqlite3
+import quantile_sketch
 
 MQTT_BROKER = "broker.mqttdashboard.com"
 MQTT_SENSOR_TOPIC = "wokwi-weather"
@@ -43,12 +44,20 @@ def handle_sensor_data(data):
     conn = sqlite3.connect('database.db')
     cursor = conn.cursor()
     
-    # Insert or update sensor metadata
+    # Insert or update sensor metadata, only when it changed: every message
+    # re-sends it, and a rewrite would invalidate every cache keyed on sensors
     if latitude is not None and longitude is not None:
         cursor.execute('''
             INSERT OR REPLACE INTO sensors (sensor_id, sensor_type, latitude, longitude, description)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (sensor_id, sensor_type, latitude, longitude, description))
+            SELECT :sensor_id, :sensor_type, :latitude, :longitude, :description
+            WHERE NOT EXISTS (
+                SELECT 1 FROM sensors
+                WHERE sensor_id = :sensor_id AND sensor_type IS :sensor_type
+                  AND latitude IS :latitude AND longitude IS :longitude
+                  AND description IS :description
+            )
+        ''', {'sensor_id': sensor_id, 'sensor_type': sensor_type, 'latitude': latitude,
+              'longitude': longitude, 'description': description})
     
     # Insert sensor data with irrigation information
     if temperature is not None or humidity is not None:
@@ -121,5 +130,8 @@ if __name__ == "__main__":
     client.on_connect = on_connect
     client.on_message = on_message
 
+    # New readings are folded into the per-hour quantile sketches in batches
+    quantile_sketch.start_refresher('database.db')
+
     client.connect(MQTT_BROKER, 1883, 60)
     client.loop_forever()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+sensor_alignment checks on small hand-built frames
+Runs standalone (python test_sensor_alignment.py) or under pytest.
+"""
+
+import numpy as np
+import pandas as pd
+
+import sensor_alignment
+
+
+def readings(sensor_ids, temperatures, humidities, seconds, **columns):
+    """Frame shaped like data_loader.load_data's"""
+    frame = pd.DataFrame({
+        'sensor_id': pd.Categorical(sensor_ids),
+        'temperature': np.array(temperatures, dtype=np.float32),
+        'humidity': np.array(humidities, dtype=np.float32),
+        'timestamp': pd.to_datetime(np.array(seconds) * 1000, unit='ms'),
+    })
+    for name, values in columns.items():
+        frame[name] = values
+    return frame
+
+
+def test_pairs_co_located_sensors():
+    frame = readings(['temp', 'humid', 'temp', 'humid'], [20, np.nan, 21, np.nan],
+                     [np.nan, 50, np.nan, 52], [0, 2, 10, 11],
+                     latitude=[48.8566] * 4, longitude=[2.3522] * 4)
+    combined = sensor_alignment.combined_series(frame, 'location')
+    assert list(combined) == ['48.8566,2.3522']
+    series = combined['48.8566,2.3522']
+    assert series['humid.humidity'].tolist() == [50.0, 52.0]
+
+
+def test_no_usable_group():
+    frame = readings(['temp', 'humid'], [20, np.nan], [np.nan, 50], [0, 2])
+    # No zone_id column, no positions, and an empty frame
+    assert sensor_alignment.streams(frame, 'zone') == {}
+    assert sensor_alignment.streams(frame, 'location') == {}
+    assert sensor_alignment.streams(frame.iloc[:0], 'location') == {}
+    assert sensor_alignment.correlations(frame, 'zone') == {}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✅ {name}")